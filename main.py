@@ -1,12 +1,15 @@
+import contextlib
+import importlib
+import os
+import sys
 import click
-from modules import rules_break_down
-from modules import convert_pmuser
-from modules import rules_parameterization
-from modules import property_parameterization
-from modules import vars_to_tfvars
-from modules import generate_main_tf
-from modules import restructure_project
-from modules import convert_imports_tf
+
+# The modules package is imported inside the commands, and each stage module only when
+# its stage runs, so --help and argument errors don't pay for the whole pipeline
+
+
+def load_stage(name):
+    return importlib.import_module(f"modules.{name}")
 
 @click.group()
 def cli():
@@ -14,20 +17,210 @@ def cli():
     pass
 
 @cli.command()
-@click.option('--input-dir', '-i', type=click.Path(exists=True), help="Directory to read the input files.", required=True)
+@click.option('--input-dir', '-i', type=click.Path(exists=True), help="Directory or .tar.gz/.zip archive to read the input files. A directory of archives is processed in batch mode.", required=True)
 @click.option('--depth', '-d', default=1, help='Maximum depth of rule hierarchy to split into separate files. Default is 1.')
 @click.option('--output-dir', '-o', default='.', help='Directory to write output files. Default is current directory.')
-def optimize(input_dir, depth, output_dir):
-    vars_to_tfvars.filter_vars(input_dir, output_dir)
-    convert_pmuser.pmuser_to_dynamic(input_dir, output_dir)
-    rules_parameterization.rule_tree_parameterization(output_dir)
-    rules_break_down.split_terraform_file(output_dir, depth)
-    property_parameterization.parameterize_property_resources(input_dir, output_dir)
-    generate_main_tf.main_tf(output_dir)
-    convert_imports_tf.convert_imports(input_dir, output_dir)
-    restructure_project.restructure_and_cleanup(output_dir)
-    
-    click.echo(f"Processing complete")
+@click.option('--output-archive', type=click.Path(dir_okay=False), help='Write the result to a .tar.gz, .tgz, .tar or .zip archive instead of the output directory.')
+@click.option('--object-store', 'object_store_dir', type=click.Path(file_okay=False), help='Store every generated file once in this content-addressed directory and link it into the output, with a manifest per run.')
+@click.option('--link-mode', type=click.Choice(['hardlink', 'symlink']), default='hardlink', help='How --object-store files are linked into the output. Default is hardlink.')
+@click.option('--environments', '-e', 'environments_file', type=click.Path(exists=True, dir_okay=False), help='YAML or JSON file with per-environment overrides. Default is a single prod environment.')
+@click.option('--aggregate', is_flag=True, help='In batch mode, write a single root per environment that instantiates the property modules with for_each over all exports.')
+@click.option('--shared-tfvars', is_flag=True, help='Move variables with the same value in every environment to common.auto.tfvars and keep only the differences in terraform.tfvars.')
+@click.option('--tfvars-format', type=click.Choice(['hcl', 'json']), default='hcl', help='Write terraform.tfvars (hcl) or terraform.tfvars.json (json). Default is hcl.')
+@click.option('--variables-json', is_flag=True, help='Write variables.tf.json instead of variables.tf.')
+@click.option('--rules-json', is_flag=True, help='Write the rule files of the property module in Terraform JSON syntax (.tf.json).')
+@click.option('--shard-pmuser', is_flag=True, help='Split PMUSER variables by name prefix into pmuser_variables_<prefix>.auto.tfvars files, with sensitive variables in their own map.')
+@click.option('--pmuser-groups', 'pmuser_groups_file', type=click.Path(exists=True, dir_okay=False), help='YAML or JSON file mapping PMUSER shard names to variable name patterns. Implies --shard-pmuser.')
+@click.option('--parameterize', 'parameterize_paths', multiple=True, metavar='BEHAVIOR.OPTION', help='Also parameterize this behavior option, e.g. origin.http_port. Can be repeated.')
+@click.option('--parameterize-where', 'criteria_filter_values', multiple=True, metavar='CRITERION[.OPTION]=PATTERN', help='Only parameterize rules (and their child rules) with a matching criterion, e.g. hostname=*.example.com. Can be repeated, any match selects a rule.')
+@click.option('--hostname-buckets', 'hostname_bucket_threshold', type=click.IntRange(min=0), default=0, metavar='THRESHOLD', help='Move the hostnames of properties with more than THRESHOLD hostnames to akamai_property_hostname_bucket resources. Default is 0 (never).')
+@click.option('--tfvars-bucket-size', type=click.IntRange(min=1), default=500, help='Average number of hostnames per entry of the property_hostname_buckets map in terraform.tfvars. Only changes how the hostnames are laid out in terraform.tfvars, each network still has one hostname bucket resource. Default is 500.')
+@click.option('--import-for-each', is_flag=True, help='Group the imports of keyed resources into for_each import blocks driven by a local map (Terraform 1.7+).')
+@click.option('--dedup-values', is_flag=True, help='Use a single variable for rule tree values that are repeated across rules.')
+@click.option('--snapshot', 'use_snapshot', is_flag=True, help='Save the parsed export next to it and reuse it on later runs, so re-running with other options skips parsing.')
+@click.option('--dry-run', is_flag=True, help='Run the whole pipeline in memory without writing to the output directory.')
+@click.option('--diff', 'show_diff', is_flag=True, help='Print the changes against the existing output directory.')
+@click.option('--diff-format', type=click.Choice(['unified', 'json']), default='unified', help='Format of --diff: a unified diff or a JSON change summary. Default is unified.')
+@click.option('--profile', is_flag=True, help='Print the time spent in each stage, the characters each stage scanned and the regex compile statistics.')
+def optimize(input_dir, depth, output_dir, output_archive, object_store_dir, link_mode, environments_file, aggregate, shared_tfvars, tfvars_format, variables_json, rules_json, shard_pmuser, pmuser_groups_file, parameterize_paths, criteria_filter_values, hostname_bucket_threshold, tfvars_bucket_size, import_for_each, dedup_values, use_snapshot, dry_run, show_diff, diff_format, profile):
+    # The regex calls are only counted for --profile, and the patterns are compiled on import
+    from modules import patterns
+    if profile:
+        patterns.registry.enable_counting()
+
+    from modules import environments as environments_config
+    from modules import export_reader
+    from modules import output_writer
+    from modules import profiling
+    from modules import tfvars
+
+    environments = None
+    if environments_file:
+        try:
+            environments = environments_config.load_environments(environments_file)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--environments")
+
+    for path in parameterize_paths:
+        if len(path.split(".")) < 2 or not all(path.split(".")):
+            raise click.BadParameter(f"{path} is not a behavior option path like origin.http_port", param_hint="--parameterize")
+
+    from modules import rules_parameterization
+    try:
+        criteria_filters = [rules_parameterization.parse_criteria_filter(value) for value in criteria_filter_values]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--parameterize-where")
+
+    pmuser_shards = "prefix" if shard_pmuser else None
+    if pmuser_groups_file:
+        from modules import convert_pmuser
+        try:
+            pmuser_shards = convert_pmuser.load_pmuser_groups(pmuser_groups_file)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--pmuser-groups")
+
+    if object_store_dir and output_archive:
+        raise click.BadParameter("--object-store links files into the output directory and cannot be combined with --output-archive", param_hint="--object-store")
+
+    object_store = None
+    if object_store_dir:
+        from modules import object_store as object_store_module
+        object_store = object_store_module.open_object_store(object_store_dir, link_mode)
+
+    if show_diff and output_archive:
+        raise click.BadParameter("--diff compares against the output directory and cannot be combined with --output-archive", param_hint="--diff")
+
+    # In batch mode every archive gets its own output folder (or archive) named after it
+    sources = export_reader.find_exports(input_dir)
+    batch = sources != [input_dir]
+    if batch and not aggregate and output_archive and output_archive.endswith(export_reader.ARCHIVE_EXTENSIONS):
+        raise click.BadParameter("In batch mode --output-archive is the directory to write one archive per export to", param_hint="--output-archive")
+    if aggregate and not batch:
+        raise click.BadParameter("--aggregate needs a directory of export archives (batch mode)", param_hint="--aggregate")
+
+    # Keep stdout for the diff so it can be consumed by other tools
+    progress = contextlib.redirect_stdout(sys.stderr) if show_diff else contextlib.nullcontext()
+    profiler = profiling.TerraformProfiler()
+
+    def write_output(writer, output_archive_path):
+        if show_diff:
+            click.echo(writer.diff(diff_format), nl=False)
+
+        with progress:
+            if dry_run:
+                print(f"Dry run, nothing written to {output_archive_path or writer.output_dir}")
+            elif output_archive_path:
+                try:
+                    with profiler.stage("commit"):
+                        writer.commit_archive(output_archive_path)
+                except ValueError as e:
+                    raise click.BadParameter(str(e), param_hint="--output-archive")
+            else:
+                with profiler.stage("commit"):
+                    writer.commit()
+
+    aggregated_properties = []  # (name, export, writer) of every export, for --aggregate
+    for source in sources:
+        with progress:
+            try:
+                export = export_reader.open_export(source)
+            except ValueError as e:
+                raise click.BadParameter(str(e), param_hint="--input-dir")
+
+        export_output_dir = os.path.join(output_dir, export.name) if batch else output_dir
+        export_output_archive = output_archive
+        if batch and output_archive:
+            extension = ".zip" if source.endswith(".zip") else ".tar.gz"
+            export_output_archive = os.path.join(output_archive, export.name + extension)
+
+        # Stage the whole result tree in memory and write it out once at the end
+        writer = output_writer.TerraformOutputWriter(export_output_dir, object_store=object_store)
+
+        snapshot = None
+        if use_snapshot:
+            with progress, profiler.stage("snapshot"):
+                snapshot = load_stage("snapshot").open_snapshot(export)
+
+        with progress:
+            if batch:
+                print(f"Optimizing {source}")
+            # Stage module name and how to run it, in pipeline order
+            stages = [
+                ("vars_to_tfvars", lambda stage: stage.filter_vars(export, writer)),
+                ("convert_pmuser", lambda stage: stage.pmuser_to_dynamic(export, writer, pmuser_shards, snapshot)),
+                ("rules_parameterization", lambda stage: stage.rule_tree_parameterization(writer, dedup_values, parameterize_paths, criteria_filters)),
+                ("rules_break_down", lambda stage: stage.split_terraform_file(writer, depth, snapshot)),
+                ("property_parameterization", lambda stage: stage.parameterize_property_resources(export, writer, hostname_bucket_threshold, tfvars_bucket_size, snapshot)),
+                ("generate_main_tf", lambda stage: stage.main_tf(writer)),
+                ("convert_imports_tf", lambda stage: stage.convert_imports(export, writer, import_for_each)),
+                ("restructure_project", lambda stage: stage.restructure_and_cleanup(writer, environments, shared_tfvars, tfvars_format)),
+            ]
+            # The aggregated root is built from the HCL files, so they are converted afterwards
+            if (variables_json or rules_json) and not aggregate:
+                stages.append(("tf_json", lambda stage: stage.emit_tf_json(writer, variables_json, rules_json)))
+            stages.append(("hcl_format", lambda stage: stage.format_output(writer)))
+            try:
+                for name, run_stage in stages:
+                    with profiler.stage(name):
+                        run_stage(load_stage(name))
+            except tfvars.TfvarsJsonError as e:
+                raise click.ClickException(str(e))
+            # A dry run writes nothing, the export directory included
+            if snapshot and not dry_run:
+                with profiler.stage("snapshot"):
+                    snapshot.save()
+
+        if aggregate:
+            aggregated_properties.append((export.name, export, writer))
+        else:
+            write_output(writer, export_output_archive)
+
+    if aggregate:
+        writer = output_writer.TerraformOutputWriter(output_dir, object_store=object_store)
+        with progress:
+            try:
+                with profiler.stage("aggregate_project"):
+                    load_stage("aggregate_project").aggregate_properties(writer, aggregated_properties, environments, shared_tfvars, import_for_each, tfvars_format)
+            except tfvars.TfvarsJsonError as e:
+                raise click.ClickException(str(e))
+            if variables_json or rules_json:
+                with profiler.stage("tf_json"):
+                    load_stage("tf_json").emit_tf_json(writer, variables_json, rules_json)
+            with profiler.stage("hcl_format"):
+                load_stage("hcl_format").format_output(writer)
+        write_output(writer, output_archive)
+
+    with progress:
+        if object_store and object_store.manifest:
+            object_store.write_manifest()
+        if profile:
+            print(profiler.report())
+        print("Processing complete")
+
+@cli.command('derive-params')
+@click.option('--input-dir', '-i', 'inputs', multiple=True, required=True, metavar='[ENV=]PATH', help='Export directory or archive of one environment, e.g. dev=exports/dev. Give two or more, the first one is the base for optimize.')
+@click.option('--output-file', '-o', type=click.Path(dir_okay=False), help='Write the per-environment values to this YAML or JSON file, for optimize --environments.')
+def derive_params(inputs, output_file):
+    """Compare exports of several environments and derive the values to parameterize"""
+    from modules import derive_params as derive
+
+    if len(inputs) < 2:
+        raise click.BadParameter("Give at least two exports to compare", param_hint="--input-dir")
+    try:
+        derive.derive_params(inputs, output_file)
+    except (OSError, ValueError) as e:
+        raise click.ClickException(str(e))
+
+@cli.command()
+@click.option('--input-dir', '-i', type=click.Path(exists=True), help="Directory or archive with the original export.", required=True)
+@click.option('--output-dir', '-o', type=click.Path(exists=True), help="Directory with the optimized project.", required=True)
+@click.option('--environment', default='prod', help='Environment whose variables are used to resolve the rule tree. Default is prod.')
+def verify(input_dir, output_dir, environment):
+    """Check offline that the optimized project produces the exported rule tree"""
+    from modules import verify_output
+
+    if not verify_output.verify_output(input_dir, output_dir, environment):
+        raise click.ClickException("Verification failed")
 
 if __name__ == '__main__':
     cli()
\ No newline at end of file
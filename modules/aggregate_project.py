@@ -0,0 +1,359 @@
+import hashlib
+import os
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from modules import patterns
+from modules.convert_imports_tf import ImportCommand, KEYED_RESOURCES, TerraformImportConverter
+from modules.environments import TerraformEnvironments, split_shared_tfvars
+from modules.export_reader import TerraformExportReader
+from modules.hcl_parser import HclParseError, HclUnresolved, evaluate, parse_hcl
+from modules.output_writer import TerraformOutputWriter
+from modules.tfvars import HclObject, TerraformTfvars, quote_string, render_value, tfvars_file_name
+
+_PROPERTY_RESOURCE_PATTERN = patterns.fixed(r'resource\s+"akamai_property"\s+"([^"]+)"')
+_VARIABLE_HEADER_PATTERN = patterns.fixed(r'variable\s+"([^"]+)"\s*{')
+_DEFAULT_LINE_PATTERN = patterns.fixed(r'\s*default\s*=')
+_ATTRIBUTE_LINE_PATTERN = patterns.fixed(r'^  ([\w-]+)\s+= ', re.MULTILINE)
+_VAR_REFERENCE_PATTERN = patterns.fixed(r'\bvar\.([\w-]+)')
+_NON_IDENTIFIER_PATTERN = patterns.fixed(r'[^A-Za-z0-9_]+')
+
+# Resources named after the property in the export, and renamed so properties can share a module
+PROPERTY_RESOURCE_TYPES = ("akamai_property", "akamai_property_activation", "akamai_property_rules_builder")
+PROPERTY_LABEL = "property"
+
+
+class AggregatedProperty(NamedTuple):
+    name: str  # Key of the property in the module for_each map
+    writer: TerraformOutputWriter  # Optimized project of the property
+    label: str  # Resource name of the property in its export
+    imports: List[ImportCommand]
+
+
+class TerraformFleetAggregator:
+    """
+    Combine the optimized projects of a batch into a single root per environment. Properties
+    whose modules are identical once their resources are renamed share one module, which the
+    root instantiates with for_each over a map of per-property inputs. Provider initialization
+    and planning are then paid once per environment instead of once per property.
+    """
+
+    def __init__(self, writer: TerraformOutputWriter, environments: TerraformEnvironments = None,
+                 shared_tfvars: bool = False, import_for_each: bool = False, tfvars_format: str = "hcl"):
+        self.writer = writer
+        self.environments = environments if environments else TerraformEnvironments()
+        self.shared_tfvars = shared_tfvars
+        self.tfvars_format = tfvars_format
+        self.shared_tfvars_file = "common.auto.tfvars"
+        self.import_for_each = import_for_each
+        self.properties: List[AggregatedProperty] = []
+        self.source_modules_dir = os.path.join("modules", "property")
+        self.environments_root = "environments"
+
+    def _module_files(self, writer: TerraformOutputWriter) -> Dict[str, str]:
+        prefix = self.source_modules_dir + os.sep
+        return {key[len(prefix):]: content for key, content in writer.files.items() if key.startswith(prefix)}
+
+    def add(self, name: str, export: TerraformExportReader, writer: TerraformOutputWriter) -> None:
+        """Add the optimized project of an export, reading its import commands in one pass."""
+        property_tf = self._module_files(writer).get("property.tf", "")
+        match = _PROPERTY_RESOURCE_PATTERN.search(property_tf)
+        if not match:
+            print(f"Warning: No akamai_property resource in {name}, leaving it out of the aggregated root")
+            return
+
+        imports = []
+        if export.exists("import.sh"):
+            converter = TerraformImportConverter()
+            imports = converter.keyed_commands(converter.iter_import_commands(export.read("import.sh")), writer.resource_keys)
+            imports = list(converter.bucket_commands(imports, "property_hostname_buckets" in writer.tfvars))
+        self.properties.append(AggregatedProperty(name, writer, match.group(1), imports))
+
+    def _rename_pattern(self, label: str):
+        """Match the property label in the labels and references of the property resources."""
+        types = "|".join(PROPERTY_RESOURCE_TYPES)
+        return patterns.cached(rf'((?:(?:resource|data)\s+"(?:{types})"\s+"|\b(?:{types})\.)){re.escape(label)}(?=[-_".\s])')
+
+    def _rename(self, content: str, label: str) -> str:
+        return self._rename_pattern(label).sub(rf'\g<1>{PROPERTY_LABEL}', content)
+
+    @staticmethod
+    def _variable_blocks(content: str) -> Dict[str, str]:
+        """
+        Split a generated variables.tf into its variable blocks, by name. Comment lines
+        are kept with the block that follows them.
+        """
+        blocks = {}
+        pending = []
+        name = None
+        for line in content.splitlines(keepends=True):
+            if name is None:
+                match = _VARIABLE_HEADER_PATTERN.match(line)
+                if match:
+                    name = match.group(1)
+                elif line.strip():
+                    pending.append(line)
+                    continue
+                else:
+                    continue
+            pending.append(line)
+            if line.rstrip() == "}":
+                blocks[name] = "".join(pending)
+                pending = []
+                name = None
+        return blocks
+
+    @staticmethod
+    def _strip_default(block: str) -> str:
+        stripped = "".join(line for line in block.splitlines(keepends=True) if not _DEFAULT_LINE_PATTERN.match(line))
+        # A lone type attribute is no longer aligned with the default
+        if stripped != block and len(_ATTRIBUTE_LINE_PATTERN.findall(stripped)) == 1:
+            stripped = _ATTRIBUTE_LINE_PATTERN.sub(r'  \g<1> = ', stripped)
+        return stripped
+
+    def _module_inputs(self, module_files: Dict[str, str]) -> List[str]:
+        """Return the variables the module resources reference, in variables.tf order."""
+        referenced = set()
+        for file_name, content in module_files.items():
+            if file_name != "variables.tf":
+                referenced.update(_VAR_REFERENCE_PATTERN.findall(content))
+        return [name for name in self._variable_blocks(module_files.get("variables.tf", "")) if name in referenced]
+
+    def shared_module(self, prop: AggregatedProperty) -> Dict[str, str]:
+        """
+        Render the module of a property with the property resources renamed and without the
+        defaults of its inputs, which are passed explicitly. Unused variables are dropped.
+        """
+        module_files = {file_name: self._rename(content, prop.label) for file_name, content in self._module_files(prop.writer).items()}
+        inputs = self._module_inputs(module_files)
+        blocks = self._variable_blocks(module_files.get("variables.tf", ""))
+        module_files["variables.tf"] = "\n".join(self._strip_default(blocks[name]) for name in inputs)
+        return module_files
+
+    @staticmethod
+    def _module_hash(module_files: Dict[str, str]) -> str:
+        digest = hashlib.sha256()
+        for file_name in sorted(module_files):
+            digest.update(file_name.encode("utf-8") + b"\0" + module_files[file_name].encode("utf-8") + b"\0")
+        return digest.hexdigest()
+
+    def group_properties(self) -> List[Tuple[str, Dict[str, str], List[AggregatedProperty]]]:
+        """
+        Group the properties by their shared module. Returns (module name, module files,
+        properties) per group, named after the first property unless there is a single group.
+        """
+        groups: Dict[str, Tuple[Dict[str, str], List[AggregatedProperty]]] = {}
+        for prop in self.properties:
+            module_files = self.shared_module(prop)
+            groups.setdefault(self._module_hash(module_files), (module_files, []))[1].append(prop)
+
+        result = []
+        for module_files, props in groups.values():
+            module_name = PROPERTY_LABEL if len(groups) == 1 else _NON_IDENTIFIER_PATTERN.sub("_", props[0].name).strip("_").lower()
+            result.append((module_name, module_files, props))
+        return result
+
+    @staticmethod
+    def _format_type(source: str, indent: int) -> str:
+        """Re-indent a multi-line type expression by its nesting depth."""
+        lines = []
+        depth = 0
+        for line in source.splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            if line[0] in ")}]":
+                depth = max(depth - 1, 0)
+            lines.append(" " * (indent + depth * 2) + line if lines else line)
+            if line[-1] in "({[":
+                depth += 1
+        return "\n".join(lines)
+
+    def _input_types_and_defaults(self, prop: AggregatedProperty) -> Tuple[Dict[str, str], Dict[str, Any]]:
+        """Read the type of every variable of a property and its exported default, if any."""
+        types = {}
+        defaults = {}
+        variables_tf = self._module_files(prop.writer).get("variables.tf", "")
+        try:
+            root = parse_hcl(variables_tf)
+        except HclParseError as e:
+            print(f"Warning: Could not parse the variables of {prop.name}: {e}")
+            return types, defaults
+        for block in root.find_blocks("variable"):
+            if not block.labels:
+                continue
+            name = block.labels[0]
+            types[name] = block.attributes["type"].source if "type" in block.attributes else "any"
+            if "default" in block.attributes:
+                try:
+                    defaults[name] = evaluate(block.attributes["default"])
+                except HclUnresolved:
+                    continue
+        return types, defaults
+
+    def render_main_tf(self, groups) -> str:
+        module_blocks = []
+        for module_name, module_files, props in groups:
+            inputs = self._module_inputs(module_files)
+            module_block = f'module "{module_name}" {{\n'
+            module_block += f'  for_each = var.{module_name}_inputs\n'
+            module_block += f'  source   = "../../modules/{module_name}"\n\n'
+            width = max((len(var_name) for var_name in inputs), default=0)
+            for var_name in inputs:
+                module_block += f'  {var_name.ljust(width)} = each.value.{var_name}\n'
+            module_block += '}\n'
+            module_blocks.append(module_block)
+        return "\n".join(module_blocks)
+
+    def render_variables_tf(self, groups) -> str:
+        """
+        Declare one map of per-property inputs per module, plus the root variables of the
+        first property that the modules don't use (the provider settings).
+        """
+        first = self.properties[0]
+        first_module_inputs = set(self._module_inputs(self.shared_module(first)))
+        root_variables = self._variable_blocks(self._module_files(first.writer).get("variables.tf", ""))
+        blocks = [block for name, block in root_variables.items() if name not in first_module_inputs]
+
+        for module_name, module_files, props in groups:
+            types, _ = self._input_types_and_defaults(props[0])
+            block = f'variable "{module_name}_inputs" {{\n'
+            block += f'  description = "Inputs of the {module_name} module, by property"\n'
+            block += '  type = map(object({\n'
+            for var_name in self._module_inputs(module_files):
+                block += f'    {var_name} = {self._format_type(types.get(var_name, "any"), 4)}\n'
+            block += '  }))\n'
+            block += '}\n'
+            blocks.append(block)
+        return "\n".join(blocks)
+
+    def render_tfvars(self, env_name: str, groups) -> TerraformTfvars:
+        tfvars = TerraformTfvars()
+        for module_name, module_files, props in groups:
+            inputs = self._module_inputs(module_files)
+            property_inputs = {}
+            for prop in props:
+                _, defaults = self._input_types_and_defaults(prop)
+                env_tfvars = self.environments.render_tfvars(env_name, prop.writer.tfvars)
+                values = HclObject()
+                for var_name in inputs:
+                    if var_name in env_tfvars:
+                        values[var_name] = env_tfvars.get(var_name)
+                    elif var_name in defaults:
+                        values[var_name] = defaults[var_name]
+                    else:
+                        print(f"Warning: No value for {var_name} of {prop.name}, setting it to null")
+                        values[var_name] = None
+                property_inputs[prop.name] = values
+            tfvars.set(f"{module_name}_inputs", property_inputs, comment=f"Inputs of the {module_name} module, by property")
+        return tfvars
+
+    def _import_target(self, prop: AggregatedProperty, command: ImportCommand) -> Tuple[str, Optional[str]]:
+        """Return the target resource address of an import and the key of keyed resources."""
+        if command.resource_type in KEYED_RESOURCES:
+            return f'{command.resource_type}.{KEYED_RESOURCES[command.resource_type]}', command.resource_name
+        resource_name = command.resource_name
+        if command.resource_type in PROPERTY_RESOURCE_TYPES and resource_name.startswith(prop.label):
+            resource_name = PROPERTY_LABEL + resource_name[len(prop.label):]
+        return f'{command.resource_type}.{resource_name}', None
+
+    def render_import_tf(self, groups) -> Optional[str]:
+        """
+        Merge the imports of every property. With import_for_each the imports are grouped
+        by target resource into a local map with one for_each import block each.
+        """
+        import_blocks = []
+        grouped: Dict[Tuple[str, str], Dict[str, Any]] = {}  # (module, resource address) -> map key -> import
+        for module_name, _, props in groups:
+            for prop in props:
+                for command in prop.imports:
+                    address, key = self._import_target(prop, command)
+                    if not self.import_for_each:
+                        to_value = f'module.{module_name}[{quote_string(prop.name)}].{address}'
+                        if key is not None:
+                            to_value += f'[{quote_string(key)}]'
+                        import_blocks.append(TerraformImportConverter.import_block(to_value, quote_string(command.resource_id)))
+                    elif key is not None:
+                        grouped.setdefault((module_name, address), {})[f"{prop.name}/{key}"] = HclObject(
+                            property=prop.name, key=key, id=command.resource_id,
+                        )
+                    else:
+                        grouped.setdefault((module_name, address), {})[prop.name] = command.resource_id
+
+        if grouped:
+            local_names = {}
+            locals_block = 'locals {\n'
+            for (module_name, address), imports in grouped.items():
+                local_name = _NON_IDENTIFIER_PATTERN.sub("_", f"{module_name}_{address}_imports").lower()
+                local_names[(module_name, address)] = local_name
+                locals_block += f'  {local_name} = {render_value(imports, 2)}\n'
+            locals_block += '}\n'
+            import_blocks.append(locals_block)
+
+            for (module_name, address), imports in grouped.items():
+                keyed = isinstance(next(iter(imports.values())), dict)
+                if keyed:
+                    to_value = f'module.{module_name}[each.value.property].{address}[each.value.key]'
+                    id_value = 'each.value.id'
+                else:
+                    to_value = f'module.{module_name}[each.key].{address}'
+                    id_value = 'each.value'
+                import_blocks.append(TerraformImportConverter.import_block(to_value, id_value, for_each=f'local.{local_names[(module_name, address)]}'))
+
+        return "\n".join(import_blocks) if import_blocks else None
+
+    def aggregate(self) -> None:
+        """Stage the shared modules and one root per environment in the writer."""
+        if not self.properties:
+            print("No properties to aggregate")
+            return
+
+        # The module files and the provider settings come from the formatted output of the
+        # properties, and the other files are emitted aligned, except variables.tf
+        groups = self.group_properties()
+        for module_name, module_files, props in groups:
+            for file_name, content in module_files.items():
+                self.writer.write(os.path.join("modules", module_name, file_name), content, formatted=True)
+            print(f"Staged modules/{module_name} for {len(props)} properties")
+
+        first = self.properties[0].writer
+        main_tf = self.render_main_tf(groups)
+        variables_tf = self.render_variables_tf(groups)
+        import_tf = self.render_import_tf(groups)
+
+        env_tfvars = {env_name: self.render_tfvars(env_name, groups) for env_name in self.environments.names()}
+        shared_content = None
+        if self.shared_tfvars and len(env_tfvars) > 1:
+            shared, env_tfvars = split_shared_tfvars(env_tfvars)
+            shared_content = shared.render_json() if self.tfvars_format == "json" else shared.render()
+        elif self.shared_tfvars:
+            print("Shared variables need more than one environment. Skipping.")
+
+        for env_name in self.environments.names():
+            env_dir = os.path.join(self.environments_root, env_name)
+            for file_name in ("provider.tf", "versions.tf"):
+                source_path = os.path.join(env_dir, file_name)
+                if first.exists(source_path):
+                    self.writer.write(source_path, first.read(source_path), formatted=True)
+            self.writer.write(os.path.join(env_dir, "main.tf"), main_tf, formatted=True)
+            self.writer.write(os.path.join(env_dir, "variables.tf"), variables_tf)
+            tfvars = env_tfvars[env_name]
+            self.writer.write(os.path.join(env_dir, tfvars_file_name("terraform.tfvars", self.tfvars_format)),
+                              tfvars.render_json() if self.tfvars_format == "json" else tfvars.render(), formatted=True)
+            if shared_content is not None:
+                self.writer.write(os.path.join(env_dir, tfvars_file_name(self.shared_tfvars_file, self.tfvars_format)), shared_content, formatted=True)
+            if import_tf and self.environments.includes_imports(env_name):
+                self.writer.write(os.path.join(env_dir, "import.tf"), import_tf, formatted=True)
+            print(f"Staged the aggregated root {env_dir} with {len(self.properties)} properties")
+
+
+def aggregate_properties(writer: TerraformOutputWriter, properties: List[Tuple[str, TerraformExportReader, TerraformOutputWriter]],
+                         environments: TerraformEnvironments = None, shared_tfvars: bool = False, import_for_each: bool = False,
+                         tfvars_format: str = "hcl") -> None:
+    """
+    Stage one root per environment for the optimized projects of a batch, given as
+    (name, export, writer) tuples.
+    """
+    aggregator = TerraformFleetAggregator(writer, environments, shared_tfvars, import_for_each, tfvars_format)
+    for name, export, property_writer in properties:
+        aggregator.add(name, export, property_writer)
+    aggregator.aggregate()
@@ -0,0 +1,62 @@
+import glob
+import json
+import os
+from typing import Dict, Optional, Tuple
+
+SCHEMAS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "schemas")
+
+
+class TerraformBehaviorSchema:
+    """
+    Option types of the rule tree behaviors for one rule format, indexed by path, e.g.
+    ("cp_code", "value", "id") -> "number". Types are Terraform type expressions.
+    """
+
+    def __init__(self, rule_format: str, behaviors: Dict[str, dict] = None):
+        self.rule_format = rule_format
+        self.behaviors = set(behaviors or {})
+        self.types: Dict[Tuple[str, ...], str] = {}
+        for behavior_name, options in (behaviors or {}).items():
+            self._index(options, (behavior_name,))
+
+    def _index(self, options: dict, path: Tuple[str, ...]) -> None:
+        for option_name, option_type in options.items():
+            if isinstance(option_type, dict):
+                self._index(option_type, path + (option_name,))
+            else:
+                self.types[path + (option_name,)] = option_type
+
+    def type_of(self, path) -> Optional[str]:
+        return self.types.get(tuple(path))
+
+
+_SCHEMA_CACHE: Dict[str, TerraformBehaviorSchema] = {}  # Rule format -> schema, shared by all exports of a run
+
+
+def bundled_formats() -> list:
+    """Return the rule formats with a bundled schema, oldest first."""
+    return sorted(os.path.basename(path)[:-5] for path in glob.glob(os.path.join(SCHEMAS_DIR, "rules_v*.json")))
+
+
+def load_behavior_schema(rule_format: str) -> TerraformBehaviorSchema:
+    """
+    Load the behavior schema for a rule format (e.g. rules_v2025_01_13) from the bundled JSON files.
+    Formats without a bundled schema use the newest bundled one that is not newer than them,
+    or the oldest one. The schema is parsed once per format and cached.
+    """
+    if rule_format in _SCHEMA_CACHE:
+        return _SCHEMA_CACHE[rule_format]
+
+    formats = bundled_formats()
+    if not formats:
+        schema = TerraformBehaviorSchema(rule_format)
+    else:
+        candidates = [bundled for bundled in formats if bundled <= rule_format]
+        bundled_format = candidates[-1] if candidates else formats[0]
+        if bundled_format != rule_format:
+            print(f"No behavior schema bundled for {rule_format}, using {bundled_format}")
+        with open(os.path.join(SCHEMAS_DIR, f"{bundled_format}.json"), 'r') as f:
+            schema = TerraformBehaviorSchema(rule_format, json.load(f).get("behaviors", {}))
+
+    _SCHEMA_CACHE[rule_format] = schema
+    return schema
@@ -0,0 +1,31 @@
+import json
+from typing import Any
+
+
+def read_config_file(config_file: str) -> Any:
+    """
+    Read a YAML or JSON configuration file. Files ending in .json are read as JSON,
+    anything else as YAML, which needs PyYAML. Raises ValueError if it is missing.
+    """
+    with open(config_file, 'r') as f:
+        if config_file.endswith(".json"):
+            return json.load(f)
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"Reading YAML files like {config_file} requires PyYAML (pip install pyyaml). Use a .json file instead.")
+        return yaml.safe_load(f)
+
+
+def write_config_file(config_file: str, data: Any) -> None:
+    """Write a configuration file in the format read_config_file picks for its name."""
+    if config_file.endswith(".json"):
+        content = json.dumps(data, indent=2) + "\n"
+    else:
+        try:
+            import yaml
+        except ImportError:
+            raise ValueError(f"Writing YAML files like {config_file} requires PyYAML (pip install pyyaml). Use a .json file instead.")
+        content = yaml.safe_dump(data, sort_keys=False, default_flow_style=False)
+    with open(config_file, 'w') as f:
+        f.write(content)
@@ -1,69 +1,194 @@
-import os
-import re
-from typing import Dict, List, Tuple
+import shlex
+from typing import Dict, Iterator, NamedTuple, Optional
+from modules import patterns
+from modules.export_reader import TerraformExportReader, open_export
+from modules.output_writer import TerraformOutputWriter
+from modules.tfvars import quote_string, render_value
+
+_IMPORT_ADDRESS_PATTERN = patterns.fixed(r'(?:module\.[\w-]+(?:\[[^\]]*\])?\.)*([\w-]+)\.([\w.-]+?)(?:\["?([^"\]]*)"?\])?')
+
+MODULE_ADDRESS = "module.akamai_property"
+# Module resources created with for_each, by resource type -> resource name of the module
+KEYED_RESOURCES = {"akamai_edge_hostname": "edge_hostnames", "akamai_property_hostname_bucket": "hostname_buckets"}
+NETWORKS = ("STAGING", "PRODUCTION")
+
+
+class ImportCommand(NamedTuple):
+    resource_type: str
+    resource_name: str
+    resource_id: str
+
 
 class TerraformImportConverter:
-    def __init__(self, import_sh_file: str = "import.sh", import_tf_file: str = "import.tf"):
+    def __init__(self, import_sh_file: str = "import.sh", import_tf_file: str = "import.tf", for_each: bool = False):
         self.import_sh_file = import_sh_file
         self.import_tf_file = import_tf_file
-        
-    def parse_import_commands(self, input_dir: str) -> List[Tuple[str, str, str]]:
+        self.for_each = for_each
+
+    @staticmethod
+    def parse_import_line(line: str) -> Optional[ImportCommand]:
         """
-        Parse the terraform import commands from import.sh file.
-        Returns a list of tuples: (resource_type, resource_name, resource_id)
+        Parse one `terraform import [options] ADDRESS ID` line. The address and id may be
+        quoted and the id may hold spaces, e.g. 'akamai_property.www' "prp_1,ctr_1,grp_1".
         """
-        import_sh_path = os.path.join(input_dir, self.import_sh_file)
-        
-        if not os.path.exists(import_sh_path):
-            print(f"Error: File {import_sh_path} not found")
-            return []
-            
-        with open(import_sh_path, 'r') as f:
-            content = f.read()
-            
-        # Extract import commands using regex
-        import_commands = re.findall(r'terraform import ([\w_]+)\.([\w_.-]+) (.+)', content)
-        return import_commands
-        
-    def generate_import_tf(self, input_dir: str, output_dir: str) -> None:
+        try:
+            tokens = shlex.split(line, comments=True)
+        except ValueError:
+            return None
+        if len(tokens) < 4 or tokens[:2] != ["terraform", "import"]:
+            return None
+
+        arguments = [token for token in tokens[2:] if not token.startswith("-")]
+        if len(arguments) < 2:
+            return None
+        match = _IMPORT_ADDRESS_PATTERN.fullmatch(arguments[0])
+        if not match:
+            return None
+        resource_type, resource_name, key = match.groups()
+        return ImportCommand(resource_type, key if key is not None else resource_name, " ".join(arguments[1:]))
+
+    def iter_import_commands(self, content: str) -> Iterator[ImportCommand]:
         """
-        Generate import.tf with import blocks using the new Terraform format.
+        Yield the terraform import commands of an import.sh file line by line, so the
+        commands of large multi-property scripts are never all held at once.
         """
-        import_commands = self.parse_import_commands(input_dir)
-        
-        if not import_commands:
-            print("No import commands found in import.sh. Skipping import.tf generation.")
-            return
-            
+        for line in content.splitlines():
+            if "import" not in line:
+                continue
+            command = self.parse_import_line(line)
+            if command:
+                yield command
+
+    @staticmethod
+    def keyed_commands(import_commands: Iterator[ImportCommand], resource_keys: Dict[str, Dict[str, str]]) -> Iterator[ImportCommand]:
+        """Replace the export names of the keyed resources by their for_each key in the module."""
+        for command in import_commands:
+            keys = resource_keys.get(command.resource_type, {})
+            if command.resource_name in keys:
+                command = command._replace(resource_name=keys[command.resource_name])
+            yield command
+
+    @staticmethod
+    def bucket_commands(import_commands: Iterator[ImportCommand], hostname_buckets: bool) -> Iterator[ImportCommand]:
+        """
+        Add the imports of the hostname buckets, which import.sh doesn't have. The bucket of
+        a network is imported by property id and network, the id of the activation on that network.
+        """
+        for command in import_commands:
+            yield command
+            if command.resource_type != "akamai_property_activation" or not hostname_buckets:
+                continue
+            network = command.resource_id.rpartition(":")[2]
+            if network in NETWORKS:
+                yield ImportCommand("akamai_property_hostname_bucket", network.lower(), command.resource_id)
+
+    @staticmethod
+    def import_block(to_value: str, id_value: str, for_each: str = None) -> str:
+        import_block = 'import {\n'
+        if for_each:
+            import_block += f'  for_each = {for_each}\n'
+            import_block += f'  to       = {to_value}\n'
+            import_block += f'  id       = {id_value}\n'
+        else:
+            import_block += f'  to = {to_value}\n'
+            import_block += f'  id = {id_value}\n'
+        import_block += '}\n'
+        return import_block
+
+    def render_import_blocks(self, import_commands: Iterator[ImportCommand]) -> Optional[str]:
+        """One import block per command, the format of the original optimizer output."""
         import_blocks = []
-        
         for resource_type, resource_name, resource_id in import_commands:
             # Handle edge_hostnames specially
-            if resource_type == "akamai_edge_hostname":
-                to_value = f'module.akamai_property.akamai_edge_hostname.edge_hostnames["{resource_name}"]'
+            if resource_type in KEYED_RESOURCES:
+                to_value = f'{MODULE_ADDRESS}.{resource_type}.{KEYED_RESOURCES[resource_type]}[{quote_string(resource_name)}]'
             else:
-                to_value = f'module.akamai_property.{resource_type}.{resource_name}'
-                
-            import_block = 'import {\n'
-            import_block += f'  to = {to_value}\n'
-            import_block += f'  id = "{resource_id}"\n'
-            import_block += '}\n'
-            import_blocks.append(import_block)
-            
+                to_value = f'{MODULE_ADDRESS}.{resource_type}.{resource_name}'
+            import_blocks.append(self.import_block(to_value, quote_string(resource_id)))
+        return '\n'.join(import_blocks) if import_blocks else None
+
+    def render_for_each_imports(self, import_commands: Iterator[ImportCommand]) -> Optional[str]:
+        """
+        Group the imports of keyed resources by resource type into a local map with one
+        for_each import block each (Terraform 1.7+). The address of a for_each import can
+        only vary by instance key, so resources that are not created with for_each in the
+        module keep a block of their own.
+        """
+        keyed_imports: Dict[str, Dict[str, str]] = {}  # Resource type -> instance key -> resource id
+        single_imports = []
+        for command in import_commands:
+            if command.resource_type in KEYED_RESOURCES:
+                keyed_imports.setdefault(command.resource_type, {})[command.resource_name] = command.resource_id
+            else:
+                single_imports.append(command)
+
+        if not keyed_imports and not single_imports:
+            return None
+
+        blocks = []
+        if keyed_imports:
+            locals_block = 'locals {\n'
+            for resource_type, imports in keyed_imports.items():
+                locals_block += f'  {resource_type}_imports = {render_value(imports, 2)}\n'
+            locals_block += '}\n'
+            blocks.append(locals_block)
+
+        for resource_type in keyed_imports:
+            to_value = f'{MODULE_ADDRESS}.{resource_type}.{KEYED_RESOURCES[resource_type]}[each.key]'
+            blocks.append(self.import_block(to_value, 'each.value', for_each=f'local.{resource_type}_imports'))
+
+        single_blocks = self.render_import_blocks(iter(single_imports))
+        if single_blocks:
+            blocks.append(single_blocks)
+        return '\n'.join(blocks)
+
+    def generate_import_tf(self, export: TerraformExportReader, writer: TerraformOutputWriter) -> None:
+        """
+        Generate import.tf with import blocks using the new Terraform format.
+        """
+        if not export.exists(self.import_sh_file):
+            print(f"Error: File {export.path(self.import_sh_file)} not found")
+            print("No import commands found in import.sh. Skipping import.tf generation.")
+            return
+
+        count = 0
+
+        def counted(commands: Iterator[ImportCommand]) -> Iterator[ImportCommand]:
+            nonlocal count
+            for command in commands:
+                count += 1
+                yield command
+
+        import_commands = self.keyed_commands(self.iter_import_commands(export.read(self.import_sh_file)), writer.resource_keys)
+        import_commands = counted(self.bucket_commands(import_commands, "property_hostname_buckets" in writer.tfvars))
+        if self.for_each:
+            content = self.render_for_each_imports(import_commands)
+        else:
+            content = self.render_import_blocks(import_commands)
+
+        if content is None:
+            print("No import commands found in import.sh. Skipping import.tf generation.")
+            return
+
         # Write the import blocks to import.tf
-        output_import_tf_path = os.path.join(output_dir, self.import_tf_file)
-        with open(output_import_tf_path, 'w') as f:
-            f.write('\n'.join(import_blocks))
-            
-        print(f"Generated {output_import_tf_path} with {len(import_commands)} import blocks.")
+        output_import_tf_path = writer.path(self.import_tf_file)
+        writer.write(self.import_tf_file, content, formatted=True)
+
+        if self.for_each:
+            print(f"Generated {output_import_tf_path} with {count} imports.")
+        else:
+            print(f"Generated {output_import_tf_path} with {count} import blocks.")
 
-def convert_imports(input_dir: str, output_dir: str) -> None:
+def convert_imports(export: TerraformExportReader, writer: TerraformOutputWriter, for_each: bool = False) -> None:
     """
-    Convert terraform import commands to the new import block format.
+    Convert terraform import commands to the new import block format, optionally
+    grouped into for_each import blocks.
     """
-    converter = TerraformImportConverter()
-    converter.generate_import_tf(input_dir, output_dir)
+    converter = TerraformImportConverter(for_each=for_each)
+    converter.generate_import_tf(export, writer)
 
 if __name__ == "__main__":
     # For local module testing
-    convert_imports(input_dir="../test", output_dir="../result")
\ No newline at end of file
+    writer = TerraformOutputWriter(output_dir="../result")
+    convert_imports(export=open_export("../test"), writer=writer)
+    writer.commit()
@@ -1,28 +1,66 @@
-import re
-import os
-import shutil
-from typing import Dict, List, Any
+import fnmatch
+from typing import Dict, Iterator, List, Any, NamedTuple, Tuple, Union
+from modules import metrics, patterns
+from modules.config_file import read_config_file
+from modules.export_reader import TerraformExportReader, open_export
+from modules.output_writer import TerraformOutputWriter
+from modules.snapshot import TerraformSnapshot
+from modules.tfvars import STRING_LITERAL, parse_string
+
+_DEFAULT_RULE_PATTERN = patterns.fixed(r'data\s+"akamai_property_rules_builder"\s+"([^"]+_rule_default)"\s+{')
+_VARIABLE_BLOCK_PATTERN = patterns.fixed(r'variable\s+{')
+_PMUSER_NAME_PATTERN = patterns.fixed(r'name\s+=\s+"(PMUSER_[^"]+)"')
+_DESCRIPTION_PATTERN = patterns.fixed(rf'description\s+=\s+{STRING_LITERAL}')
+_VALUE_PATTERN = patterns.fixed(rf'value\s+=\s+{STRING_LITERAL}')
+_HIDDEN_PATTERN = patterns.fixed(r'hidden\s+=\s+(true|false)')
+_SENSITIVE_PATTERN = patterns.fixed(r'sensitive\s+=\s+(true|false)')
+_BLANK_PATTERN = patterns.fixed(r'\s*')
+_BLOCK_CHAR_PATTERN = patterns.fixed(r'[{}"\'\\]')
+_SHARD_NAME_PATTERN = patterns.fixed(r'[^a-z0-9_]+')
+
+SENSITIVE_MAP = "pmuser_sensitive_variables"
+
+
+class PmuserVariable(NamedTuple):
+    key: str  # Variable name without the PMUSER_ prefix
+    description: str
+    value: str
+    hidden: bool
+    sensitive: bool
+    start: int  # Position of the variable keyword in rules.tf
+    end: int  # Position after the closing brace of the block
 
 
 class TerraformPropertyVariablesConverter:
-    def __init__(self, rules_file: str = "rules.tf"):
+    def __init__(self, rules_file: str = "rules.tf", shards: Union[str, Dict[str, List[str]]] = None):
         self.rules_file = rules_file
         self.variables_file = "variables.tf"
         self.tfvars_file = "terraform.tfvars"
-        self.extracted_pmuser_vars = {}
-        self.variable_blocks_positions = []  # To track the positions of variable blocks
+        self.shards = shards  # None, "prefix" or a map of shard names to PMUSER name patterns
+        self.pmuser_variables: Dict[str, Dict[str, Dict[str, Any]]] = {}  # Map variable name -> PMUSER key -> attributes
+        self.variable_blocks_positions = {}  # Default rule data source name -> (start, end) of its PMUSER variable blocks
+        self.parsed_variables: List[PmuserVariable] = []  # In rules.tf order, before sharding
 
-    def _extract_block_content(self, content: str, block_start: int) -> tuple:
-        """Extract a complete block with balanced braces starting from a position."""
+    def _find_block_end(self, content: str, block_start: int) -> int:
+        """Return the position after the brace closing the block that starts at block_start, or -1."""
         open_braces = 0
         in_quotes = False
         quote_char = None
+        escaped_to = 0  # Position after the character escaped by a backslash in a string
         
-        for i in range(block_start, len(content)):
+        # Only braces, quotes and escapes matter, so jump straight from one to the next
+        for char_match in _BLOCK_CHAR_PATTERN.finditer(content, block_start):
+            i = char_match.start()
+            if i < escaped_to:
+                continue
             char = content[i]
+            if char == '\\':
+                if in_quotes:
+                    escaped_to = i + 2
+                continue
             
             # Handle quotes (to avoid counting braces inside strings)
-            if char in ('"', "'") and (i == 0 or content[i-1] != '\\'):
+            if char in ('"', "'"):
                 if not in_quotes:
                     in_quotes = True
                     quote_char = char
@@ -36,268 +74,318 @@ class TerraformPropertyVariablesConverter:
                 elif char == '}':
                     open_braces -= 1
                     if open_braces == 0:
-                        return content[block_start:i+1], block_start, i+1
+                        # The characters are counted by the pattern jumping between braces
+                        metrics.count_block()
+                        return i + 1
         
-        return "", block_start, block_start  # In case of unbalanced braces
+        return -1  # In case of unbalanced braces
 
-    def parse_rules_file(self, input_dir) -> Dict[str, Dict[str, Any]]:
+    def iter_pmuser_variables(self, content: str) -> Iterator[Tuple[str, PmuserVariable]]:
         """
-        Parse the rules.tf file and extract PMUSER variable blocks from the default rule
+        Yield the PMUSER variables of the default rule one at a time, together with the name
+        of the default rule data source. The fields are matched in place within the bounds
+        of each block, so no block text is copied while scanning.
         """
-        input_rules_file_path = os.path.join(input_dir, self.rules_file)
-
-        try:
-            with open(input_rules_file_path, 'r') as f:
-                content = f.read()
-        except FileNotFoundError:
-            print(f"Error: File {input_rules_file_path} not found")
-            return {}
-        
-        results = {}
-        
-        # Find the data block for the default rule
         # This pattern looks for a data block with a name ending with "_rule_default"
-        data_block_pattern = r'data\s+"akamai_property_rules_builder"\s+"([^"]+_rule_default)"\s+{'
-        for match in re.finditer(data_block_pattern, content):
+        for match in _DEFAULT_RULE_PATTERN.finditer(content):
             data_name = match.group(1)
-            block_start = match.end() - 1  # Position of the opening brace
-            
-            # Extract the complete data block
-            data_block, data_start, data_end = self._extract_block_content(content, block_start)
-            if not data_block:
+            data_start = match.end() - 1  # Position of the opening brace
+            data_end = self._find_block_end(content, data_start)
+            if data_end == -1:
                 continue
-                
-            # Find all variable blocks within this data block
-            var_pattern = r'variable\s+{'
-            var_block_positions = []  # List to store the start and end positions of all variable blocks
-            
-            for var_match in re.finditer(var_pattern, data_block):
-                var_start = var_match.end() - 1 + data_start  # Position of opening brace
-                var_block, var_block_start, var_block_end = self._extract_block_content(content, var_start)
-                
-                if not var_block:
+
+            for var_match in _VARIABLE_BLOCK_PATTERN.finditer(content, data_start, data_end):
+                var_start = var_match.start()
+                var_end = self._find_block_end(content, var_match.end() - 1)
+                if var_end == -1:
                     continue
-                
-                # Extract the variable name
-                name_match = re.search(r'name\s+=\s+"(PMUSER_[^"]+)"', var_block)
+
+                name_match = _PMUSER_NAME_PATTERN.search(content, var_start, var_end)
                 if not name_match:
                     continue
-                
-                full_name = name_match.group(1)
-                if not full_name.startswith("PMUSER_"):
-                    continue
-                
-                # Strip the "PMUSER_" prefix to get the key
-                key = full_name[7:]  # Skip "PMUSER_"
-                
-                # Extract other fields
-                description_match = re.search(r'description\s+=\s+"([^"]*)"', var_block)
-                description = description_match.group(1) if description_match else ""
-                
-                value_match = re.search(r'value\s+=\s+"([^"]*)"', var_block)
-                value = value_match.group(1) if value_match else ""
-                
-                hidden_match = re.search(r'hidden\s+=\s+(true|false)', var_block)
-                hidden = hidden_match.group(1) == "true" if hidden_match else False
-                
-                sensitive_match = re.search(r'sensitive\s+=\s+(true|false)', var_block)
-                sensitive = sensitive_match.group(1) == "true" if sensitive_match else False
-                
-                # Store the extracted data
-                results[key] = {
-                    "description": description,
-                    "value": value,
-                    "hidden": hidden,
-                    "sensitive": sensitive
-                }
-                
-                # Store the position information for later replacement
-                var_block_positions.append((var_block_start, var_block_end))
-            
-            # Store the positions of all variable blocks for this data block
-            if var_block_positions:
-                self.variable_blocks_positions.append({
-                    "data_name": data_name,
-                    "data_start": data_start,
-                    "data_end": data_end,
-                    "var_positions": var_block_positions
-                })
+
+                description_match = _DESCRIPTION_PATTERN.search(content, var_start, var_end)
+                value_match = _VALUE_PATTERN.search(content, var_start, var_end)
+                hidden_match = _HIDDEN_PATTERN.search(content, var_start, var_end)
+                sensitive_match = _SENSITIVE_PATTERN.search(content, var_start, var_end)
+
+                yield data_name, PmuserVariable(
+                    key=name_match.group(1)[7:],  # Strip the "PMUSER_" prefix to get the key
+                    description=parse_string(description_match.group(1)) if description_match else "",
+                    value=parse_string(value_match.group(1)) if value_match else "",
+                    hidden=hidden_match.group(1) == "true" if hidden_match else False,
+                    sensitive=sensitive_match.group(1) == "true" if sensitive_match else False,
+                    start=var_start,
+                    end=var_end,
+                )
+
+    def parse_rules_file(self, export: TerraformExportReader) -> Iterator[PmuserVariable]:
+        """
+        Yield the PMUSER variables of the default rule in rules.tf one record at a time,
+        storing the position of each block for the replacement
+        """
+        try:
+            content = export.read(self.rules_file)
+        except FileNotFoundError:
+            print(f"Error: File {export.path(self.rules_file)} not found")
+            return
         
-        self.extracted_pmuser_vars = results
-        return results
+        for data_name, variable in self.iter_pmuser_variables(content):
+            self.variable_blocks_positions.setdefault(data_name, []).append((variable.start, variable.end))
+            self.parsed_variables.append(variable)
+            yield variable
 
-    def update_variables_tf(self, input_dir, output_dir) -> None:
+    def add_variable(self, variable: PmuserVariable) -> None:
         """
-        Update variables.tf with the pmuser_variables definition
+        Add a PMUSER variable to the map variable that holds it. Without sharding everything
+        goes to pmuser_variables. With sharding every shard gets its own pmuser_variables_<shard>
+        map, and sensitive variables go to a separate sensitive map.
+        """
+        if not self.shards:
+            map_name = "pmuser_variables"
+        elif variable.sensitive:
+            map_name = SENSITIVE_MAP
+        else:
+            map_name = f"pmuser_variables_{self._shard_name(variable.key)}"
+        self.pmuser_variables.setdefault(map_name, {})[variable.key] = {
+            "description": variable.description,
+            "value": variable.value,
+            "hidden": variable.hidden,
+            "sensitive": variable.sensitive,
+        }
+
+    def parsed_model(self) -> Tuple[List[tuple], Dict[str, List[Tuple[int, int]]]]:
+        """
+        The parsed variables and block positions, for the snapshot of the export. The variables
+        are kept unsharded, so a run with other sharding options reuses them too.
+        """
+        return [tuple(variable) for variable in self.parsed_variables], self.variable_blocks_positions
+
+    def load_parsed_model(self, model: Tuple[List[tuple], Dict[str, List[Tuple[int, int]]]]) -> Iterator[PmuserVariable]:
+        """Yield the variables of a snapshot instead of parsing rules.tf, like parse_rules_file."""
+        variables, self.variable_blocks_positions = model
+        for fields in variables:
+            variable = PmuserVariable(*fields)
+            self.parsed_variables.append(variable)
+            yield variable
+
+    def _shard_name(self, key: str) -> str:
+        """
+        Return the shard of a PMUSER variable: the configured group whose patterns match its
+        name, or the part of the name before the first underscore when sharding by prefix.
         """
-        # Check if the pmuser_variables variable is already defined
+        if isinstance(self.shards, dict):
+            for shard_name, name_patterns in self.shards.items():
+                if any(fnmatch.fnmatchcase(key, pattern) for pattern in name_patterns):
+                    return _SHARD_NAME_PATTERN.sub("_", shard_name.lower())
+            return "default"
+        prefix, separator, _ = key.partition("_")
+        return _SHARD_NAME_PATTERN.sub("_", prefix.lower()) if separator else "default"
 
-        input_variables_file_path = os.path.join(input_dir, self.variables_file)
-        output_variables_file_path = os.path.join(output_dir, self.variables_file)
+    def pmuser_maps(self) -> Dict[str, Dict[str, Dict[str, Any]]]:
+        """The map variables in the order they are declared: the shards by name, then the sensitive map."""
+        names = sorted(name for name in self.pmuser_variables if name != SENSITIVE_MAP)
+        if SENSITIVE_MAP in self.pmuser_variables:
+            names.append(SENSITIVE_MAP)
+        return {name: self.pmuser_variables[name] for name in names}
 
-        pmuser_var_defined = False
-        if os.path.exists(input_variables_file_path):
-            with open(input_variables_file_path, 'r') as f:
-                content = f.read()
-                pmuser_var_defined = 'variable "pmuser_variables"' in content
+    def update_variables_tf(self, export: TerraformExportReader, writer: TerraformOutputWriter) -> None:
+        """
+        Update variables.tf with the pmuser_variables definition
+        """
+        output_variables_file_path = writer.path(self.variables_file)
+
+        content = ""
+        if export.exists(self.variables_file):
+            content = export.read(self.variables_file)
         
         # Copy the file
-        shutil.copy(input_variables_file_path, output_variables_file_path)
+        writer.write(self.variables_file, content)
+
+        # Append to variables.tf unless the map variables are already defined
+        for var_name in self.pmuser_maps():
+            if f'variable "{var_name}"' in content:
+                print(f"{var_name} is already defined in {output_variables_file_path}")
+                continue
 
-        # Create or append to variables.tf
-        mode = 'a' if os.path.exists(output_variables_file_path) else 'w'
-        with open(output_variables_file_path, mode) as f:
-            if not pmuser_var_defined:
-                f.write("""
+            sensitive = "\n  sensitive   = true" if var_name == SENSITIVE_MAP else ""
+            writer.append(self.variables_file, f"""
 # PMUSER variables
-variable "pmuser_variables" {
-  description = "Map of PMUSER variables with their descriptions and sensitivity settings"
-  type = map(object({
+variable "{var_name}" {{
+  description = "Map of PMUSER variables with their descriptions and sensitivity settings"{sensitive}
+  type = map(object({{
     description = string
     value       = string
     hidden      = bool
     sensitive   = bool
-  }))
-}
+  }}))
+}}
 """)
-                print(f"Added pmuser_variables definition to {output_variables_file_path}")
-            else:
-                print(f"pmuser_variables is already defined in {output_variables_file_path}")
+            print(f"Added {var_name} definition to {output_variables_file_path}")
 
-    def update_tfvars(self, output_dir) -> None:
+    def update_tfvars(self, writer: TerraformOutputWriter) -> None:
         """
-        Update terraform.tfvars with the extracted PMUSER variables
+        Update terraform.tfvars with the extracted PMUSER variables. Sharded maps
+        are rendered to their own <map name>.auto.tfvars file.
         """
-        tfvars_file_path = os.path.join(output_dir, self.tfvars_file)
+        for var_name, variables in self.pmuser_maps().items():
+            tfvars_file = f"{var_name}.auto.tfvars" if self.shards else None
+            tfvars_file_path = writer.path(tfvars_file or self.tfvars_file)
 
-        existing_content = ""
-        if os.path.exists(tfvars_file_path):
-            with open(tfvars_file_path, 'r') as f:
-                existing_content = f.read()
-        
-        # Check if the pmuser_variables are already defined
-        if "pmuser_variables = {" in existing_content:
-            print(f"pmuser_variables is already defined in {tfvars_file_path}. Skipping update.")
-            return
-        
-        # Format the pmuser_variables map
-        tfvars_content = "pmuser_variables = {\n"
-        for key, attrs in self.extracted_pmuser_vars.items():
-            tfvars_content += f'  "{key}" = {{\n'
-            tfvars_content += f'    description = "{attrs["description"]}"\n'
-            tfvars_content += f'    value       = "{attrs["value"]}"\n'
-            tfvars_content += f'    hidden      = {str(attrs["hidden"]).lower()}\n'
-            tfvars_content += f'    sensitive   = {str(attrs["sensitive"]).lower()}\n'
-            tfvars_content += "  },\n"
-        tfvars_content += "}\n"
-        
-        # Append to existing file or create a new one
-        with open(tfvars_file_path, 'a') as f:
-            f.write("\n" + tfvars_content)
-            
-        print(f"Added pmuser_variables to {tfvars_file_path} with {len(self.extracted_pmuser_vars)} entries")
+            # Check if the map is already defined
+            if var_name in writer.tfvars:
+                print(f"{var_name} is already defined in {tfvars_file_path}. Skipping update.")
+                continue
 
-    def replace_variable_blocks(self, input_dir, output_dir) -> None:
+            # The map was filled one variable at a time while rules.tf was scanned
+            writer.tfvars.set(var_name, variables, file=tfvars_file)
+
+            print(f"Added {var_name} to {tfvars_file_path} with {len(variables)} entries")
+
+    def _dynamic_blocks(self) -> str:
+        """
+        Build the dynamic variable blocks. The shards are merged into a single dynamic block,
+        while the sensitive map gets its own so its sensitivity doesn't spread to the others.
+        """
+        map_names = [name for name in self.pmuser_maps() if name != SENSITIVE_MAP]
+        for_each_values = []
+        if len(map_names) == 1:
+            for_each_values.append(f"var.{map_names[0]}")
+        elif map_names:
+            for_each_values.append("merge(" + ", ".join(f"var.{name}" for name in map_names) + ")")
+        if SENSITIVE_MAP in self.pmuser_maps():
+            for_each_values.append(f"var.{SENSITIVE_MAP}")
+
+        return "\n    ".join(f"""dynamic "variable" {{
+      for_each = {for_each}
+      content {{
+        name        = "PMUSER_${{upper(variable.key)}}"
+        description = variable.value.description
+        value       = variable.value.value
+        hidden      = variable.value.hidden
+        sensitive   = variable.value.sensitive
+      }}
+    }}""" for for_each in for_each_values)
+
+    def replace_variable_blocks(self, export: TerraformExportReader, writer: TerraformOutputWriter) -> None:
         """
         Replace individual variable blocks with a dynamic block
         """
 
-        input_rules_file_path = os.path.join(input_dir, self.rules_file)
-        output_rules_file_path = os.path.join(output_dir, self.rules_file)
+        output_rules_file_path = writer.path(self.rules_file)
 
-        # Copy the file
-        shutil.copy(input_rules_file_path, output_rules_file_path)
+        content = export.read(self.rules_file)
 
         if not self.variable_blocks_positions:
+            writer.write(self.rules_file, content)
             print("No variable blocks to replace")
             return
-        
-        # Read the entire file
-        with open(output_rules_file_path, 'r') as f:
-            content = f.read()
-            
-        # Make a backup of the original file
-        backup_file = f"{output_rules_file_path}.bak"
-        with open(backup_file, 'w') as f:
-            f.write(content)
-        print(f"Created backup of {output_rules_file_path} to {backup_file}")
-        
-        # Process each data block
-        # We need to process them in reverse order to avoid position shifts
-        for data_block_info in reversed(self.variable_blocks_positions):
-            data_name = data_block_info["data_name"]
-            var_positions = data_block_info["var_positions"]
-            
-            # Sort positions in reverse order to avoid offsets when making replacements
-            var_positions.sort(reverse=True)
-            
-            # If there are no variable blocks, continue
-            if not var_positions:
-                continue
-                
-            # Find the start of the first `variable` block (including the `variable` keyword)
-            first_start = min(pos[0] for pos in var_positions)
-            
-            # Adjust `first_start` to include the `variable` keyword
-            # Search backward from the first block's start to find the `variable` keyword
-            variable_keyword_start = content.rfind("variable", 0, first_start)
-            if variable_keyword_start == -1:
-                print(f"Could not find 'variable' keyword for {data_name}. Skipping replacement.")
-                continue
-            
-            # Find the end of the last `variable` block
-            last_end = max(pos[1] for pos in var_positions)
-            
+
+        # The dynamic block takes the place of the first variable block of each default rule and
+        # the other blocks are cut out. Anything placed between them is kept.
+        pieces = []
+        position = 0
+        for data_name, var_positions in sorted(self.variable_blocks_positions.items(), key=lambda item: item[1][0]):
+            spans = self._merge_spans(content, sorted(var_positions))
+
             # Create the dynamic block
-            dynamic_block = """dynamic "variable" {
-      for_each = var.pmuser_variables
-      content {
-        name        = "PMUSER_${upper(variable.key)}"
-        description = variable.value.description
-        value       = variable.value.value
-        hidden      = variable.value.hidden
-        sensitive   = variable.value.sensitive
-      }
-    }"""
-            
-            # Replace all variable blocks with the dynamic block
-            # Ensure we remove the original `variable` keyword and its blocks
-            content = content[:variable_keyword_start] + dynamic_block + content[last_end:]
+            dynamic_block = self._dynamic_blocks()
+
+            first_start, first_end = spans[0]
+            pieces.append(content[position:first_start])
+            pieces.append(dynamic_block)
+            position = first_end
+            for start, end in spans[1:]:
+                start, end = self._line_bounds(content, start, end)
+                pieces.append(content[position:start])
+                position = end
             
             print(f"Replaced {len(var_positions)} variable blocks in {data_name} with a dynamic block")
+
+        pieces.append(content[position:])
         
         # Write the modified content back
-        with open(output_rules_file_path, 'w') as f:
-            f.write(content)
+        writer.write(self.rules_file, "".join(pieces))
             
         print(f"Updated {output_rules_file_path} with dynamic blocks for PMUSER variables")
 
-    def move_rules_tf(self, input_dir, output_dir):
-        input_rules_file_path = os.path.join(input_dir, self.rules_file)
-        output_rules_file_path = os.path.join(output_dir, self.rules_file)
+    def _merge_spans(self, content: str, spans: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+        """Merge variable blocks that are only separated by whitespace into a single span."""
+        merged = [spans[0]]
+        for start, end in spans[1:]:
+            previous_start, previous_end = merged[-1]
+            if _BLANK_PATTERN.match(content, previous_end, start).end() == start:
+                merged[-1] = (previous_start, end)
+            else:
+                merged.append((start, end))
+        return merged
+
+    def _line_bounds(self, content: str, start: int, end: int) -> Tuple[int, int]:
+        """Widen a span to its whole lines when nothing else is on them, so no empty line is left behind."""
+        line_start = content.rfind("\n", 0, start) + 1
+        line_end = content.find("\n", end)
+        line_end = len(content) if line_end == -1 else line_end + 1
+        if content[line_start:start].strip() or content[end:line_end].strip():
+            return start, end
+        return line_start, line_end
 
+    def move_rules_tf(self, export: TerraformExportReader, writer: TerraformOutputWriter):
         # Copy the file
-        shutil.copy(input_rules_file_path, output_rules_file_path)
+        writer.write(self.rules_file, export.read(self.rules_file))
 
 
-def pmuser_to_dynamic(input_dir, output_dir: List[str] = None):
-    
-    converter = TerraformPropertyVariablesConverter(rules_file="rules.tf")
-    extracted_vars = converter.parse_rules_file(input_dir)
+def load_pmuser_groups(groups_file: str) -> Dict[str, List[str]]:
+    """
+    Load a PMUSER grouping from a YAML or JSON file that maps each shard name to the
+    variable name patterns it holds. Variables matching no group go to the default shard:
+
+        ab_testing: [A_TEST, B_TEST]
+        geo: ["GEO_*"]
+    """
+    data = read_config_file(groups_file)
+    if not isinstance(data, dict) or not data:
+        raise ValueError(f"{groups_file} must map shard names to PMUSER variable name patterns")
+
+    groups = {}
+    for shard_name, name_patterns in data.items():
+        if isinstance(name_patterns, str):
+            name_patterns = [name_patterns]
+        if not isinstance(name_patterns, list) or not all(isinstance(pattern, str) for pattern in name_patterns):
+            raise ValueError(f"Patterns for PMUSER group {shard_name} must be a list of strings")
+        # Patterns can be written with or without the PMUSER_ prefix
+        groups[str(shard_name)] = [pattern[7:] if pattern.startswith("PMUSER_") else pattern for pattern in name_patterns]
+
+    return groups
+
+
+def pmuser_to_dynamic(export: TerraformExportReader, writer: TerraformOutputWriter, shards: Union[str, Dict[str, List[str]]] = None, snapshot: TerraformSnapshot = None):
     
+    converter = TerraformPropertyVariablesConverter(rules_file="rules.tf", shards=shards)
+    model = snapshot.get("convert_pmuser") if snapshot else None
     print("Extracted PMUSER variables:")
-    for key, attrs in extracted_vars.items():
-        print(f"  {key}: {attrs}")
+    if model is not None:
+        # The maps are built again, so they follow the sharding options of this run
+        for variable in converter.load_parsed_model(model):
+            converter.add_variable(variable)
+        print(f"  {len(converter.parsed_variables)} variables from {snapshot.path}")
+    else:
+        for variable in converter.parse_rules_file(export):
+            converter.add_variable(variable)
+            print(f"  {variable.key}: {variable.value!r}{' (sensitive)' if variable.sensitive else ''}")
+        if snapshot and export.exists(converter.rules_file):
+            snapshot.put("convert_pmuser", converter.parsed_model())
     
-    if extracted_vars:
-        converter.update_variables_tf(input_dir, output_dir)
-        converter.update_tfvars(output_dir)
-        converter.replace_variable_blocks(input_dir, output_dir)
+    if converter.pmuser_variables:
+        converter.update_variables_tf(export, writer)
+        converter.update_tfvars(writer)
+        converter.replace_variable_blocks(export, writer)
     else:
-        converter.move_rules_tf(input_dir, output_dir)
+        converter.move_rules_tf(export, writer)
         print("No PMUSER variables were extracted. Check if the file structure matches the expected format.")
 
 
 if __name__ == "__main__":
     # Specify the variables you want to include in terraform.tfvars
-    pmuser_to_dynamic(input_dir=".", output_dir="./result")
\ No newline at end of file
+    writer = TerraformOutputWriter(output_dir="./result")
+    pmuser_to_dynamic(export=open_export("."), writer=writer)
+    writer.commit()
\ No newline at end of file
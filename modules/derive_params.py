@@ -0,0 +1,249 @@
+import json
+from typing import Any, Dict, List, NamedTuple, Tuple
+from modules import patterns
+from modules.config_file import write_config_file
+from modules.export_reader import TerraformExportReader, open_export
+from modules.rule_tree import RuleNode, TerraformRuleTree
+
+_RULE_SUFFIX_PATTERN = patterns.fixed(r'rule_(.+)$')
+
+# Behavior options that optimize always parameterizes
+DEFAULT_PARAMETERIZED = ("origin.hostname", "cp_code.value.id")
+
+
+class OptionDifference(NamedTuple):
+    rule_path: Tuple[str, ...]
+    behavior: str
+    option: Tuple[str, ...]  # Path of the option in the behavior, e.g. ("value", "id")
+    var_name: str  # Variable that optimize creates for the option
+    values: Dict[str, Any]  # Environment -> value
+
+
+def _flatten_options(options: Any, prefix: Tuple[str, ...] = ()) -> Dict[Tuple[str, ...], Any]:
+    """Flatten the canonical options of a behavior to option path -> value. Nested blocks are lists of one object."""
+    if isinstance(options, list) and len(options) == 1 and isinstance(options[0], dict):
+        options = options[0]
+    if not isinstance(options, dict):
+        return {prefix: options}
+    flat = {}
+    for name, value in options.items():
+        flat.update(_flatten_options(value, prefix + (name,)))
+    return flat
+
+
+def _occurrences(items: List[Dict[str, Any]]) -> Dict[Tuple[str, int], Any]:
+    """Key the behaviors (or criteria) of a rule by name and occurrence, e.g. ("origin", 0)."""
+    keyed = {}
+    counts: Dict[str, int] = {}
+    for item in items:
+        for name, options in item.items():
+            keyed[(name, counts.get(name, 0))] = options
+            counts[name] = counts.get(name, 0) + 1
+    return keyed
+
+
+def _parameterizable(value: Any) -> bool:
+    """Whether optimize can match the value in the rule tree, see rules_parameterization._VALUE_PATTERNS."""
+    if isinstance(value, str):
+        return value != "" and '"' not in value
+    if isinstance(value, list):
+        return all(isinstance(item, str) for item in value)
+    return isinstance(value, (bool, int, float))
+
+
+class TerraformParameterDeriver:
+    """
+    Compare the rule trees of several exports of the same configuration (e.g. dev, qa and
+    prod) and derive the behavior options to parameterize. The trees are aligned by rule
+    path and compared by subtree hash, so identical subtrees are skipped with one comparison
+    and only the rules that differ are compared option by option.
+    """
+
+    def __init__(self, exports: Dict[str, TerraformExportReader]):
+        self.exports = exports  # Environment -> export, the first one is the base of optimize
+        self.environments = list(exports)
+        self.nodes: Dict[str, Dict[Tuple[str, ...], RuleNode]] = {}  # Environment -> rule path -> node
+        self.options: List[OptionDifference] = []
+        self.pmuser: Dict[str, Dict[str, Dict[str, Any]]] = {}  # PMUSER variable -> environment -> differing fields
+        self.structural: List[str] = []  # Differences that are not option values, reported only
+        self.rules_compared = 0
+
+    def load(self) -> None:
+        for env_name, export in self.exports.items():
+            rule_tree = TerraformRuleTree()
+            rule_tree.load(export.read("rules.tf"))
+            self.nodes[env_name] = rule_tree.rule_nodes()
+            if not self.nodes[env_name]:
+                raise ValueError(f"Default rule not found in {export.path('rules.tf')}")
+
+    def align(self) -> None:
+        """Walk the rule paths of all environments from the default rule, skipping equal subtrees."""
+        stack = [("default",)]
+        while stack:
+            path = stack.pop()
+            nodes = {env_name: self.nodes[env_name].get(path) for env_name in self.environments}
+            missing = [env_name for env_name, node in nodes.items() if node is None]
+            if missing:
+                present = [env_name for env_name in self.environments if env_name not in missing]
+                self.structural.append(f"{self._rule_label(path)}: rule only in {', '.join(present)}")
+                continue
+            if len({node.subtree_hash for node in nodes.values()}) == 1:
+                continue
+
+            self.rules_compared += 1
+            if len({node.content_hash for node in nodes.values()}) > 1:
+                self._compare_rule(path, nodes)
+
+            children = []
+            for node in nodes.values():
+                children.extend(child for child in node.children if child not in children)
+            stack.extend(reversed(children))
+
+    def _rule_label(self, path: Tuple[str, ...]) -> str:
+        return " > ".join(path)
+
+    def _compare_rule(self, path: Tuple[str, ...], nodes: Dict[str, RuleNode]) -> None:
+        contents = {env_name: node.content for env_name, node in nodes.items()}
+        label = self._rule_label(path)
+        keys = []
+        for content in contents.values():
+            keys.extend(key for key in content if key not in keys)
+
+        for key in keys:
+            values = {env_name: content.get(key) for env_name, content in contents.items()}
+            if len({json.dumps(value, sort_keys=True) for value in values.values()}) == 1:
+                continue
+            if key == "behavior":
+                self._compare_behaviors(path, nodes, values)
+            elif key == "variable":
+                self._compare_pmuser(values)
+            else:
+                self.structural.append(f"{label}: {key} differs")
+
+    def _compare_behaviors(self, path: Tuple[str, ...], nodes: Dict[str, RuleNode], values: Dict[str, Any]) -> None:
+        label = self._rule_label(path)
+        behaviors = {env_name: _occurrences(items or []) for env_name, items in values.items()}
+        keys = []
+        for keyed in behaviors.values():
+            keys.extend(key for key in keyed if key not in keys)
+
+        suffix_match = _RULE_SUFFIX_PATTERN.search(nodes[self.environments[0]].data_name)
+        suffix = suffix_match.group(1) if suffix_match else nodes[self.environments[0]].data_name
+        for behavior, occurrence in keys:
+            if any((behavior, occurrence) not in keyed for keyed in behaviors.values()):
+                self.structural.append(f"{label}: behavior {behavior} is not in every environment")
+                continue
+            options = {env_name: _flatten_options(keyed[(behavior, occurrence)]) for env_name, keyed in behaviors.items()}
+            option_paths = []
+            for flat in options.values():
+                option_paths.extend(option for option in flat if option not in option_paths)
+            for option in option_paths:
+                option_values = {env_name: flat.get(option) for env_name, flat in options.items()}
+                if len({json.dumps(value, sort_keys=True) for value in option_values.values()}) == 1:
+                    continue
+                if not all(_parameterizable(value) for value in option_values.values()):
+                    self.structural.append(f"{label}: {behavior}.{'.'.join(option)} differs but cannot be parameterized")
+                    continue
+                # Repeated behaviors of a rule get numbered variables, like optimize names them
+                var_name = f"{suffix}_{behavior}_{option[-1]}" + (f"_{occurrence + 1}" if occurrence else "")
+                self.options.append(OptionDifference(path, behavior, option, var_name, option_values))
+
+    def _compare_pmuser(self, values: Dict[str, Any]) -> None:
+        variables = {
+            env_name: {variable.get("name"): variable for variable in (items or [])}
+            for env_name, items in values.items()
+        }
+        names = []
+        for by_name in variables.values():
+            names.extend(name for name in by_name if name not in names)
+        for name in names:
+            if any(name not in by_name for by_name in variables.values()):
+                self.structural.append(f"PMUSER variable {name} is not in every environment")
+                continue
+            fields = {field for by_name in variables.values() for field in by_name[name] if field != "name"}
+            differing = [field for field in sorted(fields) if len({json.dumps(by_name[name].get(field)) for by_name in variables.values()}) > 1]
+            if differing:
+                self.pmuser[name] = {
+                    env_name: {field: by_name[name].get(field) for field in differing}
+                    for env_name, by_name in variables.items()
+                }
+
+    def parameterize_paths(self) -> List[str]:
+        """The --parameterize options optimize needs for the differing values."""
+        paths = []
+        for difference in self.options:
+            path = ".".join((difference.behavior,) + difference.option)
+            if path not in paths and path not in DEFAULT_PARAMETERIZED:
+                paths.append(path)
+        return paths
+
+    def environment_overrides(self) -> Dict[str, Dict[str, Any]]:
+        """Per-environment variable and PMUSER values, in the format of optimize --environments."""
+        overrides = {}
+        for env_name in self.environments:
+            env_overrides: Dict[str, Any] = {}
+            variables = {difference.var_name: difference.values[env_name] for difference in self.options}
+            if variables:
+                env_overrides["variables"] = variables
+            pmuser = {}
+            for name, by_env in self.pmuser.items():
+                fields = by_env[env_name]
+                pmuser[name] = fields["value"] if list(fields) == ["value"] else fields
+            if pmuser:
+                env_overrides["pmuser"] = pmuser
+            overrides[env_name] = env_overrides
+        return overrides
+
+    def report_lines(self) -> List[str]:
+        rules = len(self.nodes[self.environments[0]])
+        lines = [f"Compared {len(self.environments)} exports ({', '.join(self.environments)}): "
+                 f"{rules} rules, {self.rules_compared} with differences below them"]
+        for difference in self.options:
+            values = "  ".join(f"{env_name}={json.dumps(value)}" for env_name, value in difference.values.items())
+            lines.append(f"  {self._rule_label(difference.rule_path)}: {difference.behavior}.{'.'.join(difference.option)}"
+                         f" -> {difference.var_name}  {values}")
+        for name, by_env in self.pmuser.items():
+            values = "  ".join(f"{env_name}={json.dumps(fields)}" for env_name, fields in by_env.items())
+            lines.append(f"  PMUSER variable {name}: {values}")
+        for structural in self.structural:
+            lines.append(f"  Not parameterized: {structural}")
+        if not self.options and not self.pmuser and not self.structural:
+            lines.append("  The rule trees are identical")
+        return lines
+
+
+def parse_export_input(value: str) -> Tuple[str, str]:
+    """Split an ENV=PATH input. Without an environment name the export name is used."""
+    env_name, separator, path = value.partition("=")
+    if not separator:
+        return open_export(value).name, value
+    return env_name.strip(), path.strip()
+
+
+def derive_params(inputs: List[str], output_file: str = None) -> TerraformParameterDeriver:
+    """
+    Derive the parameterization of several exports of the same configuration. Prints the
+    differences and the optimize options to use, and writes the per-environment values to an
+    environments file if one is given. Raises ValueError for unreadable exports.
+    """
+    exports = {}
+    for value in inputs:
+        env_name, path = parse_export_input(value)
+        if env_name in exports:
+            raise ValueError(f"Environment {env_name} is given twice, name the exports with ENV=PATH")
+        exports[env_name] = open_export(path)
+
+    deriver = TerraformParameterDeriver(exports)
+    deriver.load()
+    deriver.align()
+    for line in deriver.report_lines():
+        print(line)
+
+    base = exports[deriver.environments[0]]
+    options = [f"-i {base.source}"] + [f"--parameterize {path}" for path in deriver.parameterize_paths()]
+    if output_file:
+        write_config_file(output_file, {"environments": deriver.environment_overrides()})
+        print(f"Wrote the per-environment values to {output_file}")
+        options.append(f"-e {output_file}")
+    print(f"Optimize with: python main.py optimize {' '.join(options)}")
+    return deriver
@@ -0,0 +1,150 @@
+from typing import Any, Dict, List, Tuple
+from modules.config_file import read_config_file
+from modules.tfvars import TerraformTfvars, hash_buckets, unique_keys
+
+
+class TerraformEnvironments:
+    def __init__(self, environments: Dict[str, Dict[str, Any]] = None):
+        # Without an environment matrix the export is rendered as a single prod environment
+        self.environments = environments if environments else {"prod": {}}
+
+    def names(self) -> List[str]:
+        return list(self.environments)
+
+    def includes_imports(self, name: str) -> bool:
+        """
+        Import blocks only make sense for environments that point at the exported property.
+        Environments that rename the property get no import.tf unless they ask for it.
+        """
+        overrides = self.environments[name]
+        return bool(overrides.get("import", "property_name" not in overrides))
+
+    def render_tfvars(self, name: str, tfvars: TerraformTfvars) -> TerraformTfvars:
+        """
+        Return the variable values for an environment, applying its overrides
+        on top of the values extracted from the export.
+        """
+        overrides = self.environments[name]
+        if not any(key in overrides for key in ("property_name", "hostnames", "pmuser", "variables")):
+            return tfvars
+
+        env_tfvars = tfvars.copy()
+
+        if "property_name" in overrides:
+            if "property_config" in env_tfvars:
+                env_tfvars.get("property_config")["name"] = overrides["property_name"]
+            else:
+                print(f"Warning: property_config not found, ignoring property_name for environment {name}")
+
+        if "hostnames" in overrides and "property_hostname_buckets" in env_tfvars:
+            # The hostnames are bucketed again with the average bucket size of the export
+            buckets = env_tfvars.get("property_hostname_buckets")
+            exported = {key: hostname for bucket in buckets.values() for key, hostname in bucket.items()}
+            hostnames = self._build_hostnames(overrides["hostnames"], exported)
+            bucket_size = max(-(-len(exported) // max(len(buckets), 1)), 1)
+            env_tfvars.set("property_hostname_buckets", hash_buckets(hostnames, bucket_size, "bucket"))
+        elif "hostnames" in overrides:
+            env_tfvars.set("property_hostnames", self._build_hostnames(overrides["hostnames"], env_tfvars.get("property_hostnames", {})))
+
+        for key, value in overrides.get("pmuser", {}).items():
+            key = key[7:] if key.startswith("PMUSER_") else key
+            # PMUSER variables can be sharded into several maps
+            pmuser_variables = next(
+                (env_tfvars.get(var_name) for var_name in env_tfvars.names()
+                 if var_name.startswith("pmuser_") and isinstance(env_tfvars.get(var_name), dict) and key in env_tfvars.get(var_name)),
+                {}
+            )
+            if key not in pmuser_variables:
+                print(f"Warning: PMUSER_{key} is not defined in the export, ignoring it for environment {name}")
+                continue
+            if isinstance(value, dict):
+                pmuser_variables[key].update(value)
+            else:
+                pmuser_variables[key]["value"] = str(value)
+
+        for var_name, value in overrides.get("variables", {}).items():
+            if var_name not in env_tfvars:
+                print(f"Warning: Variable {var_name} is not defined in the export, ignoring it for environment {name}")
+                continue
+            env_tfvars.set(var_name, value)
+
+        return env_tfvars
+
+    def _build_hostnames(self, hostnames: List[Any], exported_hostnames: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, str]]:
+        """
+        Build the property_hostnames map for an environment. Hostnames can be given as a plain
+        cname_from string, in which case cname_to and cert_provisioning_type default to the
+        values of the first exported hostname. Hostnames are keyed by cname_from like the exported ones.
+        """
+        template = next(iter(exported_hostnames.values()), {})
+        hostnames = [{"cname_from": hostname} if isinstance(hostname, str) else hostname for hostname in hostnames]
+        keys = unique_keys([hostname.get("cname_from", "") for hostname in hostnames], fallback="hostname")
+        property_hostnames = {}
+        for key, hostname in sorted(zip(keys, hostnames), key=lambda item: item[0]):
+            property_hostnames[key] = {
+                "cname_from": hostname.get("cname_from", ""),
+                "cname_to": hostname.get("cname_to", template.get("cname_to", "")),
+                "cert_provisioning_type": hostname.get("cert_provisioning_type", template.get("cert_provisioning_type", "CPS_MANAGED")),
+            }
+        return property_hostnames
+
+
+def split_shared_tfvars(env_tfvars: Dict[str, TerraformTfvars]) -> Tuple[TerraformTfvars, Dict[str, TerraformTfvars]]:
+    """
+    Split the variables of several environments into the ones with the same value in every
+    environment and the per-environment deltas. Terraform replaces a whole variable when it is
+    set in more than one file, so a map that differs in a single entry stays a delta.
+    """
+    env_names = list(env_tfvars)
+    first = env_tfvars[env_names[0]]
+
+    shared_names = set()
+    for name in first.names():
+        value = first.get(name)
+        if all(name in env_tfvars[env_name] and env_tfvars[env_name].get(name) == value for env_name in env_names[1:]):
+            shared_names.add(name)
+
+    shared = first.select(shared_names)
+    deltas = {}
+    for env_name, tfvars in env_tfvars.items():
+        deltas[env_name] = tfvars.select([name for name in tfvars.names() if name not in shared_names])
+
+    return shared, deltas
+
+
+def load_environments(environments_file: str) -> TerraformEnvironments:
+    """
+    Load an environment matrix from a YAML or JSON file. The file maps each environment name
+    to its overrides, optionally nested under a top level "environments" key:
+
+        environments:
+          dev:
+            property_name: dev.example.com
+            hostnames: [dev.example.com]
+            variables:
+              default_origin_hostname: origin-dev.example.com
+            pmuser:
+              A_TEST: a_dev.html
+          prod: {}
+    """
+    data = read_config_file(environments_file)
+
+    if isinstance(data, dict) and isinstance(data.get("environments"), dict):
+        data = data["environments"]
+
+    if not isinstance(data, dict) or not data:
+        raise ValueError(f"{environments_file} must map environment names to their overrides")
+
+    environments = {}
+    for name, overrides in data.items():
+        overrides = overrides or {}
+        if not isinstance(overrides, dict):
+            raise ValueError(f"Overrides for environment {name} must be a mapping")
+        for key in ("pmuser", "variables"):
+            if not isinstance(overrides.get(key, {}), dict):
+                raise ValueError(f"{key} for environment {name} must be a mapping")
+        if not isinstance(overrides.get("hostnames", []), list):
+            raise ValueError(f"hostnames for environment {name} must be a list")
+        environments[str(name)] = overrides
+
+    return TerraformEnvironments(environments)
@@ -0,0 +1,149 @@
+import hashlib
+import os
+import posixpath
+import tarfile
+import zipfile
+from typing import Dict, List
+from modules import metrics
+
+EXPORT_FILES = ("rules.tf", "variables.tf", "property.tf", "import.sh")
+ARCHIVE_EXTENSIONS = (".tar.gz", ".tgz", ".tar", ".zip")
+
+
+class TerraformExportReader:
+    """
+    Read access to the files of a Property Manager Terraform export. The export can be a
+    directory or a tar/zip archive, in which case only the members the optimizer needs are
+    read, straight from the archive and without extracting anything to disk.
+    """
+
+    def __init__(self, source: str, export_files: tuple = EXPORT_FILES):
+        self.source = source
+        self.export_files = export_files
+        self.files: Dict[str, str] = {}  # Export file name -> content, for archives
+        self.sizes: Dict[str, int] = {}  # Export file name -> characters, for the files read so far
+
+        if os.path.isdir(source):
+            self.is_archive = False
+        elif is_archive(source):
+            self.is_archive = True
+            self._load_archive()
+        else:
+            raise ValueError(f"{source} is neither a directory nor a .tar.gz, .tgz, .tar or .zip archive")
+
+    @property
+    def name(self) -> str:
+        """The export name, i.e. the directory or archive name without its extension."""
+        base_name = os.path.basename(os.path.normpath(self.source))
+        for extension in ARCHIVE_EXTENSIONS:
+            if base_name.endswith(extension):
+                return base_name[:-len(extension)]
+        return base_name
+
+    def _member_root(self, member_names: List[str]) -> str:
+        """
+        Exports are often archived with their parent folder, so look for the shallowest
+        folder in the archive that holds rules.tf and read the export files from there.
+        """
+        candidates = [posixpath.dirname(name) for name in member_names if posixpath.basename(name) == "rules.tf"]
+        if not candidates:
+            raise ValueError(f"{self.source} does not contain a rules.tf file")
+        return min(candidates, key=lambda candidate: (candidate.count("/"), candidate))
+
+    def _load_archive(self) -> None:
+        try:
+            if self.source.endswith(".zip"):
+                with zipfile.ZipFile(self.source) as archive:
+                    member_names = [name for name in archive.namelist() if not name.endswith("/")]
+                    root = self._member_root(member_names)
+                    for file_name in self.export_files:
+                        member_name = posixpath.join(root, file_name)
+                        if member_name in member_names:
+                            self.files[file_name] = archive.read(member_name).decode("utf-8")
+            else:
+                # Compressed tarballs can only be read sequentially, so the archive is streamed
+                # once and every member named like an export file is read as it is reached. The
+                # root is only known at the end, and the members outside of it are dropped then.
+                candidates: Dict[str, bytes] = {}  # Member path -> content
+                with tarfile.open(self.source, "r|*") as archive:
+                    for member in archive:
+                        if member.isfile() and posixpath.basename(member.name) in self.export_files:
+                            candidates[posixpath.normpath(member.name)] = archive.extractfile(member).read()
+                root = self._member_root(list(candidates))
+                for file_name in self.export_files:
+                    member_name = posixpath.join(root, file_name)
+                    if member_name in candidates:
+                        self.files[file_name] = candidates[member_name].decode("utf-8")
+        except (tarfile.TarError, zipfile.BadZipFile, UnicodeDecodeError) as e:
+            raise ValueError(f"Could not read the export archive {self.source}: {e}")
+
+    def path(self, file_name: str) -> str:
+        """Return a printable location of an export file, for messages."""
+        if self.is_archive:
+            return f"{self.source}:{file_name}"
+        return os.path.join(self.source, file_name)
+
+    def exists(self, file_name: str) -> bool:
+        if self.is_archive:
+            return file_name in self.files
+        return os.path.isfile(os.path.join(self.source, file_name))
+
+    def read(self, file_name: str) -> str:
+        if self.is_archive:
+            if file_name not in self.files:
+                raise FileNotFoundError(f"File {self.path(file_name)} not found")
+            content = self.files[file_name]
+        else:
+            with open(os.path.join(self.source, file_name), 'r') as f:
+                content = f.read()
+
+        # The export size is the base of the scan amplification, so count each file once
+        if file_name not in self.sizes:
+            self.sizes[file_name] = len(content)
+            metrics.registry.input_size += len(content)
+        metrics.add("bytes_read", len(content.encode("utf-8")))
+        return content
+
+    def digest(self) -> str:
+        """Return a sha256 over the names and contents of the export files, e.g. to key cached results."""
+        digest = hashlib.sha256()
+        for file_name in self.export_files:
+            if self.is_archive:
+                data = self.files[file_name].encode("utf-8") if file_name in self.files else None
+            elif os.path.isfile(os.path.join(self.source, file_name)):
+                with open(os.path.join(self.source, file_name), 'rb') as f:
+                    data = f.read()
+            else:
+                data = None
+            digest.update(file_name.encode("utf-8") + b"\0")
+            digest.update(b"-" if data is None else str(len(data)).encode("ascii") + b"\0" + data)
+        return digest.hexdigest()
+
+
+def is_archive(path: str) -> bool:
+    return os.path.isfile(path) and path.endswith(ARCHIVE_EXTENSIONS)
+
+
+def list_archives(directory: str) -> List[str]:
+    """Return the export archives in a directory, for batch mode."""
+    return sorted(
+        os.path.join(directory, file_name)
+        for file_name in os.listdir(directory)
+        if is_archive(os.path.join(directory, file_name))
+    )
+
+
+def find_exports(input_path: str) -> List[str]:
+    """
+    Return the exports to optimize. A directory without a rules.tf file that holds
+    export archives is processed in batch mode, one export per archive.
+    """
+    if os.path.isdir(input_path) and not os.path.isfile(os.path.join(input_path, "rules.tf")):
+        archives = list_archives(input_path)
+        if archives:
+            return archives
+    return [input_path]
+
+
+def open_export(source: str) -> TerraformExportReader:
+    return TerraformExportReader(source)
@@ -1,6 +1,5 @@
-import os
-import re
 from typing import List
+from modules.output_writer import TerraformOutputWriter
 
 
 class TerraformMainGenerator:
@@ -8,58 +7,54 @@ class TerraformMainGenerator:
         self.tfvars_file = tfvars_file
         self.main_tf_file = main_tf_file
 
-    def extract_variable_names(self, input_dir: str) -> List[str]:
+    def extract_variable_names(self, writer: TerraformOutputWriter) -> List[str]:
         """
         Extract all variable names from the terraform.tfvars file.
         """
-        tfvars_file_path = os.path.join(input_dir, self.tfvars_file)
+        tfvars_file_path = writer.path(self.tfvars_file)
 
-        if not os.path.exists(tfvars_file_path):
-            print(f"Error: File {tfvars_file_path} not found")
+        if not writer.tfvars.names():
+            print(f"Error: No variables staged for {tfvars_file_path}")
             return []
 
-        with open(tfvars_file_path, 'r') as f:
-            content = f.read()
+        return writer.tfvars.names()
 
-        # Extract variable names using regex
-        variable_names = re.findall(r'^([a-zA-Z_|-][a-zA-Z0-9_|-]*)\s*=', content, re.MULTILINE)
-        return variable_names
-
-    def generate_main_tf(self, input_dir: str, output_dir: str) -> None:
+    def generate_main_tf(self, writer: TerraformOutputWriter) -> None:
         """
         Generate main.tf with a call to the akamai_property module,
         passing all variables from terraform.tfvars as arguments.
         """
         # Extract variable names from terraform.tfvars
-        variable_names = self.extract_variable_names(input_dir)
+        variable_names = self.extract_variable_names(writer)
 
         if not variable_names:
             print("No variables found in terraform.tfvars. Skipping main.tf generation.")
             return
 
-        # Generate the module block
+        # Generate the module block, with the arguments aligned like terraform fmt does
+        width = max(len(name) for name in ["source"] + variable_names)
         module_block = 'module "akamai_property" {\n'
-        module_block += '  source = "../../modules/property"\n'
+        module_block += f'  {"source".ljust(width)} = "../../modules/property"\n'
         for var_name in variable_names:
-            module_block += f'  {var_name.ljust(30)} = var.{var_name}\n'
+            module_block += f'  {var_name.ljust(width)} = var.{var_name}\n'
         module_block += '}\n'
 
         # Write the module block to main.tf
-        output_main_tf_path = os.path.join(output_dir, self.main_tf_file)
-        with open(output_main_tf_path, 'w') as f:
-            f.write(module_block)
+        output_main_tf_path = writer.path(self.main_tf_file)
+        writer.write(self.main_tf_file, module_block, formatted=True)
 
         print(f"Generated {output_main_tf_path} with {len(variable_names)} variables.")
 
 
-def main_tf(output_dir):
+def main_tf(writer: TerraformOutputWriter):
     # Create an instance of the TerraformMainGenerator class
     main_generator = TerraformMainGenerator()
-    input_dir = output_dir
 
     # Generate the main.tf file
-    main_generator.generate_main_tf(input_dir, output_dir)
+    main_generator.generate_main_tf(writer)
 
 if __name__ == "__main__":
     # For local module testing
-    main_tf(output_dir="../../result/")
\ No newline at end of file
+    writer = TerraformOutputWriter(output_dir="../../result/")
+    main_tf(writer)
+    writer.commit()
\ No newline at end of file
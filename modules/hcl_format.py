@@ -0,0 +1,182 @@
+from typing import List, Optional, Tuple
+from modules import patterns
+from modules.output_writer import TerraformOutputWriter
+
+_HEREDOC_PATTERN = patterns.fixed(r'<<-?([A-Za-z_][\w-]*)$')
+# Characters that can change the bracket nesting, start a string, comment or heredoc, or
+# be the equals sign of an attribute. Everything in between is skipped.
+_SIGNIFICANT_PATTERN = patterns.fixed(r'[\\"{}\[\]()=#/<$%]')
+_OPENING = "{[("
+_CLOSING = "}])"
+_COMPARISON_PREFIXES = "=!<>"
+
+
+class TerraformHclLine:
+    """
+    A line of HCL split the way terraform fmt sees it: the nesting change of its brackets and,
+    for a single line attribute, the name and value around its equals sign.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self.bracket_change = 0
+        self.lead: Optional[str] = None  # Text before the equals sign of an attribute
+        self.value: Optional[str] = None  # Text after it
+        self.heredoc: Optional[str] = None  # Delimiter of a heredoc starting at the end of the line
+
+
+class TerraformHclFormatter:
+    """
+    Format HCL in the canonical style of terraform fmt, so the generated files never need
+    a separate fmt run: two spaces of indentation per line that opens brackets, the equals
+    signs of consecutive single line attributes aligned, at most one blank line in a row
+    and a single newline at the end. Strings, comments and heredocs are kept as they are.
+    """
+
+    def __init__(self, indent: int = 2):
+        self.indent = indent
+
+    def scan_line(self, text: str) -> TerraformHclLine:
+        """Scan a line outside of strings and comments for brackets and the attribute equals sign."""
+        line = TerraformHclLine(text)
+        stack: List[str] = []  # Open brackets, with '"' for strings and '$' for template interpolations
+        depth = 0
+        equals = None
+        skip_to = 0  # Position after an escape sequence or a template opening
+        for match in _SIGNIFICANT_PATTERN.finditer(text):
+            i = match.start()
+            if i < skip_to:
+                continue
+            char = text[i]
+            if stack and stack[-1] == '"':
+                if char == "\\":
+                    skip_to = i + 2
+                elif char == '"':
+                    stack.pop()
+                elif char in "$%" and text[i + 1:i + 2] == "{" and text[i - 1:i] != char:
+                    stack.append("$")
+                    skip_to = i + 2
+                continue
+
+            if char == '"':
+                stack.append('"')
+            elif char == "#" or text.startswith("//", i):
+                break
+            elif char in _OPENING:
+                stack.append(char)
+                depth += 1
+            elif char in _CLOSING:
+                if stack and stack[-1] == "$":
+                    stack.pop()
+                else:
+                    if stack:
+                        stack.pop()
+                    depth -= 1
+            elif char == "=" and not stack and equals is None and i > 0:
+                following = text[i + 1:i + 2]
+                if following not in "=>" and text[i - 1] not in _COMPARISON_PREFIXES:
+                    equals = i
+            elif char == "<" and text.startswith("<<", i) and not stack:
+                heredoc = _HEREDOC_PATTERN.match(text[i:].rstrip())
+                if heredoc:
+                    line.heredoc = heredoc.group(1)
+                    break
+
+        line.bracket_change = depth
+        if equals is not None and text[:equals].strip():
+            line.lead = text[:equals].rstrip()
+            line.value = text[equals + 1:].strip()
+        return line
+
+    def format(self, content: str) -> str:
+        """Return the content in canonical format."""
+        output: List[Tuple[Optional[TerraformHclLine], str]] = []  # Scanned line (None if verbatim), indented text
+        # Brackets opened by each indented line: a line opening several brackets, like
+        # map(object({, indents by one level that its closing line removes at once
+        indents: List[int] = []
+        heredoc = None
+        for raw_line in content.split("\n"):
+            if heredoc is not None:
+                output.append((None, raw_line.rstrip()))
+                if raw_line.strip() == heredoc:
+                    heredoc = None
+                continue
+
+            stripped = raw_line.strip()
+            if not stripped:
+                if output and output[-1][1]:
+                    output.append((None, ""))
+                continue
+
+            line = self.scan_line(stripped)
+            if line.bracket_change > 0:
+                output.append((line, " " * (self.indent * len(indents)) + stripped))
+                indents.append(line.bracket_change)
+            else:
+                closing = -line.bracket_change
+                while closing > 0 and indents:
+                    if closing >= indents[-1]:
+                        closing -= indents.pop()
+                    else:
+                        indents[-1] -= closing
+                        closing = 0
+                output.append((line, " " * (self.indent * len(indents)) + stripped))
+            heredoc = line.heredoc
+
+        while output and not output[-1][1]:
+            output.pop()
+        return "\n".join(self._align(output)) + "\n" if output else ""
+
+    def _align(self, output: List[Tuple[Optional[TerraformHclLine], str]]) -> List[str]:
+        """
+        Align the equals signs of each run of consecutive single line attributes. Like
+        terraform fmt, an attribute with a multi-line value ends the run.
+        """
+        lines = []
+        group: List[Tuple[str, str]] = []
+
+        def flush_group():
+            if group:
+                width = max(len(lead) for lead, _ in group)
+                lines.extend(f"{lead.ljust(width)} = {value}" for lead, value in group)
+                group.clear()
+
+        for line, text in output:
+            if line is None or line.lead is None:
+                flush_group()
+                lines.append(text)
+                continue
+            lead = text[:len(text) - len(line.text)] + line.lead
+            if line.bracket_change or line.heredoc:
+                flush_group()
+                lines.append(f"{lead} = {line.value}")
+            else:
+                group.append((lead, line.value))
+        flush_group()
+        return lines
+
+    def format_files(self, writer: TerraformOutputWriter) -> int:
+        """
+        Format the staged .tf and .tfvars files that were not emitted in terraform fmt style,
+        i.e. the ones built from export text. Returns the number of files that changed.
+        """
+        changed = 0
+        for key in writer.list_files():
+            if not key.endswith((".tf", ".tfvars")) or key in writer.formatted:
+                continue
+            content = writer.read(key)
+            formatted = self.format(content)
+            if formatted != content:
+                changed += 1
+            writer.write(key, formatted, formatted=True)
+        return changed
+
+
+def format_hcl(content: str) -> str:
+    return TerraformHclFormatter().format(content)
+
+
+def format_output(writer: TerraformOutputWriter) -> None:
+    formatter = TerraformHclFormatter()
+    changed = formatter.format_files(writer)
+    print(f"Formatted {changed} files in {writer.output_dir}")
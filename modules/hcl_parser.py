@@ -0,0 +1,495 @@
+import json
+import re
+from typing import Any, Dict, List, Tuple
+from modules import patterns
+
+
+class HclParseError(Exception):
+    pass
+
+
+class HclUnresolved(Exception):
+    """Raised when an expression references something that is not in scope."""
+
+
+class HclExpression:
+    def __init__(self, kind: str, value: Any, source: str):
+        self.kind = kind  # literal, template, traversal, call, list, object, conditional, operation
+        self.value = value
+        self.source = source
+
+    def __repr__(self) -> str:
+        return f"HclExpression({self.kind}, {self.source!r})"
+
+
+class HclBlock:
+    def __init__(self, block_type: str, labels: List[str] = None):
+        self.type = block_type
+        self.labels = labels if labels else []
+        self.attributes: Dict[str, HclExpression] = {}
+        self.blocks: List["HclBlock"] = []
+
+    def find_blocks(self, block_type: str) -> List["HclBlock"]:
+        return [block for block in self.blocks if block.type == block_type]
+
+    def __repr__(self) -> str:
+        return f"HclBlock({self.type}, {self.labels})"
+
+
+_TOKEN_PATTERN = patterns.fixed(r'''
+    (?P<newline>\n)
+  | (?P<space>[ \t\r]+)
+  | (?P<comment>\#[^\n]*|//[^\n]*|/\*.*?\*/)
+  | (?P<heredoc><<-?(?P<marker>[A-Za-z_][A-Za-z0-9_]*)\n)
+  | (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_-]*)
+  | (?P<string>")
+  | (?P<op>==|!=|<=|>=|&&|\|\||[{}\[\]().,=:?!<>+\-*/%])
+''', re.VERBOSE | re.DOTALL)
+
+_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', '"': '"', '\\': '\\'}
+_BINARY_OPERATORS = {"==", "!=", "<=", ">=", "&&", "||", "<", ">", "+", "-", "*", "/", "%"}
+
+
+def _read_string(text: str, pos: int) -> Tuple[List[Any], int]:
+    """
+    Read a quoted template starting after the opening quote.
+    Returns the template parts (literal strings and interpolation sources) and the position after the closing quote.
+    """
+    parts = []
+    literal = []
+    while pos < len(text):
+        char = text[pos]
+        if char == '"':
+            if literal:
+                parts.append("".join(literal))
+            return parts, pos + 1
+        if char == '\\':
+            escape = text[pos + 1:pos + 2]
+            if escape == 'u':
+                literal.append(chr(int(text[pos + 2:pos + 6], 16)))
+                pos += 6
+            elif escape == 'U':
+                literal.append(chr(int(text[pos + 2:pos + 10], 16)))
+                pos += 10
+            else:
+                literal.append(_ESCAPES.get(escape, escape))
+                pos += 2
+            continue
+        if text.startswith("$${", pos) or text.startswith("%%{", pos):
+            literal.append(text[pos + 1:pos + 3])
+            pos += 3
+            continue
+        if text.startswith("${", pos):
+            end = _find_interpolation_end(text, pos + 2)
+            if literal:
+                parts.append("".join(literal))
+                literal = []
+            parts.append(("interpolation", text[pos + 2:end]))
+            pos = end + 1
+            continue
+        if char == '\n':
+            raise HclParseError(f"Unterminated string at offset {pos}")
+        literal.append(char)
+        pos += 1
+    raise HclParseError("Unterminated string at end of input")
+
+
+def _find_interpolation_end(text: str, pos: int) -> int:
+    """Find the closing brace of an interpolation, skipping nested braces and strings."""
+    depth = 1
+    while pos < len(text):
+        char = text[pos]
+        if char == '"':
+            _, pos = _read_string(text, pos + 1)
+            continue
+        if char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return pos
+        pos += 1
+    raise HclParseError("Unterminated interpolation")
+
+
+def tokenize(text: str) -> List[Tuple[str, Any, int, int]]:
+    """Split HCL text into (type, value, start, end) tokens. Comments and spaces are dropped."""
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _TOKEN_PATTERN.match(text, pos)
+        if not match:
+            raise HclParseError(f"Unexpected character {text[pos]!r} at offset {pos}")
+        kind = match.lastgroup if match.lastgroup != "marker" else "heredoc"
+        if kind == "string":
+            parts, end = _read_string(text, match.end())
+            tokens.append(("string", parts, pos, end))
+            pos = end
+            continue
+        if kind == "heredoc":
+            marker = match.group("marker")
+            end_match = patterns.cached(rf'^[ \t]*{marker}[ \t]*$', re.MULTILINE).search(text, match.end())
+            if not end_match:
+                raise HclParseError(f"Unterminated heredoc {marker}")
+            body = text[match.end():end_match.start()]
+            if match.group(0).startswith("<<-"):
+                lines = body.split("\n")
+                indent = min((len(line) - len(line.lstrip()) for line in lines if line.strip()), default=0)
+                body = "\n".join(line[indent:] for line in lines)
+            tokens.append(("string", [body] if body else [], pos, end_match.end()))
+            pos = end_match.end()
+            continue
+        if kind in ("space", "comment"):
+            # Single line comments end at the newline, which stays significant
+            pos = match.end()
+            continue
+        tokens.append((kind, match.group(0), pos, match.end()))
+        pos = match.end()
+    tokens.append(("eof", None, len(text), len(text)))
+    return tokens
+
+
+class HclParser:
+    def __init__(self, text: str):
+        self.text = text
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def _peek(self, offset: int = 0) -> Tuple[str, Any, int, int]:
+        return self.tokens[min(self.pos + offset, len(self.tokens) - 1)]
+
+    def _next(self) -> Tuple[str, Any, int, int]:
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def _expect(self, value: str) -> Tuple[str, Any, int, int]:
+        token = self._next()
+        if token[1] != value or token[0] == "string":
+            raise HclParseError(f"Expected {value!r} at offset {token[2]}, found {token[1]!r}")
+        return token
+
+    def _skip_newlines(self) -> None:
+        while self._peek()[0] == "newline":
+            self.pos += 1
+
+    def parse(self) -> HclBlock:
+        """Parse the whole text as a body and return it as an unnamed root block."""
+        root = HclBlock("")
+        self._parse_body(root, top_level=True)
+        return root
+
+    def _parse_body(self, block: HclBlock, top_level: bool = False) -> None:
+        while True:
+            self._skip_newlines()
+            token = self._peek()
+            if token[0] == "eof":
+                if not top_level:
+                    raise HclParseError("Unexpected end of input inside a block")
+                return
+            if token[1] == "}" and token[0] == "op":
+                if top_level:
+                    raise HclParseError(f"Unexpected '}}' at offset {token[2]}")
+                return
+            if token[0] != "ident":
+                raise HclParseError(f"Expected an attribute or block at offset {token[2]}, found {token[1]!r}")
+
+            name = self._next()[1]
+            following = self._peek()
+            if following[0] == "op" and following[1] == "=":
+                self._next()
+                block.attributes[name] = self.parse_expression()
+                continue
+
+            # Block with optional labels
+            labels = []
+            while self._peek()[0] in ("string", "ident"):
+                label = self._next()
+                labels.append("".join(part for part in label[1] if isinstance(part, str)) if label[0] == "string" else label[1])
+            self._expect("{")
+            child = HclBlock(name, labels)
+            self._parse_body(child)
+            self._expect("}")
+            block.blocks.append(child)
+
+    def parse_expression(self) -> HclExpression:
+        start = self._peek()[2]
+        condition = self._parse_operation()
+        if self._peek()[1] == "?" and self._peek()[0] == "op":
+            self._next()
+            true_expr = self.parse_expression()
+            self._expect(":")
+            false_expr = self.parse_expression()
+            return HclExpression("conditional", (condition, true_expr, false_expr), self._source(start))
+        return condition
+
+    def _parse_operation(self) -> HclExpression:
+        start = self._peek()[2]
+        left = self._parse_unary()
+        operands = [left]
+        operators = []
+        while self._peek()[0] == "op" and self._peek()[1] in _BINARY_OPERATORS:
+            operators.append(self._next()[1])
+            operands.append(self._parse_unary())
+        if not operators:
+            return left
+        return HclExpression("operation", (operators, operands), self._source(start))
+
+    def _parse_unary(self) -> HclExpression:
+        token = self._peek()
+        if token[0] == "op" and token[1] in ("-", "!"):
+            self._next()
+            operand = self._parse_unary()
+            if token[1] == "-" and operand.kind == "literal" and isinstance(operand.value, (int, float)):
+                return HclExpression("literal", -operand.value, self._source(token[2]))
+            return HclExpression("operation", ([token[1]], [operand]), self._source(token[2]))
+        return self._parse_postfix(self._parse_primary(), token[2])
+
+    def _source(self, start: int) -> str:
+        end = self.tokens[self.pos - 1][3]
+        return self.text[start:end]
+
+    def _parse_primary(self) -> HclExpression:
+        token = self._next()
+        kind, value, start, _ = token
+
+        if kind == "number":
+            number = float(value) if any(c in value for c in ".eE") else int(value)
+            return HclExpression("literal", number, value)
+
+        if kind == "string":
+            parts = []
+            for part in value:
+                if isinstance(part, tuple):
+                    parts.append(HclParser(part[1]).parse_standalone_expression())
+                else:
+                    parts.append(part)
+            if all(isinstance(part, str) for part in parts):
+                return HclExpression("literal", "".join(parts), self._source(start))
+            return HclExpression("template", parts, self._source(start))
+
+        if kind == "ident":
+            if value in ("true", "false"):
+                return HclExpression("literal", value == "true", value)
+            if value == "null":
+                return HclExpression("literal", None, value)
+            if self._peek()[1] == "(" and self._peek()[0] == "op":
+                self._next()
+                args = []
+                self._skip_newlines()
+                while not (self._peek()[0] == "op" and self._peek()[1] == ")"):
+                    args.append(self.parse_expression())
+                    self._skip_newlines()
+                    if self._peek()[1] == "," and self._peek()[0] == "op":
+                        self._next()
+                        self._skip_newlines()
+                self._expect(")")
+                return HclExpression("call", (value, args), self._source(start))
+            return HclExpression("traversal", (value, []), value)
+
+        if kind == "op" and value == "(":
+            self._skip_newlines()
+            expr = self.parse_expression()
+            self._skip_newlines()
+            self._expect(")")
+            return HclExpression(expr.kind, expr.value, self._source(start))
+
+        if kind == "op" and value == "[":
+            items = []
+            self._skip_newlines()
+            while not (self._peek()[0] == "op" and self._peek()[1] == "]"):
+                items.append(self.parse_expression())
+                self._skip_newlines()
+                if self._peek()[1] == "," and self._peek()[0] == "op":
+                    self._next()
+                    self._skip_newlines()
+            self._expect("]")
+            return HclExpression("list", items, self._source(start))
+
+        if kind == "op" and value == "{":
+            items = []
+            self._skip_newlines()
+            while not (self._peek()[0] == "op" and self._peek()[1] == "}"):
+                key_token = self._peek()
+                if key_token[0] == "ident" and self._peek(1)[1] in ("=", ":"):
+                    self._next()
+                    key = HclExpression("literal", key_token[1], key_token[1])
+                else:
+                    key = self.parse_expression()
+                separator = self._next()
+                if separator[1] not in ("=", ":"):
+                    raise HclParseError(f"Expected '=' in object at offset {separator[2]}")
+                items.append((key, self.parse_expression()))
+                if self._peek()[1] == "," and self._peek()[0] == "op":
+                    self._next()
+                self._skip_newlines()
+            self._expect("}")
+            return HclExpression("object", items, self._source(start))
+
+        raise HclParseError(f"Unexpected {value!r} at offset {start}")
+
+    def _parse_postfix(self, expr: HclExpression, start: int) -> HclExpression:
+        while self._peek()[0] == "op" and self._peek()[1] in (".", "["):
+            if expr.kind != "traversal":
+                expr = HclExpression("traversal", (expr, []), expr.source)
+            root, steps = expr.value
+            if self._next()[1] == ".":
+                step = self._next()
+                if step[0] == "number":
+                    steps = steps + [("index", HclExpression("literal", int(step[1]), step[1]))]
+                elif step[0] == "op" and step[1] == "*":
+                    steps = steps + [("splat", None)]
+                else:
+                    steps = steps + [("attr", step[1])]
+            else:
+                self._skip_newlines()
+                index = self.parse_expression()
+                self._skip_newlines()
+                self._expect("]")
+                steps = steps + [("index", index)]
+            expr = HclExpression("traversal", (root, steps), self._source(start))
+        return expr
+
+    def parse_standalone_expression(self) -> HclExpression:
+        self._skip_newlines()
+        expr = self.parse_expression()
+        self._skip_newlines()
+        if self._peek()[0] != "eof":
+            raise HclParseError(f"Unexpected {self._peek()[1]!r} after expression")
+        return expr
+
+
+def parse_hcl(text: str) -> HclBlock:
+    """Parse HCL text into a tree of blocks and attribute expressions."""
+    return HclParser(text).parse()
+
+
+# Number of labels of the block types in Terraform JSON syntax, where labels are nested object keys
+_JSON_TOP_LEVEL_LABELS = {"data": 2, "resource": 2, "variable": 1, "module": 1, "output": 1, "provider": 1}
+_JSON_NESTED_LABELS = {"dynamic": 1}
+
+
+def _json_expression(value: Any) -> HclExpression:
+    """Convert a JSON value to an expression. Strings are templates, like in Terraform JSON syntax."""
+    if isinstance(value, str):
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n").replace("\r", "\\r").replace("\t", "\\t")
+        expr = HclParser(f'"{escaped}"').parse_standalone_expression()
+        # A string holding a single interpolation stands for the interpolated value itself
+        if expr.kind == "template" and len(expr.value) == 1:
+            return expr.value[0]
+        return expr
+    if isinstance(value, list):
+        return HclExpression("list", [_json_expression(item) for item in value], json.dumps(value))
+    if isinstance(value, dict):
+        items = [(HclExpression("literal", key, json.dumps(key)), _json_expression(item)) for key, item in value.items()]
+        return HclExpression("object", items, json.dumps(value))
+    return HclExpression("literal", value, json.dumps(value))
+
+
+def _json_body(block: HclBlock, body: Dict[str, Any], block_labels: Dict[str, int] = _JSON_NESTED_LABELS) -> None:
+    for name, value in body.items():
+        label_count = block_labels.get(name, 0)
+        if label_count and isinstance(value, dict):
+            _json_labeled_blocks(block, name, [], value, label_count)
+        elif isinstance(value, dict):
+            child = HclBlock(name)
+            _json_body(child, value)
+            block.blocks.append(child)
+        elif isinstance(value, list) and value and all(isinstance(item, dict) for item in value):
+            for item in value:
+                child = HclBlock(name)
+                _json_body(child, item)
+                block.blocks.append(child)
+        else:
+            block.attributes[name] = _json_expression(value)
+
+
+def _json_labeled_blocks(block: HclBlock, block_type: str, labels: List[str], value: Dict[str, Any], remaining: int) -> None:
+    for label, item in value.items():
+        if remaining > 1:
+            _json_labeled_blocks(block, block_type, labels + [label], item, remaining - 1)
+            continue
+        for body in (item if isinstance(item, list) else [item]):
+            child = HclBlock(block_type, labels + [label])
+            _json_body(child, body)
+            block.blocks.append(child)
+
+
+def parse_hcl_json(document: Dict[str, Any]) -> HclBlock:
+    """
+    Convert a Terraform JSON syntax document (.tf.json) into the same tree of blocks and
+    expressions as parse_hcl. Objects are read as nested blocks and arrays of objects as
+    repeated blocks, which is how the generated files use them.
+    """
+    root = HclBlock("")
+    _json_body(root, document, _JSON_TOP_LEVEL_LABELS)
+    return root
+
+
+_FUNCTIONS = {
+    "upper": lambda value: value.upper(),
+    "lower": lambda value: value.lower(),
+    "tostring": lambda value: value if isinstance(value, str) else _to_template_string(value),
+    "tonumber": lambda value: float(value) if "." in str(value) else int(value),
+    "tobool": lambda value: value if isinstance(value, bool) else value == "true",
+    "merge": lambda *maps: {key: value for item in maps for key, value in item.items()},
+}
+
+
+def _to_template_string(value: Any) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (int, float)):
+        return str(value)
+    raise HclUnresolved(f"Cannot convert {type(value).__name__} to string")
+
+
+def evaluate(expr: HclExpression, scope: Dict[str, Any] = None) -> Any:
+    """
+    Evaluate an expression to a Python value using the given scope (e.g. {"var": {...}}).
+    Raises HclUnresolved when the expression references something that is not in scope.
+    """
+    scope = scope if scope is not None else {}
+
+    if expr.kind == "literal":
+        return expr.value
+
+    if expr.kind == "template":
+        return "".join(part if isinstance(part, str) else _to_template_string(evaluate(part, scope)) for part in expr.value)
+
+    if expr.kind == "list":
+        return [evaluate(item, scope) for item in expr.value]
+
+    if expr.kind == "object":
+        return {str(evaluate(key, scope)): evaluate(value, scope) for key, value in expr.value}
+
+    if expr.kind == "traversal":
+        root, steps = expr.value
+        if isinstance(root, HclExpression):
+            value = evaluate(root, scope)
+        elif root in scope:
+            value = scope[root]
+        else:
+            raise HclUnresolved(expr.source)
+        for step_kind, step in steps:
+            key = step if step_kind == "attr" else evaluate(step, scope) if step_kind == "index" else None
+            try:
+                value = value[key]
+            except (KeyError, IndexError, TypeError):
+                raise HclUnresolved(expr.source)
+        return value
+
+    if expr.kind == "call":
+        name, args = expr.value
+        if name not in _FUNCTIONS:
+            raise HclUnresolved(expr.source)
+        return _FUNCTIONS[name](*[evaluate(arg, scope) for arg in args])
+
+    if expr.kind == "conditional":
+        condition, true_expr, false_expr = expr.value
+        return evaluate(true_expr if evaluate(condition, scope) else false_expr, scope)
+
+    raise HclUnresolved(expr.source)
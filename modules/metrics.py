@@ -0,0 +1,75 @@
+from typing import Dict, List
+
+COUNTERS = ("regex_calls", "chars_scanned", "blocks_extracted", "bytes_read", "bytes_written")
+
+
+class TerraformMetricsRegistry:
+    """
+    Counts the scanning work of the stages: regex calls and the characters they scan, blocks
+    extracted by brace matching, and the UTF-8 bytes read from the export and staged files
+    and written to the output, counted once when the output is committed.
+    Dividing the characters scanned by a stage by the size of the export gives its scan
+    amplification, i.e. how many times the stage went over the input.
+    """
+
+    def __init__(self):
+        self.stage = "other"
+        self.counters: Dict[str, Dict[str, int]] = {}  # Stage name -> counter name -> value, in run order
+        self.current = self._stage_counters(self.stage)
+        self.input_size = 0  # Characters of the export files, each counted once
+
+    def _stage_counters(self, stage: str) -> Dict[str, int]:
+        if stage not in self.counters:
+            self.counters[stage] = dict.fromkeys(COUNTERS, 0)
+        return self.counters[stage]
+
+    def set_stage(self, stage: str) -> str:
+        """Attribute the following work to a stage. Returns the previous stage."""
+        previous = self.stage
+        self.stage = stage
+        self.current = self._stage_counters(stage)
+        return previous
+
+    def add(self, counter: str, amount: int = 1) -> None:
+        self.current[counter] += amount
+
+    def count_regex(self, chars: int) -> None:
+        self.current["regex_calls"] += 1
+        self.current["chars_scanned"] += chars
+
+    def count_block(self, chars: int = 0) -> None:
+        self.current["blocks_extracted"] += 1
+        self.current["chars_scanned"] += chars
+
+    def amplification(self, stage: str) -> float:
+        if not self.input_size:
+            return 0.0
+        return self.counters[stage]["chars_scanned"] / self.input_size
+
+    def report_lines(self) -> List[str]:
+        """Render the counters of every stage that did any work."""
+        stages = [stage for stage, counters in self.counters.items() if any(counters.values())]
+        if not stages:
+            return []
+        width = max(len(stage) for stage in stages + ["stage"])
+        lines = [f"Scan work (input {self.input_size} chars):"]
+        lines.append(f"  {'stage'.ljust(width)}  {'regex':>8}  {'scanned':>11}  {'blocks':>7}  {'read':>10}  {'written':>10}  {'ampl.':>7}")
+        for stage in stages:
+            counters = self.counters[stage]
+            lines.append(
+                f"  {stage.ljust(width)}  {counters['regex_calls']:>8}  {counters['chars_scanned']:>11}  "
+                f"{counters['blocks_extracted']:>7}  {counters['bytes_read']:>10}  {counters['bytes_written']:>10}  "
+                f"{self.amplification(stage):>6.1f}x"
+            )
+        return lines
+
+
+registry = TerraformMetricsRegistry()
+
+
+def add(counter: str, amount: int = 1) -> None:
+    registry.add(counter, amount)
+
+
+def count_block(chars: int = 0) -> None:
+    registry.count_block(chars)
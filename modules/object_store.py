@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+from typing import Dict
+
+LINK_MODES = ("hardlink", "symlink")
+
+
+class TerraformObjectStore:
+    """
+    Content-addressed store for the generated files. Every file content is written once to
+    objects/<sha256[:2]>/<sha256> and linked into the output trees, so the files shared by
+    a fleet (versions.tf, provider.tf, identical rule files) take disk space only once.
+    Objects are read-only, since editing a hard linked file in place would change every copy.
+    """
+
+    def __init__(self, store_dir: str, link_mode: str = "hardlink"):
+        if link_mode not in LINK_MODES:
+            raise ValueError(f"Unsupported link mode {link_mode}, use {' or '.join(LINK_MODES)}")
+        self.store_dir = os.path.abspath(store_dir)
+        self.link_mode = link_mode
+        self.manifest: Dict[str, Dict[str, str]] = {}  # Output directory -> file path -> sha256
+        self.stored_objects = 0
+
+    def object_path(self, digest: str) -> str:
+        return os.path.join(self.store_dir, "objects", digest[:2], digest)
+
+    def put(self, content: str) -> str:
+        """Store a file content unless it is already stored and return its hash."""
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        object_path = self.object_path(digest)
+        if os.path.isfile(object_path):
+            return digest
+
+        object_dir = os.path.dirname(object_path)
+        os.makedirs(object_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".staging-", dir=object_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o444)
+            os.replace(tmp_path, object_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+        self.stored_objects += 1
+        return digest
+
+    def add_tree(self, output_dir: str, files: Dict[str, str]) -> Dict[str, str]:
+        """Store the files of an output tree and record them in the manifest. Returns path -> hash."""
+        digests = {key: self.put(content) for key, content in files.items()}
+        self.manifest[os.path.abspath(output_dir)] = dict(sorted(digests.items()))
+        return digests
+
+    def link(self, digest: str, file_path: str) -> None:
+        """
+        Link a stored object to a file path. Hard links fall back to a symbolic link when the
+        store is on another file system.
+        """
+        object_path = self.object_path(digest)
+        if self.link_mode == "hardlink":
+            try:
+                os.link(object_path, file_path)
+            except OSError:
+                os.symlink(object_path, file_path)
+        else:
+            os.symlink(object_path, file_path)
+
+    def write_manifest(self) -> str:
+        """Write the mapping of the output files to their objects for this run to manifests/."""
+        manifests_dir = os.path.join(self.store_dir, "manifests")
+        os.makedirs(manifests_dir, exist_ok=True)
+        manifest_path = os.path.join(manifests_dir, f"{time.strftime('%Y%m%dT%H%M%S')}-{os.getpid()}.json")
+        manifest = {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "link_mode": self.link_mode,
+            "outputs": self.manifest,
+        }
+        with open(manifest_path, 'w', encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+            f.write("\n")
+
+        files = sum(len(digests) for digests in self.manifest.values())
+        unique = len({digest for digests in self.manifest.values() for digest in digests.values()})
+        print(f"Object store {self.store_dir}: {files} files, {unique} unique, "
+              f"{self.stored_objects} new objects, manifest {manifest_path}")
+        return manifest_path
+
+
+def open_object_store(store_dir: str, link_mode: str = "hardlink") -> TerraformObjectStore:
+    return TerraformObjectStore(store_dir, link_mode)
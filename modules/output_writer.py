@@ -0,0 +1,305 @@
+import difflib
+import io
+import json
+import os
+import tarfile
+import tempfile
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set
+from modules import metrics
+from modules.tfvars import TerraformTfvars
+
+MANIFEST_FILE = ".optimizer-manifest.json"  # The files the last commit generated, so re-runs remove only those
+JOURNAL_FILE = ".optimizer-commit.json"  # The renames of a commit in progress
+STAGING_SUFFIX = ".optimizer-new"  # Suffix of a file written next to the one it replaces
+
+
+class TerraformOutputWriter:
+    def __init__(self, output_dir: str = ".", max_workers: int = 8, object_store=None):
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.object_store = object_store  # Optional TerraformObjectStore the committed files are linked from
+        self.files: Dict[str, str] = {}  # Staged files keyed by path relative to output_dir
+        self.formatted: Set[str] = set()  # Staged files emitted in terraform fmt style, which hcl_format skips
+        self.tfvars = TerraformTfvars()  # Variable values, rendered to terraform.tfvars per environment
+        self.resource_keys: Dict[str, Dict[str, str]] = {}  # Resource type -> export resource name -> for_each key in the module
+
+    def _key(self, path: str) -> str:
+        """Normalize a path relative to the output directory."""
+        return os.path.normpath(path)
+
+    def path(self, path: str) -> str:
+        """Return the location a staged file will have once committed."""
+        return os.path.join(self.output_dir, self._key(path))
+
+    def exists(self, path: str) -> bool:
+        return self._key(path) in self.files
+
+    def read(self, path: str) -> str:
+        """Read a staged file. Raises FileNotFoundError like open() would."""
+        key = self._key(path)
+        if key not in self.files:
+            raise FileNotFoundError(self.path(key))
+        metrics.add("bytes_read", len(self.files[key].encode("utf-8")))
+        return self.files[key]
+
+    def write(self, path: str, content: str, formatted: bool = False) -> None:
+        """Stage a file. formatted tells that the content was emitted in terraform fmt style."""
+        key = self._key(path)
+        self.files[key] = content
+        if formatted:
+            self.formatted.add(key)
+        else:
+            self.formatted.discard(key)
+
+    def append(self, path: str, content: str) -> None:
+        key = self._key(path)
+        self.files[key] = self.files.get(key, "") + content
+        self.formatted.discard(key)
+
+    def remove(self, path: str) -> None:
+        key = self._key(path)
+        self.files.pop(key, None)
+        self.formatted.discard(key)
+
+    def list_files(self) -> List[str]:
+        return sorted(self.files)
+
+    def _read_existing(self, key: str) -> Optional[str]:
+        """Read the current content of a file in the output directory, if any."""
+        file_path = os.path.join(self.output_dir, key)
+        if not os.path.isfile(file_path):
+            return None
+        try:
+            with open(file_path, 'r', encoding="utf-8") as f:
+                return f.read()
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def _generated_files(self) -> List[str]:
+        """Files the previous commit generated, from its manifest. Empty for other directories."""
+        try:
+            with open(os.path.join(self.output_dir, MANIFEST_FILE), 'r', encoding="utf-8") as f:
+                return json.load(f).get("files", [])
+        except (OSError, ValueError, AttributeError):
+            return []
+
+    def _manifest(self) -> str:
+        return json.dumps({"files": sorted(self.files)}, indent=2) + "\n"
+
+    def changes(self) -> Dict[str, List[str]]:
+        """
+        Compare the staged files with the output directory. Files that the previous commit
+        generated and that are no longer generated are reported as removed. Any other file,
+        like terraform.tfstate or .terraform/, is not ours and is left alone.
+        """
+        result = {"added": [], "modified": [], "removed": [], "unchanged": []}
+        for key in sorted(self.files):
+            existing = self._read_existing(key)
+            if existing is None:
+                result["added"].append(key)
+            elif existing != self.files[key]:
+                result["modified"].append(key)
+            else:
+                result["unchanged"].append(key)
+
+        for key in self._generated_files():
+            key = self._key(key)
+            if key not in self.files and os.path.isfile(os.path.join(self.output_dir, key)):
+                result["removed"].append(key)
+
+        result["removed"].sort()
+        return result
+
+    def diff(self, diff_format: str = "unified") -> str:
+        """Return the changes the commit would make as a unified diff or a JSON summary."""
+        changes = self.changes()
+        if diff_format == "json":
+            summary = {name: files for name, files in changes.items() if name != "unchanged"}
+            summary["unchanged"] = len(changes["unchanged"])
+            return json.dumps(summary, indent=2) + "\n"
+
+        diff_lines = []
+        for key in changes["added"] + changes["modified"] + changes["removed"]:
+            old = self._read_existing(key) or ""
+            new = self.files.get(key, "")
+            from_file = f"a/{key}" if key not in changes["added"] else "/dev/null"
+            to_file = f"b/{key}" if key not in changes["removed"] else "/dev/null"
+            diff_lines.extend(difflib.unified_diff(
+                old.splitlines(keepends=True), new.splitlines(keepends=True), from_file, to_file
+            ))
+        return "".join(line if line.endswith("\n") else line + "\n" for line in diff_lines)
+
+    def _is_linked(self, key: str, digest: str) -> bool:
+        """Whether a file in the output directory is already linked from its stored object."""
+        file_path = os.path.join(self.output_dir, key)
+        try:
+            return os.path.samefile(file_path, self.object_store.object_path(digest))
+        except OSError:
+            return False
+
+    def _write_file(self, key: str, content: str, digest: str = None) -> None:
+        """
+        Write a file next to its final path and sync it, to be renamed into place by the commit.
+        With an object store the file is linked from its stored object instead, which the
+        store synced when it was added.
+        """
+        tmp_path = os.path.join(self.output_dir, key + STAGING_SUFFIX)
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)  # Left behind by an interrupted run
+        if digest:
+            self.object_store.link(digest, tmp_path)
+            return
+        with open(tmp_path, 'w', encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _remove_staged(self, keys: List[str]) -> None:
+        """Delete the staged files of a commit that failed before its journal was written."""
+        for key in keys:
+            try:
+                os.unlink(os.path.join(self.output_dir, key + STAGING_SUFFIX))
+            except FileNotFoundError:
+                pass
+
+    def _sync_dirs(self, keys: List[str]) -> None:
+        """Sync the directories of the given files, so their new entries and renames are on disk."""
+        if os.name == "nt":
+            return  # Directories cannot be opened for fsync on Windows
+        for dir_path in sorted({os.path.join(self.output_dir, os.path.dirname(key)) for key in keys}):
+            try:
+                fd = os.open(dir_path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue  # Removed with the last file it held
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _apply_journal(self) -> None:
+        """
+        Rename the staged files of a commit into place and delete the files it no longer
+        generates. The journal is only written once every staged file is on disk, so a commit
+        interrupted while applying it is finished by the next one.
+        """
+        journal_path = os.path.join(self.output_dir, JOURNAL_FILE)
+        try:
+            with open(journal_path, 'r', encoding="utf-8") as f:
+                journal = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key in journal.get("replace", []):
+            tmp_path = os.path.join(self.output_dir, key + STAGING_SUFFIX)
+            if os.path.lexists(tmp_path):
+                os.replace(tmp_path, os.path.join(self.output_dir, key))
+        for key in journal.get("remove", []):
+            try:
+                os.unlink(os.path.join(self.output_dir, key))
+            except FileNotFoundError:
+                pass
+        # The renames have to be on disk before the journal that replays them is gone
+        self._sync_dirs(journal.get("replace", []) + journal.get("remove", []))
+        os.unlink(journal_path)
+
+    def commit(self) -> None:
+        """
+        Write and sync the changed files next to their final paths in parallel, and rename
+        them all into place once they are on disk. Only the generated files are replaced, so the
+        Terraform state and anything else in the output directory is kept. An interrupted
+        run either leaves the previous files in place or is finished by the next commit.
+        """
+        if not self.files:
+            print("No files to write")
+            return
+
+        self._apply_journal()
+
+        digests = {}
+        if self.object_store:
+            digests = self.object_store.add_tree(self.output_dir, self.files)
+
+        changes = self.changes()
+        manifest = self._manifest()
+        # Unchanged files are left as they are, unless they still have to be linked from the object store
+        replace = changes["added"] + changes["modified"] + [
+            key for key in changes["unchanged"] if key in digests and not self._is_linked(key, digests[key])
+        ]
+        if not replace and not changes["removed"] and self._read_existing(MANIFEST_FILE) == manifest:
+            print(f"No changes, {self.output_dir} is up to date")
+            return
+
+        staged = {key: self.files[key] for key in replace}
+        staged[MANIFEST_FILE] = manifest
+        for dir_path in {os.path.join(self.output_dir, os.path.dirname(key)) for key in staged}:
+            os.makedirs(dir_path, exist_ok=True)
+
+        # The files are synced by the workers, so the syncs overlap like the writes. Until the
+        # journal is in place nothing was replaced, and a failed write leaves no staged file behind.
+        journal = {"replace": sorted(staged), "remove": changes["removed"]}
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                list(executor.map(lambda key: self._write_file(key, staged[key], digests.get(key)), staged))
+            self._write_file(JOURNAL_FILE, json.dumps(journal, indent=2) + "\n")
+            self._sync_dirs(list(staged))
+        except BaseException:
+            self._remove_staged(list(staged) + [JOURNAL_FILE])
+            raise
+        # Files linked from the object store are not written. Counted here only, in UTF-8 bytes.
+        metrics.add("bytes_written", sum(len(content.encode("utf-8")) for key, content in staged.items() if key not in digests))
+
+        os.replace(os.path.join(self.output_dir, JOURNAL_FILE + STAGING_SUFFIX), os.path.join(self.output_dir, JOURNAL_FILE))
+        self._sync_dirs([JOURNAL_FILE])
+        self._apply_journal()
+
+        for key in replace:
+            print(f"Wrote {self.path(key)}")
+        for key in changes["removed"]:
+            print(f"Removed {self.path(key)}")
+        print(f"Committed {len(self.files)} files to {self.output_dir} "
+              f"({len(changes['added'])} added, {len(changes['modified'])} modified, {len(changes['removed'])} removed)")
+
+    def commit_archive(self, archive_path: str) -> None:
+        """
+        Write the staged files straight into a .tar.gz, .tgz, .tar or .zip archive instead of
+        the output directory. The archive is written next to its final path and renamed into place.
+        """
+        if not archive_path.endswith((".tar.gz", ".tgz", ".tar", ".zip")):
+            raise ValueError(f"Unsupported archive format for {archive_path}, use .tar.gz, .tgz, .tar or .zip")
+
+        archive_dir = os.path.dirname(os.path.abspath(archive_path))
+        os.makedirs(archive_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".staging-", dir=archive_dir)
+        os.close(fd)
+
+        try:
+            mtime = time.time()
+            if archive_path.endswith(".zip"):
+                with zipfile.ZipFile(tmp_path, "w", zipfile.ZIP_DEFLATED) as archive:
+                    for key in sorted(self.files):
+                        info = zipfile.ZipInfo(key.replace(os.sep, "/"), time.localtime(mtime)[:6])
+                        info.external_attr = 0o644 << 16
+                        info.compress_type = zipfile.ZIP_DEFLATED
+                        archive.writestr(info, self.files[key])
+            else:
+                mode = "w" if archive_path.endswith(".tar") else "w:gz"
+                with tarfile.open(tmp_path, mode) as archive:
+                    for key in sorted(self.files):
+                        data = self.files[key].encode("utf-8")
+                        info = tarfile.TarInfo(key.replace(os.sep, "/"))
+                        info.size = len(data)
+                        info.mode = 0o644
+                        info.mtime = mtime
+                        archive.addfile(info, io.BytesIO(data))
+
+            with open(tmp_path, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(tmp_path, archive_path)
+            metrics.add("bytes_written", os.path.getsize(archive_path))
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+        print(f"Committed {len(self.files)} files to {archive_path}")
@@ -0,0 +1,141 @@
+import re
+import sys
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterator, Match, Optional, Pattern, Tuple, Union
+from modules import metrics
+
+
+class TerraformCountedPattern:
+    """
+    Compiled pattern that reports every call and the characters it scans to the metrics
+    registry. Matching calls count up to the end of the match, the others the whole string.
+    Only used with --profile, since the wrapper slows down the scanning loops.
+    """
+
+    __slots__ = ("compiled",)
+
+    def __init__(self, compiled: Pattern):
+        self.compiled = compiled
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.compiled, name)
+
+    def _count(self, string: str, pos: int, end: int) -> None:
+        metrics.registry.count_regex(max(min(end, len(string)) - pos, 0))
+
+    def search(self, string: str, pos: int = 0, endpos: int = sys.maxsize) -> Optional[Match]:
+        match = self.compiled.search(string, pos, endpos)
+        self._count(string, pos, match.end() if match else endpos)
+        return match
+
+    def match(self, string: str, pos: int = 0, endpos: int = sys.maxsize) -> Optional[Match]:
+        match = self.compiled.match(string, pos, endpos)
+        self._count(string, pos, match.end() if match else pos)
+        return match
+
+    def fullmatch(self, string: str, pos: int = 0, endpos: int = sys.maxsize) -> Optional[Match]:
+        match = self.compiled.fullmatch(string, pos, endpos)
+        self._count(string, pos, endpos)
+        return match
+
+    def finditer(self, string: str, pos: int = 0, endpos: int = sys.maxsize) -> Iterator[Match]:
+        # Callers often stop early, so only count up to the last match they consumed
+        scanned = pos
+        try:
+            for match in self.compiled.finditer(string, pos, endpos):
+                scanned = match.end()
+                yield match
+            scanned = endpos
+        finally:
+            self._count(string, pos, scanned)
+
+    def findall(self, string: str, pos: int = 0, endpos: int = sys.maxsize) -> list:
+        self._count(string, pos, endpos)
+        return self.compiled.findall(string, pos, endpos)
+
+    def sub(self, repl: Any, string: str, count: int = 0) -> str:
+        self._count(string, 0, len(string))
+        return self.compiled.sub(repl, string, count)
+
+    def split(self, string: str, maxsplit: int = 0) -> list:
+        self._count(string, 0, len(string))
+        return self.compiled.split(string, maxsplit)
+
+
+class TerraformPatternRegistry:
+    """
+    Central registry for the regular expressions used by the stages. Fixed patterns are
+    compiled once when their module is imported. Patterns built from rule or variable
+    names are memoized in a bounded LRU, since large exports overflow the internal
+    cache of the re module and would otherwise keep recompiling them.
+
+    The patterns are plain compiled patterns unless counting is enabled, in which case they
+    report their calls to the metrics registry. The stage modules compile their fixed
+    patterns when they are imported, so counting has to be enabled before that.
+    """
+
+    def __init__(self, maxsize: int = 1024):
+        self.maxsize = maxsize
+        self.counting = False
+        self.cache: "OrderedDict[Tuple[str, int], CompiledPattern]" = OrderedDict()
+        self.fixed_compiles = 0
+        self.cached_compiles = 0
+        self.hits = 0
+        self.evictions = 0
+        self.compile_time = 0.0
+
+    def _compile(self, pattern: str, flags: int) -> "CompiledPattern":
+        start = time.perf_counter()
+        compiled = re.compile(pattern, flags)
+        self.compile_time += time.perf_counter() - start
+        return TerraformCountedPattern(compiled) if self.counting else compiled
+
+    def enable_counting(self) -> None:
+        """Count the calls of the patterns compiled from now on, and drop the uncounted cached ones."""
+        self.counting = True
+        self.cache.clear()
+
+    def fixed(self, pattern: str, flags: int = 0) -> "CompiledPattern":
+        """Compile a pattern without parameters. Meant to be called at module level."""
+        self.fixed_compiles += 1
+        return self._compile(pattern, flags)
+
+    def cached(self, pattern: str, flags: int = 0) -> "CompiledPattern":
+        """Return a compiled parametric pattern, compiling it only the first time it is used."""
+        key = (pattern, flags)
+        compiled = self.cache.get(key)
+        if compiled is not None:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return compiled
+
+        compiled = self._compile(pattern, flags)
+        self.cached_compiles += 1
+        self.cache[key] = compiled
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+        return compiled
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "fixed_compiles": self.fixed_compiles,
+            "cached_compiles": self.cached_compiles,
+            "hits": self.hits,
+            "evictions": self.evictions,
+            "compile_time": self.compile_time,
+        }
+
+
+CompiledPattern = Union[Pattern, TerraformCountedPattern]
+
+registry = TerraformPatternRegistry()
+
+
+def fixed(pattern: str, flags: int = 0) -> CompiledPattern:
+    return registry.fixed(pattern, flags)
+
+
+def cached(pattern: str, flags: int = 0) -> CompiledPattern:
+    return registry.cached(pattern, flags)
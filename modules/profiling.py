@@ -0,0 +1,41 @@
+import contextlib
+import time
+from typing import Dict, Iterator
+from modules import metrics, patterns
+
+
+class TerraformProfiler:
+    """
+    Collects the time spent in each pipeline stage. In batch mode the times of
+    all exports are added up per stage.
+    """
+
+    def __init__(self):
+        self.stage_times: Dict[str, float] = {}  # Stage name -> seconds, in run order
+
+    @contextlib.contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        previous_stage = metrics.registry.set_stage(name)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] = self.stage_times.get(name, 0.0) + time.perf_counter() - start
+            metrics.registry.set_stage(previous_stage)
+
+    def report(self) -> str:
+        """Render the stage timings, the scan work of each stage and the regex registry statistics."""
+        width = max([len(name) for name in self.stage_times] + [len("total")])
+        lines = ["Profile:"]
+        for name, seconds in self.stage_times.items():
+            lines.append(f"  {name.ljust(width)}  {seconds * 1000:9.1f} ms")
+        lines.append(f"  {'total'.ljust(width)}  {sum(self.stage_times.values()) * 1000:9.1f} ms")
+
+        lines.extend(metrics.registry.report_lines())
+
+        stats = patterns.registry.stats()
+        lines.append(
+            f"Regex patterns: {stats['fixed_compiles']} fixed and {stats['cached_compiles']} parametric compiled "
+            f"in {stats['compile_time'] * 1000:.1f} ms, {stats['hits']} cache hits, {stats['evictions']} evictions"
+        )
+        return "\n".join(lines)
@@ -1,14 +1,46 @@
 import re
-import os
-import shutil
+from modules import metrics, patterns
+from modules.convert_imports_tf import KEYED_RESOURCES, NETWORKS
+from modules.export_reader import TerraformExportReader, open_export
+from modules.output_writer import TerraformOutputWriter
+from modules.snapshot import TerraformSnapshot
+from modules.tfvars import STRING_LITERAL, hash_buckets, parse_literal, parse_string, unique_keys
+
+_QUOTED_VALUE_PATTERN = patterns.fixed(r'=\s*"([^"]+)"')
+_NUMBER_VALUE_PATTERN = patterns.fixed(r'=\s*(\d+)')
+_EDGE_HOSTNAME_RESOURCE_PATTERN = patterns.fixed(r'resource\s+"akamai_edge_hostname"\s+"([^"]+)"\s+{')
+_IP_BEHAVIOR_PATTERN = patterns.fixed(rf'ip_behavior\s+=\s+{STRING_LITERAL}')
+_EDGE_HOSTNAME_PATTERN = patterns.fixed(rf'edge_hostname\s+=\s+{STRING_LITERAL}')
+_CERTIFICATE_PATTERN = patterns.fixed(r'certificate\s+=\s+(\d+)')
+_PROPERTY_RESOURCE_PATTERN = patterns.fixed(r'resource\s+"akamai_property"\s+"([^"]+)"\s+{')
+_NAME_PATTERN = patterns.fixed(rf'name\s+=\s+{STRING_LITERAL}')
+_PRODUCT_ID_PATTERN = patterns.fixed(rf'product_id\s+=\s+{STRING_LITERAL}')
+_HOSTNAMES_BLOCK_PATTERN = patterns.fixed(r'hostnames\s+{')
+_CNAME_FROM_PATTERN = patterns.fixed(rf'cname_from\s+=\s+{STRING_LITERAL}')
+_CNAME_TO_PATTERN = patterns.fixed(r'cname_to\s+=\s+([^\n]+)')
+_CERT_PROVISIONING_TYPE_PATTERN = patterns.fixed(rf'cert_provisioning_type\s+=\s+{STRING_LITERAL}')
+_ACTIVATION_RESOURCE_PATTERN = patterns.fixed(r'resource\s+"akamai_property_activation"\s+"([^"]+)"\s+{')
+_CONTACT_PATTERN = patterns.fixed(r'"((?:[^"\\\n]|\\.)+@(?:[^"\\\n]|\\.)+)"')
+_VARIABLE_BLOCK_PATTERN = patterns.fixed(r'variable\s+"([^"]+)"\s+{', re.DOTALL)
+_EDGE_HOSTNAME_BLOCK_PATTERN = patterns.fixed(r'resource\s+"akamai_edge_hostname"\s+"[^"]+"\s+{[^}]+}', re.DOTALL)
+_PROPERTY_HOSTNAME_BLOCK_PATTERN = patterns.fixed(r'resource\s+"akamai_property_hostname"\s+"[^"]+"\s+{[^}]+}', re.DOTALL)
+_BLANK_LINES_PATTERN = patterns.fixed(r'\n{3,}')
+_PROVIDER_BLOCK_PATTERN = patterns.fixed(r'provider\s+"akamai"\s+{[^}]+}', re.DOTALL)
+
+
+# Attributes set by parse_property_file
+_PARSED_ATTRIBUTES = ("edge_hostnames", "edge_hostname_keys", "property_params", "activation_params", "hostnames", "property_name")
 
 
 class TerraformPropertyConverter:
-    def __init__(self, property_file: str = "property.tf"):
+    def __init__(self, property_file: str = "property.tf", hostname_bucket_threshold: int = 0, tfvars_bucket_size: int = 500):
         self.property_file = property_file
+        self.hostname_bucket_threshold = hostname_bucket_threshold  # Hostname count above which hostname buckets are used, 0 to never use them
+        self.tfvars_bucket_size = tfvars_bucket_size  # Average hostnames per property_hostname_buckets entry
         self.variables_file = "variables.tf"
         self.tfvars_file = "terraform.tfvars"
         self.edge_hostnames = []
+        self.edge_hostname_keys = {}  # Edge hostname resource name -> for_each key, from the hostname
         self.property_params = {}
         self.version_notes = ""
         self.activation_params = {}
@@ -39,8 +71,10 @@ class TerraformPropertyConverter:
                 elif char == '}':
                     open_braces -= 1
                     if open_braces == 0:
+                        metrics.count_block(i + 1 - block_start)
                         return content[block_start:i+1], block_start, i+1
         
+        metrics.add("chars_scanned", len(content) - block_start)
         return "", block_start, block_start  # In case of unbalanced braces
 
     def _kebab_to_snake(self, name: str) -> str:
@@ -49,34 +83,30 @@ class TerraformPropertyConverter:
 
     def _extract_quoted_value(self, line: str) -> str:
         """Extract value within quotes from a line"""
-        match = re.search(r'=\s*"([^"]+)"', line)
+        match = _QUOTED_VALUE_PATTERN.search(line)
         if match:
             return match.group(1)
         return None
 
     def _extract_number_value(self, line: str) -> str:
         """Extract numeric value from a line"""
-        match = re.search(r'=\s*(\d+)', line)
+        match = _NUMBER_VALUE_PATTERN.search(line)
         if match:
             return match.group(1)
         return None
 
-    def parse_property_file(self, input_dir) -> None:
+    def parse_property_file(self, export: TerraformExportReader) -> None:
         """
         Parse the property.tf file and extract parameters
         """
-        input_property_file_path = os.path.join(input_dir, self.property_file)
-
         try:
-            with open(input_property_file_path, 'r') as f:
-                content = f.read()
+            content = export.read(self.property_file)
         except FileNotFoundError:
-            print(f"Error: File {input_property_file_path} not found")
+            print(f"Error: File {export.path(self.property_file)} not found")
             return
         
         # Extract edge_hostname resources
-        edge_hostname_pattern = r'resource\s+"akamai_edge_hostname"\s+"([^"]+)"\s+{'
-        for match in re.finditer(edge_hostname_pattern, content):
+        for match in _EDGE_HOSTNAME_RESOURCE_PATTERN.finditer(content):
             resource_name = match.group(1)
             block_start = match.end() - 1
             block, start, end = self._extract_block_content(content, block_start)
@@ -88,23 +118,22 @@ class TerraformPropertyConverter:
             edge_hostname["resource_name"] = resource_name
             
             # Extract parameters
-            ip_behavior_match = re.search(r'ip_behavior\s+=\s+"([^"]+)"', block)
+            ip_behavior_match = _IP_BEHAVIOR_PATTERN.search(block)
             if ip_behavior_match:
-                edge_hostname["ip_behavior"] = ip_behavior_match.group(1)
+                edge_hostname["ip_behavior"] = parse_string(ip_behavior_match.group(1))
             
-            hostname_match = re.search(r'edge_hostname\s+=\s+"([^"]+)"', block)
+            hostname_match = _EDGE_HOSTNAME_PATTERN.search(block)
             if hostname_match:
-                edge_hostname["edge_hostname"] = hostname_match.group(1)
+                edge_hostname["edge_hostname"] = parse_string(hostname_match.group(1))
             
-            cert_match = re.search(r'certificate\s+=\s+(\d+)', block)
+            cert_match = _CERTIFICATE_PATTERN.search(block)
             if cert_match:
                 edge_hostname["certificate"] = cert_match.group(1)
             
             self.edge_hostnames.append(edge_hostname)
         
         # Extract property resource
-        property_pattern = r'resource\s+"akamai_property"\s+"([^"]+)"\s+{'
-        for match in re.finditer(property_pattern, content):
+        for match in _PROPERTY_RESOURCE_PATTERN.finditer(content):
             property_name = match.group(1)
             self.property_name = property_name
             block_start = match.end() - 1
@@ -114,16 +143,16 @@ class TerraformPropertyConverter:
                 continue
             
             # Extract property parameters
-            name_match = re.search(r'name\s+=\s+"([^"]+)"', block)
+            name_match = _NAME_PATTERN.search(block)
             if name_match:
-                self.property_params["name"] = name_match.group(1)
+                self.property_params["name"] = parse_string(name_match.group(1))
             
-            product_id_match = re.search(r'product_id\s+=\s+"([^"]+)"', block)
+            product_id_match = _PRODUCT_ID_PATTERN.search(block)
             if product_id_match:
-                self.property_params["product_id"] = product_id_match.group(1)
+                self.property_params["product_id"] = parse_string(product_id_match.group(1))
             
             # Extract hostnames
-            hostname_blocks = re.finditer(r'hostnames\s+{', block)
+            hostname_blocks = _HOSTNAMES_BLOCK_PATTERN.finditer(block)
             for hostname_match in hostname_blocks:
                 hostname_start = hostname_match.end() - 1
                 hostname_block, h_start, h_end = self._extract_block_content(block, hostname_start)
@@ -133,34 +162,34 @@ class TerraformPropertyConverter:
                 
                 hostname = {}
 
-                cname_from_match = re.search(r'cname_from\s+=\s+"([^"]+)"', hostname_block)
+                cname_from_match = _CNAME_FROM_PATTERN.search(hostname_block)
                 if cname_from_match:
-                    hostname["cname_from"] = cname_from_match.group(1)
+                    hostname["cname_from"] = parse_string(cname_from_match.group(1))
                 
-                cname_to_match = re.search(r'cname_to\s+=\s+([^\n]+)', hostname_block)
+                cname_to_match = _CNAME_TO_PATTERN.search(hostname_block)
 
                 if cname_to_match:
                     value = cname_to_match.group(1).strip()
                     # Check if this is a reference or a literal
                     if value.startswith('"') and value.endswith('"'):
                         # It's a literal string
-                        hostname["cname_to"] = value.strip('"')
+                        hostname["cname_to"] = parse_literal(value)
 
                     elif "akamai_edge_hostname" in value:
                         # It's a reference to an edge hostname resource
                         parts = value.split(".")
+                        hostname["edge_hostname_resource"] = parts[1]
                         value = parts[1].replace("-", ".")
                         hostname["cname_to"] = value
        
-                cert_type_match = re.search(r'cert_provisioning_type\s+=\s+"([^"]+)"', hostname_block)
+                cert_type_match = _CERT_PROVISIONING_TYPE_PATTERN.search(hostname_block)
                 if cert_type_match:
-                    hostname["cert_provisioning_type"] = cert_type_match.group(1)
+                    hostname["cert_provisioning_type"] = parse_string(cert_type_match.group(1))
                 
                 self.hostnames.append(hostname)
         
         # Extract activation resources
-        activation_pattern = r'resource\s+"akamai_property_activation"\s+"([^"]+)"\s+{'
-        for match in re.finditer(activation_pattern, content):
+        for match in _ACTIVATION_RESOURCE_PATTERN.finditer(content):
             activation_name = match.group(1)
             block_start = match.end() - 1
             block, start, end = self._extract_block_content(content, block_start)
@@ -178,28 +207,75 @@ class TerraformPropertyConverter:
             
             if network:
                 contacts = []
-                contact_matches = re.findall(r'"([^"]+@[^"]+)"', block)
-                contacts.extend(contact_matches)
+                contact_matches = _CONTACT_PATTERN.findall(block)
+                contacts.extend(parse_string(contact) for contact in contact_matches)
                 
                 if contacts:
                     self.activation_params[f"{network.lower()}_contacts"] = contacts
 
-    def update_variables_tf(self, output_dir) -> None:
+        self.index_hostname_keys()
+
+    def parsed_model(self) -> dict:
+        """The result of parse_property_file, for the snapshot of the export."""
+        return {name: getattr(self, name) for name in _PARSED_ATTRIBUTES}
+
+    def load_parsed_model(self, model: dict) -> None:
+        """Take the property data from a snapshot instead of parsing property.tf."""
+        for name in _PARSED_ATTRIBUTES:
+            setattr(self, name, model[name])
+
+    def index_hostname_keys(self) -> None:
+        """
+        Key the edge hostnames by their hostname and the property hostnames by cname_from, so
+        adding or removing a hostname only changes its own for_each entry.
+        """
+        edge_hostname_keys = unique_keys(
+            [hostname.get("edge_hostname") or hostname.get("resource_name", "") for hostname in self.edge_hostnames],
+            fallback="edge_hostname",
+        )
+        for hostname, key in zip(self.edge_hostnames, edge_hostname_keys):
+            hostname["key"] = key
+            self.edge_hostname_keys[hostname.get("resource_name", key)] = key
+
+        hostname_keys = unique_keys([hostname.get("cname_from", "") for hostname in self.hostnames], fallback="hostname")
+        for hostname, key in zip(self.hostnames, hostname_keys):
+            hostname["key"] = key
+
+    def uses_hostname_buckets(self) -> bool:
+        return self.hostname_bucket_threshold > 0 and len(self.hostnames) > self.hostname_bucket_threshold
+
+    def hostname_buckets(self) -> dict:
+        """
+        Split the hostnames into entries of about tfvars_bucket_size hostnames by a hash of cname_from.
+        A bucket references the edge hostname resource by its key, so cname_to is the actual
+        edge hostname.
+        """
+        edge_hostnames = {hostname.get("resource_name"): hostname.get("edge_hostname") for hostname in self.edge_hostnames}
+        property_hostnames = {}
+        for hostname in self.hostnames:
+            cname_to = edge_hostnames.get(hostname.get("edge_hostname_resource")) or hostname.get("cname_to", "")
+            property_hostnames[hostname["key"]] = {
+                "cname_from": hostname.get("cname_from", ""),
+                "cname_to": cname_to,
+                "cert_provisioning_type": hostname.get("cert_provisioning_type", "CPS_MANAGED"),
+            }
+        return hash_buckets(property_hostnames, self.tfvars_bucket_size, "bucket")
+
+    def update_variables_tf(self, writer: TerraformOutputWriter) -> None:
         """
         Update variables.tf with extracted parameters
         """
-        variables_file_path = os.path.join(output_dir, self.variables_file)
+        variables_file_path = writer.path(self.variables_file)
         existing_vars = set()
         existing_content = ""
         
         # Read existing variables if file exists
-        if os.path.exists(variables_file_path):
-            with open(variables_file_path, 'r') as f:
-                existing_content = f.read()
-                var_blocks = re.finditer(r'variable\s+"([^"]+)"\s+{', existing_content, re.DOTALL)
-                for match in var_blocks:
-                    var_name = match.group(1)
-                    existing_vars.add(var_name)
+        if writer.exists(self.variables_file):
+            existing_content = writer.read(self.variables_file)
+            var_blocks = _VARIABLE_BLOCK_PATTERN.finditer(existing_content)
+            for match in var_blocks:
+                var_name = match.group(1)
+                existing_vars.add(var_name)
         
         # Prepare new variable definitions
         new_vars_content = existing_content if existing_content else ""
@@ -241,7 +317,19 @@ variable "version_notes" {
 """
        
         # Add hostnames variable
-        if self.hostnames and "property_hostnames" not in existing_vars:
+        if self.uses_hostname_buckets() and "property_hostname_buckets" not in existing_vars:
+            new_vars_content += """
+# Property Hostname Buckets
+variable "property_hostname_buckets" {
+  description = "Hostnames of the property by bucket, keyed by cname_from"
+  type = map(map(object({
+    cname_from             = string
+    cname_to               = string
+    cert_provisioning_type = string
+  })))
+}
+"""
+        elif self.hostnames and "property_hostnames" not in existing_vars:
             new_vars_content += """
 # Property Hostnames
 variable "property_hostnames" {
@@ -266,95 +354,53 @@ variable "activation_contacts" {
 """
         
         # Write the variables file
-        with open(variables_file_path, 'w') as f:
-            f.write(new_vars_content)
+        writer.write(self.variables_file, new_vars_content)
             
         print(f"Updated {variables_file_path} with new variable definitions")
 
-    def update_tfvars(self, output_dir) -> None:
+    def update_tfvars(self, writer: TerraformOutputWriter) -> None:
         """
         Update terraform.tfvars with extracted values
         """
-        tfvars_file_path = os.path.join(output_dir, self.tfvars_file)
-        existing_content = ""
-        
-        # Read existing tfvars if file exists
-        if os.path.exists(tfvars_file_path):
-            with open(tfvars_file_path, 'r') as f:
-                existing_content = f.read()
-        
-        new_tfvars_content = existing_content if existing_content else ""
+        tfvars_file_path = writer.path(self.tfvars_file)
+        tfvars = writer.tfvars
         
         # Add edge hostname values
-        if self.edge_hostnames and "edge_hostnames = {" not in existing_content:
-            new_tfvars_content += "\n# Edge Hostnames\nedge_hostnames = {\n"
-            for hostname in self.edge_hostnames:
-                resource_name = hostname.get("resource_name", "unknown")
-                new_tfvars_content += f'  "{resource_name}" = {{\n'
-                
-                if "ip_behavior" in hostname:
-                    new_tfvars_content += f'    ip_behavior   = "{hostname["ip_behavior"]}"\n'
-                else:
-                    new_tfvars_content += f'    ip_behavior   = "IPV6_COMPLIANCE"\n'
-                    
-                if "edge_hostname" in hostname:
-                    new_tfvars_content += f'    edge_hostname = "{hostname["edge_hostname"]}"\n'
-                else:
-                    new_tfvars_content += f'    edge_hostname = ""\n'
-                    
-                if "certificate" in hostname:
-                    new_tfvars_content += f'    certificate   = {hostname["certificate"]}\n'
-                else:
-                    new_tfvars_content += f'    certificate   = 0\n'
-                    
-                new_tfvars_content += "  },\n"
-            new_tfvars_content += "}\n"
+        if self.edge_hostnames and "edge_hostnames" not in tfvars:
+            edge_hostnames = {}
+            for hostname in sorted(self.edge_hostnames, key=lambda hostname: hostname["key"]):
+                edge_hostnames[hostname["key"]] = {
+                    "ip_behavior": hostname.get("ip_behavior", "IPV6_COMPLIANCE"),
+                    "edge_hostname": hostname.get("edge_hostname", ""),
+                    "certificate": int(hostname.get("certificate", 0)),
+                }
+            tfvars.set("edge_hostnames", edge_hostnames, comment="Edge Hostnames")
+            writer.resource_keys["akamai_edge_hostname"] = dict(self.edge_hostname_keys)
         
         # Add property config
-        if self.property_params and "property_config = {" not in existing_content:
-            new_tfvars_content += "\n# Property Configuration\nproperty_config = {\n"
-            if "name" in self.property_params:
-                new_tfvars_content += f'  name       = "{self.property_params["name"]}"\n'
-            else:
-                new_tfvars_content += f'  name       = ""\n'
-                
-            if "product_id" in self.property_params:
-                new_tfvars_content += f'  product_id = "{self.property_params["product_id"]}"\n'
-            else:
-                new_tfvars_content += f'  product_id = ""\n'
-                
-            new_tfvars_content += "}\n"
+        if self.property_params and "property_config" not in tfvars:
+            tfvars.set("property_config", {
+                "name": self.property_params.get("name", ""),
+                "product_id": self.property_params.get("product_id", ""),
+            }, comment="Property Configuration")
         
         # Add property version notes
-        new_tfvars_content += f'version_notes = "Deployed by Terraform"\n'
+        tfvars.set("version_notes", "Deployed by Terraform")
 
         # Add hostnames
-        if self.hostnames and "property_hostnames = {" not in existing_content:
-            new_tfvars_content += "\n# Property Hostnames\nproperty_hostnames = {\n"
-            for i, hostname in enumerate(self.hostnames):
-                key = f"hostname_{i+1}"
-                new_tfvars_content += f'  "{key}" = {{\n'
-                
-                # Handle cname_from safely
-                if "cname_from" in hostname:
-                    new_tfvars_content += f'    cname_from             = "{hostname["cname_from"]}"\n'
-                else:
-                    new_tfvars_content += f'    cname_from             = ""\n'
-                
-                # Handle cname_to safely                
-                if "cname_to" in hostname:
-                    new_tfvars_content += f'    cname_to               = "{hostname["cname_to"]}"\n'
-                else:
-                    new_tfvars_content += f'    cname_to               = ""\n'                
-                
-                # Handle cert_provisioning_type safely
-                if "cert_provisioning_type" in hostname:
-                    new_tfvars_content += f'    cert_provisioning_type = "{hostname["cert_provisioning_type"]}"\n'
-                else:
-                    new_tfvars_content += f'    cert_provisioning_type = "CPS_MANAGED"\n'
-                    
-                new_tfvars_content += "  },\n"
-            new_tfvars_content += "}\n"
+        if self.uses_hostname_buckets() and "property_hostname_buckets" not in tfvars:
+            buckets = self.hostname_buckets()
+            tfvars.set("property_hostname_buckets", buckets, comment="Property Hostname Buckets")
+            print(f"Moved {len(self.hostnames)} hostnames to {len(buckets)} property_hostname_buckets entries of about {self.tfvars_bucket_size} hostnames")
+        elif self.hostnames and "property_hostnames" not in tfvars:
+            property_hostnames = {}
+            for hostname in sorted(self.hostnames, key=lambda hostname: hostname["key"]):
+                property_hostnames[hostname["key"]] = {
+                    "cname_from": hostname.get("cname_from", ""),
+                    "cname_to": hostname.get("cname_to", ""),
+                    "cert_provisioning_type": hostname.get("cert_provisioning_type", "CPS_MANAGED"),
+                }
+            tfvars.set("property_hostnames", property_hostnames, comment="Property Hostnames")
         
         # Add activation parameters
         if self.activation_params:
@@ -364,49 +410,52 @@ variable "activation_contacts" {
                 if key.endswith("_contacts") and isinstance(values, list):
                     contacts.extend(values)
             
-            if contacts and "activation_contacts = [" not in existing_content:
-                new_tfvars_content += "\n# Activation Contacts\nactivation_contacts = [\n"
-                for contact in set(contacts):  # Use set to remove duplicates
-                    new_tfvars_content += f'  "{contact}",\n'
-                new_tfvars_content += "]\n"
-        
-        # Write the tfvars file
-        with open(tfvars_file_path, 'w') as f:
-            f.write(new_tfvars_content)
+            if contacts and "activation_contacts" not in tfvars:
+                # Remove duplicates while keeping the order stable
+                tfvars.set("activation_contacts", list(dict.fromkeys(contacts)), comment="Activation Contacts")
             
         print(f"Updated {tfvars_file_path} with new variable values")
 
     
-    def replace_in_property_file(self, input_dir, output_dir) -> None:
+    def hostname_bucket_resource(self) -> str:
         """
-        Replace hardcoded values in property.tf with variable references while preserving activation resources
+        Render the hostname bucket of each network. A property has a single hostname bucket
+        per network, so one akamai_property_hostname_bucket per network holds the hostnames of
+        all buckets, keyed staging and production. The provider only sends the hostnames that
+        changed, and the buckets keep the changes of a hostname to one entry of the tfvars.
         """
-        input_property_file_path = os.path.join(input_dir, self.property_file)
-        output_property_file_path = os.path.join(output_dir, self.property_file)
+        networks = ", ".join(f'"{network}"' for network in NETWORKS)
+        return f"""resource "akamai_property_hostname_bucket" "{KEYED_RESOURCES['akamai_property_hostname_bucket']}" {{
+  for_each = {{ for network in [{networks}] : lower(network) => network }}
 
-        # Copy the file
-        shutil.copy(input_property_file_path, output_property_file_path)
+  property_id   = akamai_property.{self.property_name}.id
+  contract_id   = var.contract_id
+  group_id      = var.group_id
+  network       = each.value
+  note          = var.version_notes
+  notify_emails = var.activation_contacts
+  hostnames = {{
+    for cname_from, hostname in merge(values(var.property_hostname_buckets)...) : cname_from => {{
+      cert_provisioning_type = hostname.cert_provisioning_type
+      edge_hostname_id       = akamai_edge_hostname.edge_hostnames[hostname.cname_to].id
+    }}
+  }}
+}}"""
+
+    def replace_in_property_file(self, export: TerraformExportReader, writer: TerraformOutputWriter) -> None:
+        """
+        Replace hardcoded values in property.tf with variable references while preserving activation resources
+        """
+        output_property_file_path = writer.path(self.property_file)
 
         try:
-            with open(output_property_file_path, 'r') as f:
-                content = f.read()
+            content = export.read(self.property_file)
         except FileNotFoundError:
-            print(f"Error: File {output_property_file_path} not found")
+            print(f"Error: File {export.path(self.property_file)} not found")
             return
         
-        # Make a backup of the original file
-        backup_file = f"{output_property_file_path}.bak"
-        with open(backup_file, 'w') as f:
-            f.write(content)
-        print(f"Created backup of {output_property_file_path} to {backup_file}")
-        
         # First, remove all edge_hostname resource blocks
-        updated_content = re.sub(
-            r'resource\s+"akamai_edge_hostname"\s+"[^"]+"\s+{[^}]+}',
-            '',
-            content,
-            flags=re.DOTALL
-        )
+        updated_content = _EDGE_HOSTNAME_BLOCK_PATTERN.sub('', content)
         
         # Now add a single edge_hostname resource with for_each
         edge_hostname_block = """resource "akamai_edge_hostname" "edge_hostnames" {
@@ -421,30 +470,34 @@ variable "activation_contacts" {
 }"""
     
         # Find the property resource block using a simpler pattern
-        property_start_pattern = r'resource\s+"akamai_property"\s+"{0}"\s+{{'.format(re.escape(self.property_name))
-        property_start_match = re.search(property_start_pattern, updated_content)
+        property_start_pattern = patterns.cached(r'resource\s+"akamai_property"\s+"{0}"\s+{{'.format(re.escape(self.property_name)))
+        property_start_match = property_start_pattern.search(updated_content)
         
         if property_start_match:
             block_start = property_start_match.start()
             # Extract the entire property block
             property_block, _, block_end = self._extract_block_content(updated_content, block_start)
             
-            # Prepare the property replacement
+            # Prepare the property replacement, whose hostnames are either inline or in hostname buckets
+            if self.uses_hostname_buckets():
+                hostnames_block = "  use_hostname_bucket = true\n"
+            else:
+                hostnames_block = """  dynamic "hostnames" {
+    for_each = var.property_hostnames
+    content {
+      cname_from             = hostnames.value.cname_from
+      cname_to               = hostnames.value.cname_to
+      cert_provisioning_type = hostnames.value.cert_provisioning_type
+    }
+  }
+"""
             property_replacement = f"""resource "akamai_property" "{self.property_name}" {{
   name        = var.property_config.name
   contract_id = var.contract_id
   group_id    = var.group_id
   product_id  = var.property_config.product_id
 
-  dynamic "hostnames" {{
-    for_each = var.property_hostnames
-    content {{
-      cname_from             = hostnames.value.cname_from
-      cname_to               = hostnames.value.cname_to
-      cert_provisioning_type = hostnames.value.cert_provisioning_type
-    }}
-  }}
-  rule_format   = data.akamai_property_rules_builder.{self.property_name}_rule_default.rule_format
+{hostnames_block}  rule_format   = data.akamai_property_rules_builder.{self.property_name}_rule_default.rule_format
   rules         = data.akamai_property_rules_builder.{self.property_name}_rule_default.json
   version_notes = var.version_notes
 }}"""
@@ -453,18 +506,13 @@ variable "activation_contacts" {
             updated_content = updated_content[:block_start] + property_replacement + updated_content[block_end:]
         
         # Remove any separate akamai_property_hostname resources
-        updated_content = re.sub(
-            r'resource\s+"akamai_property_hostname"\s+"[^"]+"\s+{[^}]+}',
-            '',
-            updated_content,
-            flags=re.DOTALL
-        )
+        updated_content = _PROPERTY_HOSTNAME_BLOCK_PATTERN.sub('', updated_content)
         
         # Clean up any potential extra spaces or newlines
-        updated_content = re.sub(r'\n{3,}', '\n\n', updated_content)
+        updated_content = _BLANK_LINES_PATTERN.sub('\n\n', updated_content)
         
         # Insert the edge_hostname block after terraform/provider blocks but before property blocks
-        provider_match = re.search(r'provider\s+"akamai"\s+{[^}]+}', updated_content, re.DOTALL)
+        provider_match = _PROVIDER_BLOCK_PATTERN.search(updated_content)
         if provider_match:
             insert_position = provider_match.end()
             updated_content = updated_content[:insert_position] + "\n\n" + edge_hostname_block + updated_content[insert_position:]
@@ -506,20 +554,27 @@ variable "activation_contacts" {
 }}"""
         
             # Rebuild the file with only the content we want
+            if self.uses_hostname_buckets():
+                base_content += "\n\n" + self.hostname_bucket_resource()
             updated_content = base_content + "\n\n" + staging_activation + "\n\n" + production_activation
         
         # Clean up any potential extra spaces or newlines
-        updated_content = re.sub(r'\n{3,}', '\n\n', updated_content)
+        updated_content = _BLANK_LINES_PATTERN.sub('\n\n', updated_content)
         
         # Write the updated content back
-        with open(output_property_file_path, 'w') as f:
-            f.write(updated_content)
+        writer.write(self.property_file, updated_content)
             
         print(f"Updated {output_property_file_path} with variable references, dynamic hostnames block, and activation resources")
 
-def parameterize_property_resources(input_dir, output_dir):
-    converter = TerraformPropertyConverter(property_file="property.tf")
-    converter.parse_property_file(input_dir)
+def parameterize_property_resources(export: TerraformExportReader, writer: TerraformOutputWriter, hostname_bucket_threshold: int = 0, tfvars_bucket_size: int = 500, snapshot: TerraformSnapshot = None):
+    converter = TerraformPropertyConverter(property_file="property.tf", hostname_bucket_threshold=hostname_bucket_threshold, tfvars_bucket_size=tfvars_bucket_size)
+    model = snapshot.get("property_parameterization") if snapshot else None
+    if model is not None:
+        converter.load_parsed_model(model)
+    else:
+        converter.parse_property_file(export)
+        if snapshot and export.exists(converter.property_file):
+            snapshot.put("property_parameterization", converter.parsed_model())
     
     print("\nExtracted Edge Hostnames:")
     for hostname in converter.edge_hostnames:
@@ -538,9 +593,11 @@ def parameterize_property_resources(input_dir, output_dir):
         print(f"  {key}: {value}")
     
     # Update files
-    converter.update_variables_tf(output_dir)
-    converter.update_tfvars(output_dir)
-    converter.replace_in_property_file(input_dir, output_dir)
+    converter.update_variables_tf(writer)
+    converter.update_tfvars(writer)
+    converter.replace_in_property_file(export, writer)
 
 if __name__ == "__main__":
-    parameterize_property_resources(input_dir="../test", output_dir="../result")
\ No newline at end of file
+    writer = TerraformOutputWriter(output_dir="../result")
+    parameterize_property_resources(export=open_export("../test"), writer=writer)
+    writer.commit()
\ No newline at end of file
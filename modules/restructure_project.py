@@ -1,50 +1,57 @@
 import os
 import re
-import shutil
+from modules import patterns
+from modules.environments import TerraformEnvironments, split_shared_tfvars
+from modules.output_writer import TerraformOutputWriter
+from modules.tfvars import TerraformTfvars, tfvars_file_name
+
+_PROVIDER_BLOCK_PATTERN = patterns.fixed(r'provider\s+"[^"]+"\s+{([^}]+)}', re.DOTALL)
 
 
 class TerraformProjectRestructure:
-    def __init__(self, output_dir: str = "./result"):
-        self.input_dir = output_dir
-        self.output_dir = output_dir
-        self.modules_dir = os.path.join(output_dir, "modules", "property")
-        self.environments_dir = os.path.join(output_dir, "environments", "prod")
+    def __init__(self, writer: TerraformOutputWriter, environments: TerraformEnvironments = None, shared_tfvars: bool = False,
+                 tfvars_format: str = "hcl"):
+        self.writer = writer
+        self.environments = environments if environments else TerraformEnvironments()
+        self.shared_tfvars = shared_tfvars
+        self.tfvars_format = tfvars_format
+        self.shared_tfvars_file = "common.auto.tfvars"
+        self.modules_dir = os.path.join("modules", "property")
+        self.environments_root = "environments"
+
+        # Files generated at the root of the staged tree and where they end up
+        self.environment_files = ["provider.tf", "main.tf", "import.tf", "variables.tf", "versions.tf"]
+        self.module_files = ["property.tf", "variables.tf", "versions.tf"]
 
     def split_property_tf(self) -> None:
         """
         Split property.tf into versions.tf, provider.tf, and property.tf.
         """
-        property_tf_path = os.path.join(self.input_dir, "property.tf")
+        property_tf_path = self.writer.path("property.tf")
 
-        if not os.path.exists(property_tf_path):
+        if not self.writer.exists("property.tf"):
             print(f"Error: File {property_tf_path} not found")
             return
 
-        with open(property_tf_path, 'r') as f:
-            content = f.read()
+        content = self.writer.read("property.tf")
 
         # Extract the terraform block
         terraform_block = self._extract_terraform_block(content)
         if terraform_block:
-            versions_tf_path = os.path.join(self.input_dir, "versions.tf")
-            with open(versions_tf_path, 'w') as f:
-                f.write(terraform_block)
-            print(f"Created {versions_tf_path} with terraform block")
+            self.writer.write("versions.tf", terraform_block)
+            print(f"Created {self.writer.path('versions.tf')} with terraform block")
 
         # Extract the provider block
         provider_block = self._extract_provider_block(content)
         if provider_block:
-            provider_tf_path = os.path.join(self.input_dir, "provider.tf")
-            with open(provider_tf_path, 'w') as f:
-                f.write(provider_block)
-            print(f"Created {provider_tf_path} with provider block")
+            self.writer.write("provider.tf", provider_block)
+            print(f"Created {self.writer.path('provider.tf')} with provider block")
 
         # Remove terraform and provider blocks from property.tf
         remaining_content = self._remove_terraform_and_provider_blocks(content)
 
         # Write the remaining content to property.tf
-        with open(property_tf_path, 'w') as f:
-            f.write(remaining_content.strip())
+        self.writer.write("property.tf", remaining_content.strip())
         print(f"Updated {property_tf_path} by removing terraform and provider blocks")
 
     def _extract_terraform_block(self, content: str) -> str:
@@ -84,17 +91,14 @@ class TerraformProjectRestructure:
         # Extract just the inner content (without the outer braces)
         inner_content = content[open_brace_pos+1:pos-1].strip()
         
-        # Format the block with proper indentation
-        formatted_block = f'terraform {{\n{self._indent(inner_content)}\n}}\n'
-        
-        return formatted_block
+        # The indentation is normalized when the output is formatted
+        return f'terraform {{\n{inner_content}\n}}\n'
 
     def _extract_provider_block(self, content: str) -> str:
         """
         Extract the provider block from the content and apply consistent indentation.
         """
-        provider_pattern = r'provider\s+"[^"]+"\s+{([^}]+)}'
-        match = re.search(provider_pattern, content, re.DOTALL)
+        match = _PROVIDER_BLOCK_PATTERN.search(content)
         
         if match:
             # Extract the inner content
@@ -181,64 +185,90 @@ class TerraformProjectRestructure:
         
         return remaining_content
 
-    def _indent(self, text: str, indent_level: int = 2) -> str:
+    def _target_dirs(self, file_name: str) -> list:
         """
-        Indent the given text by the specified number of spaces.
+        Return the final directories of a file generated at the root of the staged tree.
         """
-        indent = " " * indent_level
-        return indent + text.replace("\n", f"\n{indent}")
+        target_dirs = []
+        if file_name in self.environment_files:
+            for env_name in self.environments.names():
+                if file_name == "import.tf" and not self.environments.includes_imports(env_name):
+                    continue
+                target_dirs.append(os.path.join(self.environments_root, env_name))
+        if file_name in self.module_files:
+            target_dirs.append(self.modules_dir)
+        return target_dirs
+
+    def _render_tfvars(self, tfvars: TerraformTfvars) -> str:
+        return tfvars.render_json() if self.tfvars_format == "json" else tfvars.render()
 
-    def create_environments_prod_folder(self) -> None:
+    def map_output_paths(self) -> None:
         """
-        Create the ./environments/prod folder and move/copy files into it.
+        Map the staged files to their final location in the project layout.
+        Files are staged in memory, so restructuring only re-keys the staged content
+        and environments share the same rendered files.
+        Intermediate files without a final location (rules.tf) are dropped.
         """
-        os.makedirs(self.environments_dir, exist_ok=True)
+        staged_files = self.writer.files
+        mapped_files = {}
+        formatted = set()  # Mapped files whose content was emitted in terraform fmt style
 
-        # Move provider.tf, main.tf, import.tf and terraform.tfvars
-        files_to_move = ["provider.tf", "main.tf", "import.tf", "terraform.tfvars"]
-        for file_name in files_to_move:
-            src_path = os.path.join(self.input_dir, file_name)
-            if os.path.exists(src_path):
-                shutil.move(src_path, os.path.join(self.environments_dir, file_name))
-                print(f"Moved {file_name} to {self.environments_dir}")
+        for file_name, content in staged_files.items():
+            # Files already staged under their final directory keep their path
+            if os.path.dirname(file_name):
+                mapped_files[file_name] = content
+                if file_name in self.writer.formatted:
+                    formatted.add(file_name)
+                continue
 
-        # Copy variables.tf and versions.tf
-        files_to_copy = ["variables.tf", "versions.tf"]
-        for file_name in files_to_copy:
-            src_path = os.path.join(self.input_dir, file_name)
-            if os.path.exists(src_path):
-                shutil.copy(src_path, os.path.join(self.environments_dir, file_name))
-                print(f"Copied {file_name} to {self.environments_dir}")
+            target_dirs = self._target_dirs(file_name)
+            if not target_dirs:
+                print(f"Dropped intermediate file {file_name}")
+                continue
 
-    def move_files_to_modules_property(self) -> None:
-        """
-        Move property.tf, versions.tf, and variables.tf to ./modules/property.
-        """
-        files_to_move = ["property.tf", "versions.tf", "variables.tf"]
-        for file_name in files_to_move:
-            src_path = os.path.join(self.input_dir, file_name)
-            if os.path.exists(src_path):
-                shutil.move(src_path, os.path.join(self.modules_dir, file_name))
-                print(f"Moved {file_name} to {self.modules_dir}")
+            for target_dir in target_dirs:
+                mapped_files[os.path.join(target_dir, file_name)] = content
+                if file_name in self.writer.formatted:
+                    formatted.add(os.path.join(target_dir, file_name))
+                print(f"Mapped {file_name} to {target_dir}")
 
-    def cleanup_files(self) -> None:
-        """
-        Remove *.bak files and rules.tf.
-        """
-        files_to_remove = ["rules.tf"]
-        for file_name in files_to_remove:
-            file_path = os.path.join(self.input_dir, file_name)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                print(f"Removed {file_path}")
+        # Render terraform.tfvars for every environment from the same extracted values
+        env_tfvars = {}
+        for env_name in self.environments.names():
+            env_tfvars[env_name] = self.environments.render_tfvars(env_name, self.writer.tfvars)
+
+        # Variables assigned to their own *.auto.tfvars file (e.g. PMUSER shards) are rendered on their own
+        for env_name, tfvars in env_tfvars.items():
+            env_dir = os.path.join(self.environments_root, env_name)
+            files = tfvars.split_files()
+            for file_name, file_tfvars in files.items():
+                if file_name is not None and file_tfvars.names():
+                    file_name = tfvars_file_name(file_name, self.tfvars_format)
+                    mapped_files[os.path.join(env_dir, file_name)] = self._render_tfvars(file_tfvars)
+                    formatted.add(os.path.join(env_dir, file_name))
+                    print(f"Rendered {file_name} for {env_dir}")
+            env_tfvars[env_name] = files[None]
+
+        shared_content = None
+        if self.shared_tfvars and len(env_tfvars) > 1:
+            shared, env_tfvars = split_shared_tfvars(env_tfvars)
+            shared_content = self._render_tfvars(shared)
+            print(f"Moved {len(shared.names())} variables shared by all environments to {tfvars_file_name(self.shared_tfvars_file, self.tfvars_format)}")
+        elif self.shared_tfvars:
+            print("Shared variables need more than one environment. Skipping.")
 
-        # Remove all *.bak files
-        for root, _, files in os.walk(self.input_dir):
-            for file_name in files:
-                if file_name.endswith(".bak"):
-                    file_path = os.path.join(root, file_name)
-                    os.remove(file_path)
-                    print(f"Removed {file_path}")
+        for env_name, tfvars in env_tfvars.items():
+            env_dir = os.path.join(self.environments_root, env_name)
+            tfvars_file = tfvars_file_name("terraform.tfvars", self.tfvars_format)
+            mapped_files[os.path.join(env_dir, tfvars_file)] = self._render_tfvars(tfvars)
+            formatted.add(os.path.join(env_dir, tfvars_file))
+            if shared_content is not None:
+                mapped_files[os.path.join(env_dir, tfvars_file_name(self.shared_tfvars_file, self.tfvars_format))] = shared_content
+                formatted.add(os.path.join(env_dir, tfvars_file_name(self.shared_tfvars_file, self.tfvars_format)))
+            print(f"Rendered {tfvars_file} for {env_dir}")
+
+        self.writer.files = mapped_files
+        self.writer.formatted = formatted
 
     def restructure(self) -> None:
         """
@@ -247,21 +277,18 @@ class TerraformProjectRestructure:
         # Step 1: Split property.tf
         self.split_property_tf()
 
-        # Step 2: Create environments/prod folder and move/copy files
-        self.create_environments_prod_folder()
-
-        # Step 3: Move files to modules/property
-        self.move_files_to_modules_property()
-
-        # Step 4: Clean up unnecessary files
-        self.cleanup_files()
+        # Step 2: Map files into the environments and modules/property
+        self.map_output_paths()
 
-def restructure_and_cleanup(output_dir):
+def restructure_and_cleanup(writer: TerraformOutputWriter, environments: TerraformEnvironments = None, shared_tfvars: bool = False,
+                            tfvars_format: str = "hcl"):
     # Create an instance of the TerraformProjectRestructure class
-    restructure = TerraformProjectRestructure(output_dir)
+    restructure = TerraformProjectRestructure(writer, environments, shared_tfvars, tfvars_format)
 
     # Restructure the project
     restructure.restructure()
 
 if __name__ == "__main__":
-    restructure_and_cleanup(output_dir="../result")
+    writer = TerraformOutputWriter(output_dir="../result")
+    restructure_and_cleanup(writer)
+    writer.commit()
@@ -0,0 +1,212 @@
+import hashlib
+import json
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from modules import patterns
+from modules.hcl_parser import HclBlock, HclExpression, HclUnresolved, evaluate, parse_hcl, parse_hcl_json
+
+
+RULES_BUILDER = "akamai_property_rules_builder"
+
+_RULES_BLOCK_PATTERN = patterns.fixed(r'rules_v[0-9_]+$')
+_CHILD_REFERENCE_PATTERN = patterns.fixed(rf'data\.{RULES_BUILDER}\.([\w-]+)\.json$')
+
+
+class RuleNode(NamedTuple):
+    data_name: str  # Name of the rule data source
+    content: Dict[str, Any]  # Canonical rule without its children
+    content_hash: str
+    subtree_hash: str  # Hash of the content and of the subtree hashes of the children
+    children: List[Tuple[str, ...]]  # Rule paths of the children, in order
+
+
+class TerraformRuleTree:
+    def __init__(self):
+        self.rules: Dict[str, HclBlock] = {}  # Rule data source name -> rules_v* block
+        self.rule_format = ""
+
+    def load(self, content: str) -> None:
+        """
+        Parse Terraform content and index every akamai_property_rules_builder data source in it.
+        """
+        self.load_root(parse_hcl(content))
+
+    def load_json(self, content: str) -> None:
+        """Index the akamai_property_rules_builder data sources of a file in Terraform JSON syntax."""
+        self.load_root(parse_hcl_json(json.loads(content)))
+
+    def load_root(self, root: HclBlock) -> None:
+        for block in root.find_blocks("data"):
+            if len(block.labels) != 2 or block.labels[0] != RULES_BUILDER:
+                continue
+            rules_blocks = [child for child in block.blocks if _RULES_BLOCK_PATTERN.match(child.type)]
+            if not rules_blocks:
+                continue
+            self.rules[block.labels[1]] = rules_blocks[0]
+            self.rule_format = rules_blocks[0].type
+
+    def default_rule_name(self) -> Optional[str]:
+        return next((name for name in self.rules if name.endswith("_rule_default")), None)
+
+    def _child_names(self, rule: HclBlock) -> List[str]:
+        """Return the data source names referenced by the children attribute of a rule."""
+        children = rule.attributes.get("children")
+        if children is None or children.kind != "list":
+            return []
+        names = []
+        for child in children.value:
+            match = _CHILD_REFERENCE_PATTERN.match(child.source)
+            if match:
+                names.append(match.group(1))
+        return names
+
+    def _canonical_value(self, expr: HclExpression, scope: Dict[str, Any]) -> Any:
+        try:
+            return evaluate(expr, scope)
+        except HclUnresolved:
+            return {"unresolved": expr.source}
+
+    def _canonical_block(self, block: HclBlock, scope: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Convert a block into plain data: attributes are evaluated and nested blocks are
+        grouped by type in order. Dynamic blocks are expanded like Terraform does.
+        """
+        canonical = {}
+        for name, expr in block.attributes.items():
+            if name == "children" and block.type.startswith("rules_v"):
+                continue
+            canonical[name] = self._canonical_value(expr, scope)
+
+        for child in block.blocks:
+            if child.type == "dynamic" and child.labels:
+                block_type = child.labels[0]
+                canonical.setdefault(block_type, []).extend(self._expand_dynamic(child, scope))
+            else:
+                canonical.setdefault(child.type, []).append(self._canonical_block(child, scope))
+
+        # User variables are declared by name and their order is not significant, while
+        # a dynamic block emits them in key order
+        if "variable" in canonical and block.type.startswith("rules_v"):
+            canonical["variable"].sort(key=lambda variable: str(variable.get("name", "")))
+
+        return canonical
+
+    def _expand_dynamic(self, dynamic: HclBlock, scope: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Expand a dynamic block. Maps are iterated in key order, like Terraform."""
+        iterator = dynamic.labels[0]
+        if "iterator" in dynamic.attributes:
+            iterator = dynamic.attributes["iterator"].source
+        contents = dynamic.find_blocks("content")
+
+        try:
+            for_each = evaluate(dynamic.attributes["for_each"], scope)
+        except (HclUnresolved, KeyError):
+            return [{"unresolved": f'dynamic "{dynamic.labels[0]}"'}]
+
+        if isinstance(for_each, dict):
+            items = sorted(for_each.items())
+        else:
+            items = list(enumerate(for_each))
+
+        expanded = []
+        for key, value in items:
+            item_scope = dict(scope)
+            item_scope[iterator] = {"key": key, "value": value}
+            for content in contents:
+                expanded.append(self._canonical_block(content, item_scope))
+        return expanded
+
+    def canonical_rule(self, rule_name: str, scope: Dict[str, Any] = None, _seen: set = None) -> Dict[str, Any]:
+        """
+        Build the canonical form of a rule and all of its children, resolving
+        variable references with the given scope (e.g. {"var": {...}}).
+        """
+        scope = scope if scope is not None else {}
+        seen = _seen if _seen is not None else set()
+        if rule_name in seen or rule_name not in self.rules:
+            return {"missing_rule": rule_name}
+        seen = seen | {rule_name}
+
+        rule = self.rules[rule_name]
+        canonical = self._canonical_block(rule, scope)
+        canonical["children"] = [self.canonical_rule(child, scope, seen) for child in self._child_names(rule)]
+        return canonical
+
+    def rule_nodes(self, scope: Dict[str, Any] = None) -> Dict[Tuple[str, ...], RuleNode]:
+        """
+        Index the rules by rule path, the rule names from the default rule down, e.g.
+        ("default", "Performance", "Compression"). Siblings with the same name get a #2, #3
+        suffix. Every rule is hashed once and a subtree hash is built from the hashes of its
+        children, so identical subtrees of two trees can be skipped with a single comparison.
+        """
+        nodes: Dict[Tuple[str, ...], RuleNode] = {}
+
+        def index(rule_name: str, path: Tuple[str, ...], seen: set) -> str:
+            content = self._canonical_block(self.rules[rule_name], scope if scope is not None else {})
+            children = []
+            names: Dict[str, int] = {}
+            child_hashes = []
+            for child in self._child_names(self.rules[rule_name]):
+                if child in seen or child not in self.rules:
+                    continue
+                name_expr = self.rules[child].attributes.get("name")
+                child_name = str(self._canonical_value(name_expr, {})) if name_expr else child
+                names[child_name] = names.get(child_name, 0) + 1
+                if names[child_name] > 1:
+                    child_name = f"{child_name}#{names[child_name]}"
+                child_path = path + (child_name,)
+                children.append(child_path)
+                child_hashes.append(index(child, child_path, seen | {child}))
+            content_hash = tree_hash(content)
+            subtree_hash = tree_hash({"content": content_hash, "children": child_hashes})
+            nodes[path] = RuleNode(rule_name, content, content_hash, subtree_hash, children)
+            return subtree_hash
+
+        default_rule = self.default_rule_name()
+        if default_rule:
+            index(default_rule, ("default",), {default_rule})
+        return nodes
+
+    def canonical_tree(self, scope: Dict[str, Any] = None) -> Dict[str, Any]:
+        default_rule = self.default_rule_name()
+        if not default_rule:
+            return {}
+        return self.canonical_rule(default_rule, scope)
+
+
+def tree_hash(tree: Dict[str, Any]) -> str:
+    """Return a stable hash of a canonical rule tree."""
+    return hashlib.sha256(json.dumps(tree, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+
+def first_difference(left: Any, right: Any, path: str = "") -> Optional[str]:
+    """
+    Return the path of the first difference between two canonical trees, or None if they are equal.
+    Rules are named by their rule names so the path reads like the Property Manager rule tree.
+    """
+    if isinstance(left, dict) and isinstance(right, dict):
+        if "children" in left and "name" in left:
+            path = f"{path} > {left['name']}" if path else str(left["name"])
+        for key in sorted(set(left) | set(right)):
+            if key not in left or key not in right:
+                return f"{path}.{key}"
+            if key == "children":
+                difference = first_difference(left[key], right[key], path)
+            else:
+                difference = first_difference(left[key], right[key], f"{path}.{key}")
+            if difference:
+                return difference
+        return None
+
+    if isinstance(left, list) and isinstance(right, list):
+        for index, (left_item, right_item) in enumerate(zip(left, right)):
+            item_path = path if left_item and isinstance(left_item, dict) and "children" in left_item else f"{path}[{index}]"
+            difference = first_difference(left_item, right_item, item_path)
+            if difference:
+                return difference
+        if len(left) != len(right):
+            return f"{path} (length {len(left)} != {len(right)})"
+        return None
+
+    if left != right or type(left) != type(right):
+        return f"{path} ({left!r} != {right!r})"
+    return None
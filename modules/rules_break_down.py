@@ -1,9 +1,17 @@
 import re
 import os
+from modules import metrics, patterns
+from modules.output_writer import TerraformOutputWriter
+from modules.snapshot import TerraformSnapshot, content_key
 
-def extract_rule_block(content, rule_name):
+_CHILDREN_PATTERN = patterns.fixed(r'children\s*=\s*\[\s*(.*?)\s*\]', re.DOTALL)
+_CHILD_REFERENCE_PATTERN = patterns.fixed(r'data\.akamai_property_rules_builder\.([\w-]+)\.json')
+_RULE_DECLARATION_PATTERN = patterns.fixed(r'data "akamai_property_rules_builder" "([\w-]+)"')
+
+def find_rule_block(content, rule_name):
+    """Return the (start, end) span of a rule data source in the content, or None."""
     # Find the start position of the rule
-    rule_start_pattern = re.compile(rf'data "akamai_property_rules_builder" "{rule_name}"')
+    rule_start_pattern = patterns.cached(rf'data "akamai_property_rules_builder" "{rule_name}"')
     start_match = rule_start_pattern.search(content)
     
     if not start_match:
@@ -38,23 +46,27 @@ def extract_rule_block(content, rule_name):
                 if brace_count == 0:
                     # We've found the end of the block
                     end_pos = pos + 1
-                    return content[start_pos:end_pos]
+                    metrics.count_block(end_pos - start_pos)
+                    return start_pos, end_pos
         
         pos += 1
     
     return None
 
+def extract_rule_block(content, rule_name):
+    span = find_rule_block(content, rule_name)
+    return content[span[0]:span[1]] if span else None
+
 def extract_children_names(rule_block):
     # Extract child rule references from the children attribute
-    children_pattern = r'children\s*=\s*\[\s*(.*?)\s*\]'
-    children_match = re.search(children_pattern, rule_block, re.DOTALL)
+    children_match = _CHILDREN_PATTERN.search(rule_block)
     
     if not children_match:
         return []
     
     # Extract the rule names from the references
     children_str = children_match.group(1)
-    child_refs = re.findall(r'data\.akamai_property_rules_builder\.([\w-]+)\.json', children_str)
+    child_refs = _CHILD_REFERENCE_PATTERN.findall(children_str)
     return child_refs
 
 def collect_rule_hierarchy(content, rule_names_dict, rule_name, parent_path=None):
@@ -121,30 +133,43 @@ def get_rule_file_mapping(rule_hierarchy, max_depth):
     
     return file_mapping
 
-def split_terraform_file(output_dir, depth):
-    """Split a Terraform file containing Akamai property rules into multiple files based on rule hierarchy."""
-    
-    rules_file_path = os.path.join(output_dir, "rules.tf")
-    module_output_dir = os.path.join(output_dir, "modules/property")
-
-    with open(rules_file_path, 'r') as f:
-        content = f.read()
-    
-    # Ensure output directory exists
-    if not os.path.exists(module_output_dir):
-        os.makedirs(module_output_dir)
-    
+def index_rules(content):
+    """
+    Parse the rule hierarchy and the span of every rule block, which is all the splitting
+    needs from the content whatever the depth. Returns None without a default rule.
+    """
     # Find all rule declarations
-    rule_declarations = re.findall(r'data "akamai_property_rules_builder" "([\w-]+)"', content)
+    rule_declarations = _RULE_DECLARATION_PATTERN.findall(content)
     
     # Find the default rule
     default_rule_name = next((name for name in rule_declarations if '_rule_default' in name), None)
     if not default_rule_name:
-        print("Default rule not found!")
-        return
+        return None
     
     # Build the rule hierarchy
     rule_hierarchy = collect_rule_hierarchy(content, {}, default_rule_name)
+    rule_spans = {rule_name: find_rule_block(content, rule_name) for rule_name in rule_hierarchy}
+    return rule_hierarchy, rule_spans
+
+def split_terraform_file(writer: TerraformOutputWriter, depth, snapshot: TerraformSnapshot = None):
+    """Split a Terraform file containing Akamai property rules into multiple files based on rule hierarchy."""
+    
+    rules_file_path = writer.path("rules.tf")
+    module_output_dir = os.path.join("modules", "property")
+
+    content = writer.read("rules.tf")
+    
+    # The staged rules.tf depends on the parameterization options, so the index is keyed by it
+    rules_key = content_key(content) if snapshot else None
+    rules_index = snapshot.get("rules_break_down", rules_key) if snapshot else None
+    if rules_index is None:
+        rules_index = index_rules(content)
+        if snapshot and rules_index is not None:
+            snapshot.put("rules_break_down", rules_index, rules_key)
+    if rules_index is None:
+        print("Default rule not found!")
+        return
+    rule_hierarchy, rule_spans = rules_index
     
     # Determine which file each rule should go to
     file_mapping = get_rule_file_mapping(rule_hierarchy, depth)
@@ -155,20 +180,21 @@ def split_terraform_file(output_dir, depth):
         if target_file not in file_contents:
             file_contents[target_file] = []
         
-        rule_block = extract_rule_block(content, rule_name)
-        if rule_block:
-            file_contents[target_file].append(rule_block)
+        rule_span = rule_spans.get(rule_name)
+        if rule_span:
+            file_contents[target_file].append(content[rule_span[0]:rule_span[1]])
         else:
             print(f"Failed to extract {rule_name} block!")
     
     # Write the files
     for base_name, blocks in file_contents.items():
         output_file = os.path.join(module_output_dir, f"{base_name}.tf")
-        with open(output_file, 'w') as f:
-            f.write("\n\n".join(blocks))
-        print(f"Created {output_file} with {len(blocks)} rule(s)")
+        writer.write(output_file, "\n\n".join(blocks))
+        print(f"Created {writer.path(output_file)} with {len(blocks)} rule(s)")
     
     print(f"Successfully split {rules_file_path} into {len(file_contents)} files with max depth {depth}")
 
 if __name__ == "__main__":
-    split_terraform_file(output_dir="../result", depth="1")
\ No newline at end of file
+    writer = TerraformOutputWriter(output_dir="../result")
+    split_terraform_file(writer, depth=1)
+    writer.commit()
\ No newline at end of file
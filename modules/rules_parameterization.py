@@ -1,15 +1,51 @@
+import fnmatch
 import re
-import os
-from typing import Dict, List, Any
+from typing import Dict, List, Any, NamedTuple, Optional, Set, Tuple
+from modules import metrics, patterns
+from modules.behavior_schema import TerraformBehaviorSchema, load_behavior_schema
+from modules.hcl_parser import HclParseError, HclUnresolved, evaluate, parse_hcl
+from modules.output_writer import TerraformOutputWriter
+from modules.tfvars import parse_string
+
+_DATA_BLOCK_PATTERN = patterns.fixed(r'data\s+"akamai_property_rules_builder"\s+"([^"]+)"\s+{')
+_RULE_SUFFIX_PATTERN = patterns.fixed(r'rule_(.+)$')
+_RULES_BLOCK_PATTERN = patterns.fixed(r'(rules_v[0-9_]+)\s+{')
+_CRITERION_BLOCK_PATTERN = patterns.fixed(r'(?<!\w)criterion\s+{')
+_CHILDREN_PATTERN = patterns.fixed(r'(?<!\w)children\s*=\s*\[(.*?)\]', re.DOTALL)
+_CHILD_REFERENCE_PATTERN = patterns.fixed(r'data\.akamai_property_rules_builder\.([\w-]+)\.json')
+
+# Criterion options holding the values that the match operator compares the request with
+_VALUE_OPTIONS = ("values", "value")
+_NEGATIVE_OPERATOR_PREFIXES = ("IS_NOT", "DOES_NOT_MATCH")
+
+# A literal value in the rule tree, with one named group per schema type it can have
+_LITERAL_VALUE = r'(?:"(?P<string>(?:[^"\\\n]|\\.)+)"|(?P<bool>true|false)\b|(?P<number>-?\d+(?:\.\d+)?)\b|(?P<list>\[[^\]]*\]))'
+_LITERAL_TYPES = {"string": "string", "bool": "bool", "number": "number", "list": "list(string)"}
+
+
+class ValueMatch(NamedTuple):
+    start: int  # Position of the option name in the block
+    value_start: int  # Position of the value, after the opening quote of a string
+    value_end: int  # Position after the value, before the closing quote of a string
+    value: str  # Text of the value
+    value_type: str  # Terraform type of the value
 
 
 class TerraformRulesParser:
-    def __init__(self, rules_file: str = "rules.tf"):
+    def __init__(self, rules_file: str = "rules.tf", dedup_values: bool = False, criteria_filters: List[Tuple[str, str, str]] = None):
         self.rules_file = rules_file
         self.variables_file = "variables.tf"
         self.tfvars_file = "terraform.tfvars"
+        self.dedup_values = dedup_values
+        self.criteria_filters = criteria_filters or []  # (criterion type, option, pattern), any of them selects a rule
+        self.criteria: Dict[str, List[Dict[str, Any]]] = {}  # Rule data source name -> its criteria (type and options)
+        self.criteria_by_type: Dict[str, List[str]] = {}  # Criterion type -> rules that have it
+        self.parents: Dict[str, str] = {}  # Rule data source name -> parent rule data source name
         self.extracted_values = {}
-        self.replacements = {}  # Tracks positions for replacements
+        self.variable_types = {}  # Terraform type of each extracted variable
+        self.replacements = []  # Tracks positions for replacements
+        self.value_index = {}  # Maps (behavior, path, value) to the variable holding that value
+        self.schema: TerraformBehaviorSchema = None  # Behavior schema of the export rule format
 
     def _extract_block_content(self, content: str, block_start: int) -> tuple:
         """Extract a complete block with balanced braces starting from a position."""
@@ -35,30 +71,139 @@ class TerraformRulesParser:
                 elif char == '}':
                     open_braces -= 1
                     if open_braces == 0:
+                        metrics.count_block(i + 1 - block_start)
                         return content[block_start:i+1], block_start, i+1
         
+        metrics.add("chars_scanned", len(content) - block_start)
         return "", block_start, block_start  # In case of unbalanced braces
 
-    def parse_rules_file(self, target_paths: List[List[str]], output_dir) -> Dict[str, str]:
+    def _match_value(self, path: List[str], final_key: str, block: str) -> Optional[ValueMatch]:
+        """
+        Match the literal value of the final key of a path in a block with a single search.
+        The type is looked up in the behavior schema by behavior and option, and a value of
+        another type (e.g. an expression) is not matched. Paths missing from the schema take
+        the type of the literal found.
+        """
+        value_match = patterns.cached(rf'(?<!\w){final_key}\s+=\s+{_LITERAL_VALUE}').search(block)
+        if not value_match:
+            return None
+        kind = value_match.lastgroup
+        value_type = self.schema.type_of(path) if self.schema else None
+        if value_type is not None and value_type != _LITERAL_TYPES[kind]:
+            return None
+        return ValueMatch(value_match.start(0), value_match.start(kind), value_match.end(kind), value_match.group(kind), _LITERAL_TYPES[kind])
+
+    def _warn_untyped_paths(self, target_paths: List[List[str]]) -> None:
+        """Warn about the paths missing from the schema, whose values are taken whatever their type."""
+        for path in target_paths:
+            if len(path) < 2 or self.schema.type_of(path) is not None:
+                continue
+            dotted_path = ".".join(path)
+            if path[0] not in self.schema.behaviors:
+                print(f"Warning: The {self.schema.rule_format} behavior schema has no {path[0]} behavior, values of {dotted_path} are not type checked")
+            else:
+                print(f"Warning: The {self.schema.rule_format} behavior schema has no {dotted_path} option, its values are not type checked")
+
+    def _typed_value(self, value: str, value_type: str) -> Any:
+        """Convert the text of a matched value to the Python value rendered in terraform.tfvars."""
+        if value_type == "number":
+            return float(value) if "." in value else int(value)
+        if value_type == "bool":
+            return value == "true"
+        if value_type == "list(string)":
+            try:
+                return evaluate(parse_hcl(f"value = {value}").attributes["value"])
+            except (HclParseError, HclUnresolved):
+                return value
+        return parse_string(value)
+
+    def _index_criteria(self, data_name: str, content: str, rules_block_start: int, rules_block_end: int) -> None:
+        """Add the criteria and children of a rule to the criteria index."""
+        criteria = []
+        for criterion_match in _CRITERION_BLOCK_PATTERN.finditer(content, rules_block_start, rules_block_end):
+            criterion_block, _, _ = self._extract_block_content(content, criterion_match.end() - 1)
+            try:
+                criterion_body = parse_hcl(criterion_block[1:-1])
+            except HclParseError:
+                continue
+            for criterion in criterion_body.blocks:
+                options = {}
+                for option_name, expr in criterion.attributes.items():
+                    try:
+                        options[option_name] = evaluate(expr)
+                    except HclUnresolved:
+                        options[option_name] = expr.source
+                criteria.append({"type": criterion.type, "options": options})
+                self.criteria_by_type.setdefault(criterion.type, []).append(data_name)
+        self.criteria[data_name] = criteria
+
+        children_match = _CHILDREN_PATTERN.search(content, rules_block_start, rules_block_end)
+        if children_match:
+            for child_name in _CHILD_REFERENCE_PATTERN.findall(children_match.group(1)):
+                self.parents[child_name] = data_name
+
+    def parent_chain(self, data_name: str) -> List[str]:
+        """Return the ancestors of a rule, from its parent up to the default rule."""
+        chain = []
+        while data_name in self.parents and self.parents[data_name] not in chain:
+            data_name = self.parents[data_name]
+            chain.append(data_name)
+        return chain
+
+    def _criterion_matches(self, criterion: Dict[str, Any], option: str, pattern: str) -> bool:
+        """
+        Whether a criterion applies to the requests the pattern describes. A negative match
+        operator (IS_NOT_ONE_OF, DOES_NOT_MATCH_ONE_OF, ...) applies when none of its values
+        match, so file_extension=css does not select a rule for everything but css.
+        """
+        # Without an explicit option the criterion values are matched
+        option_names = [option] if option else list(_VALUE_OPTIONS)
+        negative = str(criterion["options"].get("match_operator", "")).startswith(_NEGATIVE_OPERATOR_PREFIXES)
+        for option_name in option_names:
+            values = criterion["options"].get(option_name)
+            if values is None:
+                continue
+            values = values if isinstance(values, list) else [values]
+            matches = any(value is not None and fnmatch.fnmatchcase(str(value), pattern) for value in values)
+            if matches != (negative and option_name in _VALUE_OPTIONS):
+                return True
+        return False
+
+    def selected_rules(self) -> Set[str]:
+        """
+        Return the rules selected by the criteria filters: the rules with a matching criterion
+        and every rule nested below them, since a child only applies when its parent matches.
+        The candidates come straight from the criteria index, no rule block is scanned again.
+        """
+        matched = set()
+        for criterion_type, option, pattern in self.criteria_filters:
+            for data_name in self.criteria_by_type.get(criterion_type, []):
+                if any(criterion["type"] == criterion_type and self._criterion_matches(criterion, option, pattern)
+                       for criterion in self.criteria[data_name]):
+                    matched.add(data_name)
+
+        return {data_name for data_name in self.criteria
+                if data_name in matched or any(parent in matched for parent in self.parent_chain(data_name))}
+
+    def parse_rules_file(self, target_paths: List[List[str]], writer: TerraformOutputWriter) -> Dict[str, str]:
         """
         Parse the rules.tf file and extract values based on specified paths
         Each path is a list of strings representing nested keys to follow
         Example: ["behavior", "origin", "hostname"]
         """
-        input_rules_file_path = os.path.join(output_dir, self.rules_file)
+        input_rules_file_path = writer.path(self.rules_file)
 
         try:
-            with open(input_rules_file_path, 'r') as f:
-                content = f.read()
+            content = writer.read(self.rules_file)
         except FileNotFoundError:
             print(f"Error: File {input_rules_file_path} not found")
             return {}
         
         results = {}
+        rules = []  # (data name, suffix, rules block, rules block start) of every rule
         
         # Find all data blocks for akamai_property_rules_builder
-        data_block_pattern = r'data\s+"akamai_property_rules_builder"\s+"([^"]+)"\s+{'
-        for match in re.finditer(data_block_pattern, content):
+        for match in _DATA_BLOCK_PATTERN.finditer(content):
             data_name = match.group(1)
             block_start = match.end() - 1  # Position of the opening brace
             
@@ -68,21 +213,34 @@ class TerraformRulesParser:
                 continue
             
             # Extract the suffix (after "rule_")
-            suffix_match = re.search(r'rule_(.+)$', data_name)
+            suffix_match = _RULE_SUFFIX_PATTERN.search(data_name)
             if not suffix_match:
                 continue
             
             suffix = suffix_match.group(1)
             
             # Find the rules_v* block
-            rules_pattern = r'rules_v[0-9_]+\s+{'
-            rules_match = re.search(rules_pattern, data_block)
+            rules_match = _RULES_BLOCK_PATTERN.search(data_block)
             if not rules_match:
                 continue
+
+            # All rules of an export share a rule format, the schema is looked up once
+            if self.schema is None:
+                self.schema = load_behavior_schema(rules_match.group(1))
+                self._warn_untyped_paths(target_paths)
                 
             rules_start = rules_match.end() - 1 + block_start
             rules_block, rules_block_start, rules_block_end = self._extract_block_content(content, rules_start)
-            
+            self._index_criteria(data_name, content, rules_block_start, rules_block_end)
+            rules.append((data_name, suffix, rules_block, rules_block_start))
+
+        # Parents can be declared after their children, so filters are applied once every rule is indexed
+        if self.criteria_filters:
+            selected = self.selected_rules()
+            print(f"Criteria filters selected {len(selected)} of {len(rules)} rules")
+            rules = [rule for rule in rules if rule[0] in selected]
+
+        for data_name, suffix, rules_block, rules_block_start in rules:
             # Process each target path
             for path in target_paths:
                 if len(path) < 2:
@@ -92,8 +250,8 @@ class TerraformRulesParser:
                 param_path = path[1:]
                 
                 # Match the behavior
-                behavior_pattern = rf'{behavior_type}\s+{{'
-                for behavior_match in re.finditer(behavior_pattern, rules_block):
+                behavior_pattern = patterns.cached(rf'{behavior_type}\s+{{')
+                for behavior_match in behavior_pattern.finditer(rules_block):
                     behavior_start = behavior_match.end() - 1 + rules_block_start
                     behavior_block, behavior_block_start, behavior_block_end = self._extract_block_content(content, behavior_start)
                     
@@ -102,8 +260,7 @@ class TerraformRulesParser:
                     current_start = behavior_block_start
                     
                     for i, key in enumerate(param_path[:-1]):
-                        key_pattern = rf'{key}\s+{{'
-                        key_match = re.search(key_pattern, current_block)
+                        key_match = patterns.cached(rf'{key}\s+{{').search(current_block)
                         if not key_match:
                             break
                         
@@ -113,117 +270,112 @@ class TerraformRulesParser:
                         # We've navigated to the correct nesting level, now extract the target value
                         final_key = param_path[-1]
                         
-                        # Try to match string value with the exact key name
-                        value_pattern = rf'(?<!\w){final_key}\s+=\s+"([^"]+)"'
-                        value_match = re.search(value_pattern, current_block)
-                        is_string = True
-                        
-                        # If not a string, try number
-                        if not value_match:
-                            value_pattern = rf'(?<!\w){final_key}\s+=\s+(\d+)'
-                            value_match = re.search(value_pattern, current_block)
-                            is_string = False
+                        # Match the value with the syntax of its type
+                        value_match = self._match_value(path, final_key, current_block)
                         
                         if value_match:
-                            value = value_match.group(1)
-                            var_name = f"{suffix}_{behavior_type}_{final_key}"
-                            results[var_name] = value
+                            value_type = value_match.value_type
+                            is_string = value_type == "string"
+                            value = value_match.value
+                            index_key = (behavior_type, tuple(param_path), value)
+
+                            if self.dedup_values and index_key in self.value_index:
+                                # The same value was already parameterized, reuse its variable
+                                var_name = self.value_index[index_key]
+                                print(f"Reusing {var_name} for {value} in {data_name}")
+                            else:
+                                var_name = f"{suffix}_{behavior_type}_{final_key}"
+
+                                # Several matches in one rule get numbered variables instead of overwriting each other
+                                if var_name in results:
+                                    count = 2
+                                    while f"{var_name}_{count}" in results:
+                                        count += 1
+                                    var_name = f"{var_name}_{count}"
+
+                                results[var_name] = value
+                                self.variable_types[var_name] = value_type
+                                self.value_index[index_key] = var_name
+                                print(f"Found {var_name} = {value}")
                             
                             # Calculate the exact position in the file for replacement
-                            pattern_start = value_match.start(0) + current_start
-                            value_start = value_match.start(1) + current_start
-                            value_end = value_match.end(1) + current_start
+                            pattern_start = value_match.start + current_start
+                            value_start = value_match.value_start + current_start
+                            value_end = value_match.value_end + current_start
                             key_text = content[pattern_start:value_start-1]  # The text before the value (includes the key name)
                             
                             # Store replacement information
-                            self.replacements[var_name] = {
+                            self.replacements.append({
+                                'var_name': var_name,
                                 'pattern_start': pattern_start,
                                 'value_start': value_start,
                                 'value_end': value_end,
                                 'key_text': key_text,
                                 'original': value,
                                 'is_string': is_string
-                            }
-                            
-                            print(f"Found {var_name} = {value}")
+                            })
         
         self.extracted_values = results
         return results
 
-    def update_variables_tf(self, output_dir) -> None:
+    def update_variables_tf(self, writer: TerraformOutputWriter) -> None:
         """
         Update variables.tf with variable definitions
         """
-        variables_file_path = os.path.join(output_dir, self.variables_file)
+        variables_file_path = writer.path(self.variables_file)
 
-        # Create or append to variables.tf
-        mode = 'a' if os.path.exists(variables_file_path) else 'w'
-        with open(variables_file_path, mode) as f:
-            # Prepare new variable definitions
-            new_vars_content = ""
-            for var_name, value in self.extracted_values.items():
-                # Determine type based on value
-                var_type = "string"
-                if value.isdigit():
-                    var_type = "number"
-                
-                new_vars_content += f'''
+        # Prepare new variable definitions
+        new_vars_content = ""
+        for var_name, value in self.extracted_values.items():
+            var_type = self.variable_types.get(var_name, "string")
+            
+            new_vars_content += f'''
 variable "{var_name}" {{
   description = "Extracted from Terraform rules file"
   type        = {var_type}
 }}
 '''
-            f.write(new_vars_content)
+
+        # Create or append to variables.tf
+        writer.append(self.variables_file, new_vars_content)
                    
         print(f"Updated {variables_file_path} with {len(self.extracted_values)}")
 
-    def update_tfvars(self, output_dir) -> None:
+    def update_tfvars(self, writer: TerraformOutputWriter) -> None:
         """
         Update terraform.tfvars with extracted values
         """
-        tfvars_file_path = os.path.join(output_dir, self.tfvars_file)
+        tfvars_file_path = writer.path(self.tfvars_file)
 
-        # Create or append to variables.tf
-        mode = 'a' if os.path.exists(tfvars_file_path) else 'w'
-        with open(tfvars_file_path, mode) as f:
-            # Then write all new values
-            for var_name, value in self.extracted_values.items():
-                if value.isdigit():
-                    f.write(f"{var_name} = {value}\n")
-                else:
-                    f.write(f'{var_name} = "{value}"\n')
+        # Then write all new values
+        for var_name, value in self.extracted_values.items():
+            writer.tfvars.set(var_name, self._typed_value(value, self.variable_types.get(var_name, "string")))
 
         print(f"Updated {tfvars_file_path} with {len(self.extracted_values)} values")
 
-    def replace_hardcoded_values(self, output_dir) -> None:
+    def replace_hardcoded_values(self, writer: TerraformOutputWriter) -> None:
         """
         Replace hardcoded values in rules.tf with variable references
         """
-        input_rules_file_path = os.path.join(output_dir, self.rules_file)
+        input_rules_file_path = writer.path(self.rules_file)
 
         if not self.replacements:
             print("No replacements to make")
             return
             
         # Read the entire file
-        with open(input_rules_file_path, 'r') as f:
-            content = f.read()
+        content = writer.read(self.rules_file)
             
-        # Make a backup of the original file
-        backup_file = f"{input_rules_file_path}.bak"
-        with open(backup_file, 'w') as f:
-            f.write(content)
-        print(f"Created backup of {input_rules_file_path} to {backup_file}")
-        
         # Sort replacements by position (descending) to avoid offset issues
         sorted_replacements = sorted(
-            self.replacements.items(), 
-            key=lambda x: x[1]['pattern_start'], 
+            self.replacements, 
+            key=lambda x: x['pattern_start'], 
             reverse=True
         )
         
         # Make the replacements
-        for var_name, rep_info in sorted_replacements:
+        for rep_info in sorted_replacements:
+            var_name = rep_info['var_name']
             pattern_start = rep_info['pattern_start']
             value_start = rep_info['value_start']
             value_end = rep_info['value_end']
@@ -245,33 +397,51 @@ variable "{var_name}" {{
             content = content[:pattern_start] + replacement + content[value_end:]
             
         # Write the modified content back
-        with open(input_rules_file_path, 'w') as f:
-            f.write(content)
+        writer.write(self.rules_file, content)
             
         print(f"Replaced {len(self.replacements)} hardcoded values with variable references in {input_rules_file_path}")
 
 
-def rule_tree_parameterization(output_dir):
+def parse_criteria_filter(criteria_filter: str) -> Tuple[str, str, str]:
+    """
+    Parse a criteria filter written as TYPE=PATTERN or TYPE.OPTION=PATTERN, e.g. hostname=*.example.com
+    or path.values=/api/*. Raises ValueError if it is malformed.
+    """
+    selector, separator, pattern = criteria_filter.partition("=")
+    criterion_type, _, option = selector.strip().partition(".")
+    if not separator or not criterion_type or not pattern:
+        raise ValueError(f"{criteria_filter} is not a criteria filter like hostname=*.example.com or path.values=/api/*")
+    return criterion_type, option, pattern.strip()
+
+
+def rule_tree_parameterization(writer: TerraformOutputWriter, dedup_values: bool = False, extra_paths: List[str] = None, criteria_filters: List[Tuple[str, str, str]] = None):
     # Define paths to extract
     # Format: [behavior_type, nested_key1, nested_key2, ..., target_parameter]
     target_paths = [
         ["origin", "hostname"],
         ["cp_code", "value", "id"]
     ]
+    # Additional dotted paths, e.g. origin.http_port
+    for extra_path in extra_paths or []:
+        path = extra_path.split(".")
+        if path not in target_paths:
+            target_paths.append(path)
 
-    parser = TerraformRulesParser(rules_file="rules.tf")
-    extracted = parser.parse_rules_file(target_paths, output_dir)
+    parser = TerraformRulesParser(rules_file="rules.tf", dedup_values=dedup_values, criteria_filters=criteria_filters)
+    extracted = parser.parse_rules_file(target_paths, writer)
     
     print("Extracted values:")
     for var_name, value in extracted.items():
         print(f"{var_name} = {value}")
     
     if extracted:
-        parser.update_variables_tf(output_dir)
-        parser.update_tfvars(output_dir)
-        parser.replace_hardcoded_values(output_dir)
+        parser.update_variables_tf(writer)
+        parser.update_tfvars(writer)
+        parser.replace_hardcoded_values(writer)
     else:
         print("No values were extracted. Check if the file structure matches the expected format.")
 
 if __name__ == "__main__":
-    rule_tree_parameterization(output_dir="../result")
\ No newline at end of file
+    writer = TerraformOutputWriter(output_dir="../result")
+    rule_tree_parameterization(writer)
+    writer.commit()
\ No newline at end of file
@@ -0,0 +1,131 @@
+import glob
+import hashlib
+import marshal
+import os
+import sys
+import tempfile
+from typing import Any, Dict, Hashable, Optional
+import modules
+from modules.export_reader import TerraformExportReader
+
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_FILE = ".optimizer-snapshot"  # In an export directory; archives get <archive>.snapshot next to them
+SNAPSHOT_MODE = 0o644  # mkstemp creates files readable by the owner only
+# Models parsed from staged content, e.g. the rule hierarchy of each parameterized rules.tf,
+# are kept for the most recent contents only
+MAX_CONTENT_ENTRIES = 8
+
+
+def tool_version() -> str:
+    """
+    The version the snapshots are keyed by: the package version, the Python version (marshal
+    data is only readable by the version that wrote it) and a hash of the module sources, so a
+    changed parser never loads a model it did not build.
+    """
+    digest = hashlib.sha256()
+    for source_path in sorted(glob.glob(os.path.join(os.path.dirname(modules.__file__), "*.py"))):
+        with open(source_path, 'rb') as f:
+            digest.update(f.read())
+    return f"{modules.__version__}/py{sys.version_info[0]}.{sys.version_info[1]}/{digest.hexdigest()[:16]}"
+
+
+def content_key(content: str) -> str:
+    """Key a model parsed from staged content by the content it was parsed from."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+class TerraformSnapshot:
+    """
+    The parsed model of an export, saved next to it so that re-running optimize with other
+    options (another --depth, more --parameterize paths) loads the PMUSER variables, property
+    data and rule hierarchy instead of parsing the text again. The snapshot is a marshal file
+    keyed by the hash of the export files and the tool version; a snapshot of other input or
+    another version is ignored and replaced.
+
+    Models are plain dicts, lists, tuples and strings, keyed by the stage that parsed them
+    and, for models parsed from staged content, by the hash of that content. They are held
+    marshalled, so a stage changing the model it got does not change the snapshot.
+    """
+
+    def __init__(self, export: TerraformExportReader, path: str = None):
+        self.export = export
+        self.path = path or snapshot_path(export)
+        self.input_hash = export.digest()
+        self.version = tool_version()
+        self.models: Dict[Hashable, bytes] = {}  # (stage, content key or None) -> marshalled model
+        self.hits = 0  # Models loaded instead of parsed
+        self.changed = False
+
+    def load(self) -> bool:
+        """Load the models of a matching snapshot. Returns whether there was one."""
+        try:
+            with open(self.path, 'rb') as f:
+                snapshot = marshal.load(f)
+        except FileNotFoundError:
+            return False
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            print(f"Warning: Ignoring unreadable snapshot {self.path}: {e}")
+            return False
+
+        if not isinstance(snapshot, dict) or (snapshot.get("format"), snapshot.get("version"), snapshot.get("input")) != (SNAPSHOT_FORMAT, self.version, self.input_hash):
+            print(f"Snapshot {self.path} is of another export content or tool version, parsing again")
+            self.changed = True
+            return False
+        self.models = snapshot.get("models", {})
+        return True
+
+    def get(self, stage: str, key: Optional[str] = None) -> Any:
+        """Return the model a stage parsed before, or None."""
+        data = self.models.get((stage, key))
+        if data is None:
+            return None
+        self.hits += 1
+        return marshal.loads(data)
+
+    def put(self, stage: str, model: Any, key: Optional[str] = None) -> None:
+        self.models.pop((stage, key), None)
+        self.models[(stage, key)] = marshal.dumps(model)
+        if key is not None:
+            # Models are kept in insertion order, so the oldest contents of the stage go first
+            keyed = [model_key for model_key in self.models if model_key[0] == stage and model_key[1] is not None]
+            for old_key in keyed[:-MAX_CONTENT_ENTRIES]:
+                del self.models[old_key]
+        self.changed = True
+
+    def save(self) -> None:
+        """Write the snapshot if anything was added. An export that cannot be written to is only warned about."""
+        if self.hits:
+            print(f"Reused {self.hits} parsed models from {self.path}")
+        if not self.changed:
+            return
+        snapshot = {"format": SNAPSHOT_FORMAT, "version": self.version, "input": self.input_hash, "models": self.models}
+        snapshot_dir = os.path.dirname(os.path.abspath(self.path))
+        try:
+            fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", dir=snapshot_dir)
+        except OSError as e:
+            print(f"Warning: Could not write the snapshot {self.path}: {e}")
+            return
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                marshal.dump(snapshot, f)
+            os.chmod(tmp_path, SNAPSHOT_MODE)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.changed = False
+        print(f"Saved the parsed export to {self.path}")
+
+
+def snapshot_path(export: TerraformExportReader) -> str:
+    if export.is_archive:
+        return export.source + ".snapshot"
+    return os.path.join(export.source, SNAPSHOT_FILE)
+
+
+def open_snapshot(export: TerraformExportReader) -> TerraformSnapshot:
+    snapshot = TerraformSnapshot(export)
+    if snapshot.load():
+        print(f"Loaded the parsed export from {snapshot.path}")
+    return snapshot
@@ -0,0 +1,152 @@
+import json
+import os
+from typing import Any, Dict
+from modules.hcl_parser import HclBlock, HclExpression, HclParseError, HclUnresolved, evaluate, parse_hcl
+from modules.output_writer import TerraformOutputWriter
+from modules.rule_tree import RULES_BUILDER
+
+# Variable attributes that hold a literal value, in the order they are written
+_VARIABLE_VALUE_ATTRIBUTES = ("description", "default", "sensitive", "nullable")
+
+
+def type_expression(source: str) -> str:
+    """
+    Put a type expression on a single line, e.g. map(object({a = string, b = number})),
+    which is how Terraform JSON syntax expects it.
+    """
+    parts = []
+    for line in source.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if parts and parts[-1][-1] not in "({[" and line[0] not in ")}]":
+            parts.append(", ")
+        parts.append(line)
+    return "".join(parts)
+
+
+def _escape_template(text: str) -> str:
+    """Escape a literal string so that Terraform does not read interpolations or directives in it."""
+    return text.replace("${", "$${").replace("%{", "%%{")
+
+
+def expression_json(expr: HclExpression) -> Any:
+    """
+    Convert a parsed expression to its JSON syntax: literals stay JSON values, lists and
+    objects are converted item by item and any other expression is written as an
+    interpolation of its source, e.g. "${var.origin_hostname}".
+    """
+    if expr.kind == "literal":
+        return _escape_template(expr.value) if isinstance(expr.value, str) else expr.value
+    if expr.kind == "template":
+        return "".join(_escape_template(part) if isinstance(part, str) else "${" + part.source + "}" for part in expr.value)
+    if expr.kind == "list":
+        return [expression_json(item) for item in expr.value]
+    if expr.kind == "object" and all(key.kind == "literal" for key, _ in expr.value):
+        return {str(key.value): expression_json(value) for key, value in expr.value}
+    return "${" + expr.source + "}"
+
+
+def block_json(block: HclBlock) -> Dict[str, Any]:
+    """
+    Convert the body of a block to its JSON syntax. Nested blocks are keyed by their type
+    and labels, and repeated blocks become an array in their original order.
+    """
+    body: Dict[str, Any] = {name: expression_json(expr) for name, expr in block.attributes.items()}
+    for child in block.blocks:
+        parent = body
+        keys = [child.type] + child.labels
+        for key in keys[:-1]:
+            parent = parent.setdefault(key, {})
+        child_body = block_json(child)
+        existing = parent.get(keys[-1])
+        if existing is None:
+            parent[keys[-1]] = child_body
+        elif isinstance(existing, list):
+            existing.append(child_body)
+        else:
+            parent[keys[-1]] = [existing, child_body]
+    return body
+
+
+class TerraformJsonEmitter:
+    """
+    Write generated files in Terraform JSON syntax (.tf.json), which machines load with a
+    plain JSON parser instead of parsing HCL.
+    """
+
+    def __init__(self, writer: TerraformOutputWriter):
+        self.writer = writer
+
+    def variables_json(self, content: str) -> Dict[str, Any]:
+        """Convert the variable blocks of a variables.tf file to their JSON syntax."""
+        variables = {}
+        for block in parse_hcl(content).find_blocks("variable"):
+            if not block.labels:
+                continue
+            variable = {}
+            if "type" in block.attributes:
+                variable["type"] = type_expression(block.attributes["type"].source)
+            for name in _VARIABLE_VALUE_ATTRIBUTES:
+                if name in block.attributes:
+                    variable[name] = evaluate(block.attributes[name])
+            variables[block.labels[0]] = variable
+        return {"variable": variables}
+
+    def rules_json(self, content: str) -> Dict[str, Any]:
+        """
+        Convert a rule file to its JSON syntax. Returns an empty document unless the file only
+        holds akamai_property_rules_builder data sources.
+        """
+        root = parse_hcl(content)
+        if root.attributes or not root.blocks:
+            return {}
+        rules = {}
+        for block in root.blocks:
+            if block.type != "data" or len(block.labels) != 2 or block.labels[0] != RULES_BUILDER:
+                return {}
+            rules[block.labels[1]] = block_json(block)
+        return {"data": {RULES_BUILDER: rules}}
+
+    def convert_variables_tf(self) -> None:
+        """Replace every staged variables.tf with a variables.tf.json."""
+        for key in self.writer.list_files():
+            if os.path.basename(key) != "variables.tf":
+                continue
+            try:
+                document = self.variables_json(self.writer.read(key))
+            except (HclParseError, HclUnresolved) as e:
+                print(f"Warning: Could not convert {self.writer.path(key)} to JSON, keeping it as HCL: {e}")
+                continue
+            self.writer.remove(key)
+            self.writer.write(key + ".json", json.dumps(document, indent=2) + "\n")
+            print(f"Converted {self.writer.path(key)} to {os.path.basename(key)}.json")
+
+    def convert_rules_tf(self) -> None:
+        """Replace every staged rule file with its .tf.json, converted from the parsed rule tree."""
+        converted = 0
+        for key in self.writer.list_files():
+            if not key.endswith(".tf"):
+                continue
+            content = self.writer.read(key)
+            if f'"{RULES_BUILDER}"' not in content:
+                continue
+            try:
+                document = self.rules_json(content)
+            except HclParseError as e:
+                print(f"Warning: Could not convert {self.writer.path(key)} to JSON, keeping it as HCL: {e}")
+                continue
+            if not document:
+                continue
+            self.writer.remove(key)
+            self.writer.write(key + ".json", json.dumps(document, indent=2) + "\n")
+            converted += 1
+        print(f"Converted {converted} rule files to Terraform JSON syntax")
+
+
+def emit_tf_json(writer: TerraformOutputWriter, variables_json: bool = False, rules_json: bool = False) -> None:
+    emitter = TerraformJsonEmitter(writer)
+    if variables_json:
+        emitter.convert_variables_tf()
+    if rules_json:
+        emitter.convert_rules_tf()
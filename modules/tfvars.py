@@ -0,0 +1,300 @@
+import copy
+import hashlib
+import json
+from typing import Any, Dict, List, Optional
+from modules import patterns
+from modules.hcl_parser import HclParseError, HclParser, HclUnresolved, evaluate
+
+
+class HclExpression(str):
+    """A raw HCL expression that is rendered verbatim instead of being quoted."""
+
+
+class HclObject(dict):
+    """An object whose keys are attribute names, so they are never quoted like map keys."""
+
+
+class TfvarsJsonError(ValueError):
+    """A variable value that has no JSON form, e.g. a template or a reference."""
+
+
+class TerraformTfvars:
+    def __init__(self):
+        self.values: Dict[str, Any] = {}  # Variable values in the order they are rendered
+        self.comments: Dict[str, str] = {}  # Optional comment rendered above a variable
+        self.files: Dict[str, str] = {}  # Variables rendered to their own *.auto.tfvars file instead of terraform.tfvars
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.values
+
+    def names(self) -> List[str]:
+        return list(self.values)
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.values.get(name, default)
+
+    def set(self, name: str, value: Any, comment: str = None, file: str = None) -> None:
+        """
+        Set a variable value. Existing variables keep their position in the file.
+        """
+        self.values[name] = value
+        if comment:
+            self.comments[name] = comment
+        if file:
+            self.files[name] = file
+
+    def file_of(self, name: str) -> Optional[str]:
+        return self.files.get(name)
+
+    def split_files(self) -> Dict[Optional[str], "TerraformTfvars"]:
+        """
+        Group the variables by the file they are rendered to. Variables without
+        a file of their own are grouped under None, which always comes first.
+        """
+        file_names = [None] + list(dict.fromkeys(self.files.values()))
+        return {
+            file_name: self.select([name for name in self.values if self.files.get(name) == file_name])
+            for file_name in file_names
+        }
+
+    def select(self, names: List[str]) -> "TerraformTfvars":
+        """
+        Return a new set with only the given variables, keeping their order and comments.
+        Values are shared with this set, not copied.
+        """
+        tfvars = TerraformTfvars()
+        for name in self.values:
+            if name in names:
+                tfvars.set(name, self.values[name], self.comments.get(name), self.files.get(name))
+        return tfvars
+
+    def copy(self) -> "TerraformTfvars":
+        tfvars = TerraformTfvars()
+        tfvars.values = copy.deepcopy(self.values)
+        tfvars.comments = dict(self.comments)
+        tfvars.files = dict(self.files)
+        return tfvars
+
+    def render(self) -> str:
+        """
+        Render the variables as HCL. Consecutive single line values are aligned
+        and multi-line values are separated by blank lines, like terraform fmt does.
+        """
+        lines = []
+        group = []  # Pending single line (name, value) pairs to align
+        previous_multiline = False
+
+        def flush_group():
+            if group:
+                width = max(len(name) for name, _ in group)
+                lines.extend(f"{name.ljust(width)} = {value}" for name, value in group)
+                group.clear()
+
+        for name, value in self.values.items():
+            rendered = render_value(value)
+            multiline = "\n" in rendered
+            comment = self.comments.get(name)
+
+            if lines or group:
+                if comment or multiline or previous_multiline:
+                    flush_group()
+                    lines.append("")
+
+            if comment:
+                lines.append(f"# {comment}")
+
+            if multiline:
+                lines.append(f"{name} = {rendered}")
+            else:
+                group.append((name, rendered))
+            previous_multiline = multiline
+
+        flush_group()
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def render_json(self) -> str:
+        """
+        Render the variables as a .tfvars.json file. JSON has no comments, so they are
+        dropped, and raw expressions must evaluate to a literal value.
+        """
+        if not self.values:
+            return ""
+        values = {}
+        for name, value in self.values.items():
+            try:
+                values[name] = json_value(value)
+            except ValueError as e:
+                raise TfvarsJsonError(f"Variable {name} cannot be written to a .tfvars.json file: {e}. Use --tfvars-format hcl")
+        return json.dumps(values, indent=2) + "\n"
+
+
+def unique_keys(names: List[str], fallback: str = "key") -> List[str]:
+    """
+    Turn names into unique map keys, in the same order. Empty names use the fallback, and
+    repeated names get a -2, -3, ... suffix by order of appearance, so a key only changes
+    when its own entry does.
+    """
+    keys = []
+    seen = set()
+    for name in names:
+        base = name or fallback
+        key = base
+        counter = 1
+        while key in seen:
+            counter += 1
+            key = f"{base}-{counter}"
+        seen.add(key)
+        keys.append(key)
+    return keys
+
+
+def hash_buckets(values: Dict[str, Any], size: int, prefix: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Split a map into buckets of about size entries, keyed prefix_001, prefix_002, ... Each
+    entry goes to the bucket picked by a stable hash of its key, so adding or removing an
+    entry only changes its own bucket. The number of buckets is the smallest power of two
+    that keeps the average at or below size, so when a map outgrows it every bucket splits
+    in two and each entry either stays or moves to the new half. The keys have a fixed
+    width, so the keys of the existing buckets stay the same past the 999th bucket.
+    """
+    count = 1
+    while count * size < len(values):
+        count *= 2
+    buckets: Dict[int, Dict[str, Any]] = {}
+    for key in sorted(values):
+        index = int.from_bytes(hashlib.sha256(key.encode("utf-8")).digest()[:8], "big") % count
+        buckets.setdefault(index, {})[key] = values[key]
+    return {f"{prefix}_{index + 1:0{BUCKET_KEY_WIDTH}d}": buckets[index] for index in sorted(buckets)}
+
+
+def tfvars_file_name(file_name: str, tfvars_format: str = "hcl") -> str:
+    """Return the name of a tfvars file in the given format, e.g. terraform.tfvars.json for json."""
+    return f"{file_name}.json" if tfvars_format == "json" else file_name
+
+
+def json_value(value: Any) -> Any:
+    """Convert a tfvars value to a JSON value, evaluating raw expressions."""
+    if isinstance(value, HclExpression):
+        try:
+            return evaluate(HclParser(str(value)).parse_standalone_expression())
+        except (HclParseError, HclUnresolved):
+            raise ValueError(f"the expression {value} has no literal value")
+    if isinstance(value, dict):
+        return {str(key): json_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [json_value(item) for item in value]
+    return value
+
+
+_IDENTIFIER_PATTERN = patterns.fixed(r'^[A-Za-z_][A-Za-z0-9_-]*$')
+_INTEGER_PATTERN = patterns.fixed(r'-?\d+')
+_FLOAT_PATTERN = patterns.fixed(r'-?\d+\.\d+')
+# A quoted HCL string on one line, with its escape sequences; group 1 is the text between the quotes
+STRING_LITERAL = r'"((?:[^"\\\n]|\\.)*)"'
+# Digits of the bucket keys of hash_buckets, bucket_001 and so on
+BUCKET_KEY_WIDTH = 3
+
+
+def parse_literal(text: str) -> Any:
+    """
+    Convert a literal HCL value (bool, number or quoted string) to a Python value. Strings
+    are decoded, so C:\\\\dir $${x} in the file is C:\\dir ${x} in Python and renders back to
+    the same text. Anything else, including templates with interpolations, is kept as a raw
+    expression.
+    """
+    text = text.strip()
+    if text in ("true", "false"):
+        return text == "true"
+    if _INTEGER_PATTERN.fullmatch(text):
+        return int(text)
+    if _FLOAT_PATTERN.fullmatch(text):
+        return float(text)
+    if len(text) >= 2 and text.startswith('"') and text.endswith('"'):
+        body = text[1:-1]
+        if not any(char in body for char in '\\$%"'):
+            return body
+        try:
+            expr = HclParser(text).parse_standalone_expression()
+        except HclParseError:
+            return HclExpression(text)
+        if expr.kind == "literal":
+            return expr.value
+        if expr.kind == "template" and all(isinstance(part, str) for part in expr.value):
+            return "".join(expr.value)
+    return HclExpression(text)
+
+
+def parse_string(body: str) -> Any:
+    """Decode the text matched between the quotes of a string literal, see STRING_LITERAL."""
+    # Most strings have nothing to decode, which is the common case for thousands of PMUSER values
+    if not any(char in body for char in '\\$%'):
+        return body
+    return parse_literal(f'"{body}"')
+
+
+def quote_string(value: str) -> str:
+    """Quote a string as an HCL string literal, escaping quotes, backslashes and template sequences."""
+    escaped = (
+        value.replace("\\", "\\\\")
+        .replace('"', '\\"')
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+        .replace("\t", "\\t")
+        .replace("${", "$${")
+        .replace("%{", "%%{")
+    )
+    return f'"{escaped}"'
+
+
+def render_value(value: Any, indent: int = 0) -> str:
+    """Render a Python value as an HCL expression."""
+    if isinstance(value, HclExpression):
+        return str(value)
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    if value is None:
+        return "null"
+    if isinstance(value, str):
+        return quote_string(value)
+
+    inner = " " * (indent + 2)
+    closing = " " * indent
+
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return "[]"
+        items = [f"{inner}{render_value(item, indent + 2)}," for item in value]
+        return "[\n" + "\n".join(items) + f"\n{closing}]"
+
+    if isinstance(value, dict):
+        if not value:
+            return "{}"
+        entries = []
+        group = []
+
+        def flush_group():
+            if group:
+                width = max(len(key) for key, _ in group)
+                entries.extend(f"{inner}{key.ljust(width)} = {rendered}" for key, rendered in group)
+                group.clear()
+
+        for key, item in value.items():
+            # Nested objects are map entries, so their keys are always quoted
+            if (isinstance(item, dict) and not isinstance(value, HclObject)) or not _IDENTIFIER_PATTERN.match(str(key)):
+                rendered_key = quote_string(str(key))
+            else:
+                rendered_key = str(key)
+
+            rendered = render_value(item, indent + 2)
+            if "\n" in rendered:
+                flush_group()
+                entries.append(f"{inner}{rendered_key} = {rendered}")
+            else:
+                group.append((rendered_key, rendered))
+
+        flush_group()
+        return "{\n" + "\n".join(entries) + f"\n{closing}}}"
+
+    raise TypeError(f"Unsupported tfvars value type: {type(value).__name__}")
@@ -1,6 +1,12 @@
 import re
-import os
 from typing import List
+from modules import patterns
+from modules.export_reader import TerraformExportReader, open_export
+from modules.output_writer import TerraformOutputWriter
+from modules.tfvars import parse_literal
+
+_VARIABLE_BLOCK_PATTERN = patterns.fixed(r'variable\s+"([^"]+)"\s+{([^}]+)}', re.DOTALL)
+_DEFAULT_PATTERN = patterns.fixed(r'default\s+=\s+(.*)')
 
 
 class TerraformTfvarsFilter:
@@ -8,59 +14,33 @@ class TerraformTfvarsFilter:
         self.variables_file = variables_file
         self.tfvars_file = tfvars_file
 
-    def filter_and_generate_tfvars(self, input_dir: str, output_dir: str, filter_vars: List[str]) -> None:
+    def filter_and_generate_tfvars(self, export: TerraformExportReader, writer: TerraformOutputWriter, filter_vars: List[str]) -> None:
         """
         Generate terraform.tfvars based on the specified variables in filter_vars
         """
-        input_variables_file_path = os.path.join(input_dir, self.variables_file)
-        output_tfvars_file_path = os.path.join(output_dir, self.tfvars_file)
+        output_tfvars_file_path = writer.path(self.tfvars_file)
 
-        if not os.path.exists(input_variables_file_path):
-            print(f"Error: File {input_variables_file_path} not found")
+        if not export.exists(self.variables_file):
+            print(f"Error: File {export.path(self.variables_file)} not found")
             return
 
-        # Read the existing terraform.tfvars file (if it exists)
-        existing_tfvars_content = ""
-        if os.path.exists(output_tfvars_file_path):
-            with open(output_tfvars_file_path, 'r') as f:
-                existing_tfvars_content = f.read()
-
         # Extract variable blocks from variables.tf
-        with open(input_variables_file_path, 'r') as f:
-            content = f.read()
+        content = export.read(self.variables_file)
 
-        variable_blocks = re.findall(r'variable\s+"([^"]+)"\s+{([^}]+)}', content, re.DOTALL)
+        variable_blocks = _VARIABLE_BLOCK_PATTERN.findall(content)
 
-        # Generate the new content for the filtered variables
-        new_tfvars_content = ""
+        # Add the filtered variables to terraform.tfvars
+        # Setting a variable that already exists replaces its value, so nothing is duplicated
         for var_name, var_block in variable_blocks:
             if var_name in filter_vars:
                 # Extract default value if exists
-                default_match = re.search(r'default\s+=\s+(.*)', var_block)
+                default_match = _DEFAULT_PATTERN.search(var_block)
                 if default_match:
-                    default_value = default_match.group(1).strip()
-                    new_tfvars_content += f'{var_name} = {default_value}\n'
-
-        # Combine the existing content with the new filtered variables
-        # Ensure we don't duplicate the filtered variables if they already exist
-        if new_tfvars_content:
-            if existing_tfvars_content:
-                # Remove any existing entries for the filtered variables to avoid duplicates
-                for var_name in filter_vars:
-                    existing_tfvars_content = re.sub(rf'{var_name}\s*=.*\n', '', existing_tfvars_content)
-            
-            # Append the new filtered variables to the existing content
-            final_tfvars_content = existing_tfvars_content.strip() + "\n" + new_tfvars_content.strip() + "\n\n"
-        else:
-            final_tfvars_content = existing_tfvars_content + "\n\n"
-
-        # Write the final content to terraform.tfvars
-        with open(output_tfvars_file_path, 'w') as f:
-            f.write(final_tfvars_content)
+                    writer.tfvars.set(var_name, parse_literal(default_match.group(1)))
 
         print(f"Updated {output_tfvars_file_path} with filtered variables: {filter_vars}")
 
-def filter_vars(input_dir, output_dir):
+def filter_vars(export, writer):
     # Specify the variables you want to include in terraform.tfvars
     filter_vars = ["activate_latest_on_staging", "activate_latest_on_production"]
 
@@ -68,7 +48,9 @@ def filter_vars(input_dir, output_dir):
     tfvars_filter = TerraformTfvarsFilter()
 
     # Generate the filtered terraform.tfvars file
-    tfvars_filter.filter_and_generate_tfvars(input_dir, output_dir, filter_vars)
+    tfvars_filter.filter_and_generate_tfvars(export, writer, filter_vars)
 
 if __name__ == "__main__":
-    filter_vars(input_dir=".", output_dir="./result")
\ No newline at end of file
+    writer = TerraformOutputWriter(output_dir="./result")
+    filter_vars(export=open_export("."), writer=writer)
+    writer.commit()
\ No newline at end of file
@@ -0,0 +1,111 @@
+import glob
+import json
+import os
+from typing import Any, Dict
+from modules.export_reader import open_export
+from modules.hcl_parser import HclParseError, HclUnresolved, evaluate, parse_hcl
+from modules.rule_tree import RULES_BUILDER, TerraformRuleTree, first_difference, tree_hash
+
+
+class TerraformOutputVerifier:
+    def __init__(self, input_dir: str, output_dir: str, environment: str = "prod"):
+        self.input_dir = input_dir
+        self.output_dir = output_dir
+        self.environment = environment
+        self.modules_dir = os.path.join(output_dir, "modules", "property")
+        self.environment_dir = os.path.join(output_dir, "environments", environment)
+
+    def load_variables(self) -> Dict[str, Any]:
+        """
+        Resolve the module variables the same way Terraform does: variable defaults first,
+        then terraform.tfvars and finally the *.auto.tfvars files in lexical order.
+        The .tf.json and .tfvars.json variants of the files are read as well.
+        """
+        values = {}
+
+        variables_file_path = os.path.join(self.modules_dir, "variables.tf")
+        variables_json_path = variables_file_path + ".json"
+        if os.path.exists(variables_json_path):
+            with open(variables_json_path, 'r') as f:
+                for name, variable in json.load(f).get("variable", {}).items():
+                    if "default" in variable:
+                        values[name] = variable["default"]
+        elif os.path.exists(variables_file_path):
+            with open(variables_file_path, 'r') as f:
+                root = parse_hcl(f.read())
+            for block in root.find_blocks("variable"):
+                if block.labels and "default" in block.attributes:
+                    try:
+                        values[block.labels[0]] = evaluate(block.attributes["default"])
+                    except HclUnresolved:
+                        continue
+
+        tfvars_files = [os.path.join(self.environment_dir, "terraform.tfvars"), os.path.join(self.environment_dir, "terraform.tfvars.json")]
+        tfvars_files += sorted(
+            glob.glob(os.path.join(self.environment_dir, "*.auto.tfvars")) + glob.glob(os.path.join(self.environment_dir, "*.auto.tfvars.json"))
+        )
+        for tfvars_file_path in tfvars_files:
+            if not os.path.exists(tfvars_file_path):
+                continue
+            with open(tfvars_file_path, 'r') as f:
+                if tfvars_file_path.endswith(".json"):
+                    values.update(json.load(f))
+                    continue
+                root = parse_hcl(f.read())
+            for name, expr in root.attributes.items():
+                values[name] = evaluate(expr)
+
+        return values
+
+    def load_original_rules(self) -> TerraformRuleTree:
+        rule_tree = TerraformRuleTree()
+        rule_tree.load(open_export(self.input_dir).read("rules.tf"))
+        return rule_tree
+
+    def load_generated_rules(self) -> TerraformRuleTree:
+        """Reassemble the rule tree from the split files under modules/property."""
+        rule_tree = TerraformRuleTree()
+        for file_path in sorted(glob.glob(os.path.join(self.modules_dir, "*.tf")) + glob.glob(os.path.join(self.modules_dir, "*.tf.json"))):
+            with open(file_path, 'r') as f:
+                content = f.read()
+            if f'"{RULES_BUILDER}"' not in content:
+                continue
+            if file_path.endswith(".json"):
+                rule_tree.load_json(content)
+            else:
+                rule_tree.load(content)
+        return rule_tree
+
+    def verify(self) -> bool:
+        """
+        Compare the rule tree produced by the generated project with the exported one.
+        """
+        try:
+            original = self.load_original_rules().canonical_tree()
+            generated = self.load_generated_rules().canonical_tree({"var": self.load_variables()})
+        except (OSError, ValueError, HclParseError, HclUnresolved) as e:
+            print(f"Error: Could not load the rule trees: {e}")
+            return False
+
+        if not original:
+            print(f"Error: Default rule not found in {os.path.join(self.input_dir, 'rules.tf')}")
+            return False
+
+        original_hash = tree_hash(original)
+        generated_hash = tree_hash(generated)
+        if original_hash == generated_hash:
+            print(f"OK: {self.environment_dir} produces the exported rule tree ({original_hash[:12]})")
+            return True
+
+        print(f"Mismatch: {self.environment_dir} does not produce the exported rule tree")
+        print(f"  First difference: {first_difference(original, generated)}")
+        return False
+
+
+def verify_output(input_dir: str, output_dir: str, environment: str = "prod") -> bool:
+    verifier = TerraformOutputVerifier(input_dir, output_dir, environment)
+    return verifier.verify()
+
+
+if __name__ == "__main__":
+    verify_output(input_dir="../test/export", output_dir="../test/result")
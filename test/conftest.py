@@ -0,0 +1,42 @@
+import filecmp
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+EXPORT_DIR = os.path.join(ROOT, "test", "export")
+RESULT_DIR = os.path.join(ROOT, "test", "result")
+
+
+def different_files(left, right):
+    """Return the relative paths that differ between two trees or exist in only one of them."""
+    comparison = filecmp.dircmp(left, right)
+    different = comparison.left_only + comparison.right_only + comparison.funny_files
+    # dircmp compares by size and modification time only, so compare the content of every common file
+    _, mismatch, errors = filecmp.cmpfiles(left, right, comparison.common_files, shallow=False)
+    different += mismatch + errors
+    for sub_dir in comparison.common_dirs:
+        different += [os.path.join(sub_dir, path) for path in different_files(os.path.join(left, sub_dir), os.path.join(right, sub_dir))]
+    return sorted(different)
+
+
+@pytest.fixture
+def run_main():
+    """Run a main.py command and return the completed process. Fails the test on a non-zero exit unless check=False."""
+    def run(*args, check=True):
+        result = subprocess.run([sys.executable, "main.py", *args], cwd=ROOT, capture_output=True, text=True)
+        if check:
+            assert result.returncode == 0, f"main.py {' '.join(args)} failed:\n{result.stdout}\n{result.stderr}"
+        return result
+    return run
+
+
+@pytest.fixture
+def export_copy(tmp_path):
+    """A copy of the test export that a test can change, or write a snapshot into."""
+    export_dir = str(tmp_path / "export")
+    shutil.copytree(EXPORT_DIR, export_dir)
+    return export_dir
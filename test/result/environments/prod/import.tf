@@ -1,5 +1,5 @@
 import {
-  to = module.akamai_property.akamai_edge_hostname.edge_hostnames["tf-demo-com-edgesuite-net"]
+  to = module.akamai_property.akamai_edge_hostname.edge_hostnames["tf-demo.com.edgesuite.net"]
   id = "ehn_5655851,ctr_1-1NC95D,grp_257477"
 }
 
@@ -167,4 +167,4 @@ data "akamai_property_rules_builder" "tf-demo-com_rule_adaptive_acceleration" {
       }
     }
   }
-}
\ No newline at end of file
+}
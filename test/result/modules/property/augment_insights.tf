@@ -20,7 +20,7 @@ data "akamai_property_rules_builder" "tf-demo-com_rule_traffic_reporting" {
     behavior {
       cp_code {
         value {
-          id =var.traffic_reporting_cp_code_id
+          id = var.traffic_reporting_cp_code_id
         }
       }
     }
@@ -83,4 +83,4 @@ data "akamai_property_rules_builder" "tf-demo-com_rule_log_delivery" {
       }
     }
   }
-}
\ No newline at end of file
+}
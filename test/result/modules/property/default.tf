@@ -43,4 +43,4 @@ data "akamai_property_rules_builder" "tf-demo-com_rule_default" {
       data.akamai_property_rules_builder.tf-demo-com_rule_minimize_payload.json,
     ]
   }
-}
\ No newline at end of file
+}
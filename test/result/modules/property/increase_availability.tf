@@ -85,4 +85,4 @@ data "akamai_property_rules_builder" "tf-demo-com_rule_script_management" {
       }
     }
   }
-}
\ No newline at end of file
+}
@@ -28,4 +28,4 @@ data "akamai_property_rules_builder" "tf-demo-com_rule_compressible_objects" {
       }
     }
   }
-}
\ No newline at end of file
+}
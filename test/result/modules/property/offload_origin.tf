@@ -265,4 +265,4 @@ data "akamai_property_rules_builder" "tf-demo-com_rule_uncacheable_objects" {
       }
     }
   }
-}
\ No newline at end of file
+}
@@ -1,6 +1,6 @@
 resource "akamai_edge_hostname" "edge_hostnames" {
-  for_each      = var.edge_hostnames
-    
+  for_each = var.edge_hostnames
+
   provider      = akamai
   contract_id   = var.contract_id
   group_id      = var.group_id
@@ -44,4 +44,4 @@ resource "akamai_property_activation" "tf-demo-com-production" {
   network                        = "PRODUCTION"
   note                           = var.version_notes
   auto_acknowledge_rule_warnings = "true"
-}
\ No newline at end of file
+}
@@ -154,4 +154,4 @@ data "akamai_property_rules_builder" "tf-demo-com_rule_hsts" {
       }
     }
   }
-}
\ No newline at end of file
+}
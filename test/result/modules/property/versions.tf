@@ -1,9 +1,9 @@
 terraform {
   required_providers {
-      akamai = {
-        source  = "akamai/akamai"
-        version = ">= 7.0.0"
-      }
+    akamai = {
+      source  = "akamai/akamai"
+      version = ">= 7.0.0"
     }
-    required_version = ">= 1.0"
+  }
+  required_version = ">= 1.0"
 }
@@ -0,0 +1,61 @@
+import io
+import os
+import sys
+import tarfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from conftest import EXPORT_DIR
+from modules.hcl_parser import evaluate, parse_hcl
+
+
+def _archive(archive_path, replacements):
+    """Archive the test export with some text replaced, like the export of another property."""
+    with tarfile.open(archive_path, "w:gz") as archive:
+        for file_name in sorted(os.listdir(EXPORT_DIR)):
+            with open(os.path.join(EXPORT_DIR, file_name), encoding="utf-8") as f:
+                content = f.read()
+            for old, new in replacements.get(file_name, []):
+                content = content.replace(old, new)
+            data = content.encode("utf-8")
+            info = tarfile.TarInfo(f"export/{file_name}")
+            info.size = len(data)
+            archive.addfile(info, io.BytesIO(data))
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_properties_with_the_same_module_share_it(tmp_path, run_main):
+    batch_dir = tmp_path / "batch"
+    batch_dir.mkdir()
+    _archive(str(batch_dir / "alpha.tar.gz"), {})
+    _archive(str(batch_dir / "beta.tar.gz"), {
+        "rules.tf": [("origin.tf-demo.com", "origin.beta.example.com")],
+        "property.tf": [('"www.tf-demo.com"', '"www.beta.example.com"')],
+    })
+    output_dir = tmp_path / "output"
+    run_main("optimize", "-i", str(batch_dir), "--aggregate", "-o", str(output_dir))
+
+    assert sorted(os.listdir(output_dir / "modules")) == ["property"]
+    root_dir = output_dir / "environments" / "prod"
+    modules = parse_hcl(_read(root_dir / "main.tf")).find_blocks("module")
+    assert [module.labels for module in modules] == [["property"]]
+    assert modules[0].attributes["for_each"].source == "var.property_inputs"
+
+    inputs = evaluate(parse_hcl(_read(root_dir / "terraform.tfvars")).attributes["property_inputs"])
+    assert sorted(inputs) == ["alpha", "beta"]
+    assert inputs["alpha"]["default_origin_hostname"] == "origin.tf-demo.com"
+    assert inputs["beta"]["default_origin_hostname"] == "origin.beta.example.com"
+
+    # The imports of both properties go to the single root
+    imports = parse_hcl(_read(root_dir / "import.tf")).find_blocks("import")
+    assert any('module.property["beta"]' in block.attributes["to"].source for block in imports)
+
+
+def test_aggregate_needs_a_batch(tmp_path, run_main):
+    result = run_main("optimize", "-i", EXPORT_DIR, "--aggregate", "-o", str(tmp_path / "output"), check=False)
+    assert result.returncode != 0
+    assert "--aggregate needs a directory of export archives" in result.stderr
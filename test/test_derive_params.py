@@ -0,0 +1,47 @@
+import json
+import os
+
+from conftest import EXPORT_DIR
+
+
+def _make_dev_export(export_dir):
+    """Turn the copy of the test export into a dev export with another origin port and PMUSER value."""
+    rules_path = os.path.join(export_dir, "rules.tf")
+    with open(rules_path, encoding="utf-8") as f:
+        content = f.read()
+    content = content.replace("http_port                     = 80", "http_port                     = 8080", 1)
+    content = content.replace('"a_home.html"', '"a_dev.html"', 1)
+    with open(rules_path, "w", encoding="utf-8") as f:
+        f.write(content)
+
+
+def test_derived_parameters_reproduce_every_environment(tmp_path, run_main, export_copy):
+    _make_dev_export(export_copy)
+    environments_file = str(tmp_path / "environments.json")
+    result = run_main("derive-params", "-i", f"dev={export_copy}", "-i", f"prod={EXPORT_DIR}", "-o", environments_file)
+    assert "origin.http_port -> default_origin_http_port  dev=8080  prod=80" in result.stdout
+    assert "--parameterize origin.http_port" in result.stdout
+
+    with open(environments_file, encoding="utf-8") as f:
+        environments = json.load(f)["environments"]
+    assert environments["dev"]["variables"] == {"default_origin_http_port": 8080}
+    assert environments["prod"]["variables"] == {"default_origin_http_port": 80}
+    assert environments["dev"]["pmuser"]["PMUSER_A_TEST"] == "a_dev.html"
+
+    # The base export with the derived options must produce the rule tree of every environment
+    output_dir = str(tmp_path / "output")
+    run_main("optimize", "-i", export_copy, "-o", output_dir, "--parameterize", "origin.http_port", "-e", environments_file)
+    for env_name in ("dev", "prod"):
+        result = run_main("verify", "-i", export_copy if env_name == "dev" else EXPORT_DIR, "-o", output_dir, "--environment", env_name)
+        assert "OK:" in result.stdout
+
+
+def test_identical_exports_have_nothing_to_derive(run_main, export_copy):
+    result = run_main("derive-params", "-i", f"dev={export_copy}", "-i", f"prod={EXPORT_DIR}")
+    assert "The rule trees are identical" in result.stdout
+
+
+def test_needs_two_exports(run_main):
+    result = run_main("derive-params", "-i", EXPORT_DIR, check=False)
+    assert result.returncode != 0
+    assert "at least two exports" in result.stderr
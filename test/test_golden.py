@@ -0,0 +1,37 @@
+import os
+import shutil
+
+from conftest import EXPORT_DIR, RESULT_DIR, different_files
+
+
+def test_optimize_reproduces_the_expected_result(tmp_path, run_main):
+    output_dir = str(tmp_path / "output")
+    run_main("optimize", "-i", EXPORT_DIR, "-o", output_dir)
+    assert different_files(output_dir, RESULT_DIR) == []
+
+
+def test_verify_accepts_the_expected_result(run_main):
+    result = run_main("verify", "-i", EXPORT_DIR, "-o", RESULT_DIR)
+    assert "OK:" in result.stdout
+
+
+def test_verify_rejects_a_changed_rule_tree(tmp_path, run_main):
+    output_dir = str(tmp_path / "output")
+    shutil.copytree(RESULT_DIR, output_dir)
+    rule_file = os.path.join(output_dir, "modules", "property", "offload_origin.tf")
+    with open(rule_file, encoding="utf-8") as f:
+        content = f.read()
+    assert 'ttl             = "7d"' in content
+    with open(rule_file, "w", encoding="utf-8") as f:
+        f.write(content.replace('ttl             = "7d"', 'ttl             = "1d"', 1))
+
+    result = run_main("verify", "-i", EXPORT_DIR, "-o", output_dir, check=False)
+    assert result.returncode != 0
+    assert "Verification failed" in result.stderr
+
+
+def test_rerun_changes_nothing(tmp_path, run_main):
+    output_dir = str(tmp_path / "output")
+    run_main("optimize", "-i", EXPORT_DIR, "-o", output_dir)
+    result = run_main("optimize", "-i", EXPORT_DIR, "-o", output_dir)
+    assert "is up to date" in result.stdout
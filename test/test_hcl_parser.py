@@ -0,0 +1,81 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.hcl_parser import HclParseError, HclParser, HclUnresolved, evaluate, parse_hcl, parse_hcl_json
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VARIABLES_TF = """
+# A comment
+variable "origin" {
+  type    = string
+  default = "origin.example.com"
+}
+
+locals {
+  template = "${var.env}-${upper(var.env)}"
+  object   = { a = 1, "b-c" = [true, null] }
+  choice   = var.on ? "yes" : "no"
+  nested   = var.map["k"].items[1]
+  escaped  = "say \\"hi\\" $${literal}"
+}
+"""
+
+SCOPE = {"var": {"env": "prod", "on": False, "map": {"k": {"items": ["a", "b"]}}}}
+
+
+def _expression(text):
+    return HclParser(text).parse_standalone_expression()
+
+
+def test_blocks_labels_and_attributes():
+    root = parse_hcl(VARIABLES_TF)
+    assert [(block.type, block.labels) for block in root.blocks] == [("variable", ["origin"]), ("locals", [])]
+    variable = root.find_blocks("variable")[0]
+    assert evaluate(variable.attributes["default"]) == "origin.example.com"
+    assert variable.attributes["type"].source == "string"
+
+
+def test_expressions_evaluate_in_scope():
+    values = {name: evaluate(expr, SCOPE) for name, expr in parse_hcl(VARIABLES_TF).find_blocks("locals")[0].attributes.items()}
+    assert values == {
+        "template": "prod-PROD",
+        "object": {"a": 1, "b-c": [True, None]},
+        "choice": "no",
+        "nested": "b",
+        "escaped": 'say "hi" ${literal}',
+    }
+
+
+def test_references_out_of_scope_are_unresolved():
+    with pytest.raises(HclUnresolved):
+        evaluate(_expression('"${var.env}"'))
+    with pytest.raises(HclUnresolved):
+        evaluate(_expression("unknown_function(1)"))
+
+
+@pytest.mark.parametrize("text", ['a = ', 'a = "x', 'block {', 'a = [1,'])
+def test_malformed_input_raises_parse_errors(text):
+    with pytest.raises(HclParseError):
+        parse_hcl(text)
+
+
+def test_json_syntax_gives_the_same_tree():
+    root = parse_hcl_json({
+        "variable": {"origin": {"type": "string", "default": "origin.example.com"}},
+        "locals": {"template": "${var.env}-${upper(var.env)}"},
+    })
+    assert [(block.type, block.labels) for block in root.blocks] == [("variable", ["origin"]), ("locals", [])]
+    assert evaluate(root.find_blocks("locals")[0].attributes["template"], SCOPE) == "prod-PROD"
+
+
+def test_parses_the_export_rule_tree():
+    with open(os.path.join(ROOT, "test", "export", "rules.tf"), encoding="utf-8") as f:
+        root = parse_hcl(f.read())
+    data_blocks = root.find_blocks("data")
+    assert len(data_blocks) == 42
+    assert data_blocks[0].labels == ["akamai_property_rules_builder", "tf-demo-com_rule_default"]
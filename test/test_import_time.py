@@ -0,0 +1,36 @@
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Self time of every import of `main.py --help`, interpreter start up included. A run takes
+# about 60 ms, the budget leaves room for slower machines but not for loading the pipeline.
+IMPORT_BUDGET_MS = 250
+
+
+def _import_times():
+    """Run main.py --help with -X importtime and return (module, self time in microseconds) of every import."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "main.py", "--help"],
+        cwd=ROOT, capture_output=True, text=True, check=True,
+    )
+    imports = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_time, _, module = line.split(":", 1)[1].split("|")
+        imports.append((module.strip(), int(self_time)))
+    return imports
+
+
+def test_help_does_not_import_the_pipeline():
+    imports = _import_times()
+    assert imports, "python -X importtime printed no imports"
+    stage_modules = [module for module, _ in imports if module == "modules" or module.startswith("modules.")]
+    assert stage_modules == []
+
+
+def test_help_import_time_is_within_budget():
+    total_ms = sum(self_time for _, self_time in _import_times()) / 1000
+    assert total_ms < IMPORT_BUDGET_MS, f"Imports of main.py --help took {total_ms:.1f} ms"
@@ -0,0 +1,113 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.output_writer import TerraformOutputWriter
+from modules.rules_parameterization import TerraformRulesParser, parse_criteria_filter
+
+TTL_PATH = [["caching", "ttl"]]
+
+# A default rule with an /api/* rule (and a rule nested below it) and a rule for everything but css
+RULES_TF = """
+data "akamai_property_rules_builder" "demo_rule_default" {
+  rules_v2025_01_13 {
+    name = "default"
+    behavior {
+      caching {
+        ttl = "1d"
+      }
+    }
+    children = [
+      data.akamai_property_rules_builder.demo_rule_api.json,
+      data.akamai_property_rules_builder.demo_rule_not_css.json,
+    ]
+  }
+}
+
+data "akamai_property_rules_builder" "demo_rule_api" {
+  rules_v2025_01_13 {
+    name = "API"
+    criterion {
+      path {
+        match_operator = "MATCHES_ONE_OF"
+        values         = ["/api/*", ]
+      }
+    }
+    behavior {
+      caching {
+        ttl = "0s"
+      }
+    }
+    children = [
+      data.akamai_property_rules_builder.demo_rule_api_v2.json,
+    ]
+  }
+}
+
+data "akamai_property_rules_builder" "demo_rule_api_v2" {
+  rules_v2025_01_13 {
+    name = "API v2"
+    behavior {
+      caching {
+        ttl = "5s"
+      }
+    }
+  }
+}
+
+data "akamai_property_rules_builder" "demo_rule_not_css" {
+  rules_v2025_01_13 {
+    name = "Not CSS"
+    criterion {
+      file_extension {
+        match_operator = "IS_NOT_ONE_OF"
+        values         = ["css", ]
+      }
+    }
+    behavior {
+      caching {
+        ttl = "7d"
+      }
+    }
+  }
+}
+"""
+
+
+def _extracted_values(*criteria_filters):
+    """Parameterize caching.ttl with the given filters and return the extracted values."""
+    writer = TerraformOutputWriter("unused")
+    writer.write("rules.tf", RULES_TF)
+    parser = TerraformRulesParser(criteria_filters=[parse_criteria_filter(value) for value in criteria_filters])
+    return sorted(parser.parse_rules_file(TTL_PATH, writer).values())
+
+
+def test_without_filters_every_rule_is_parameterized():
+    assert _extracted_values() == ["0s", "1d", "5s", "7d"]
+
+
+def test_filter_selects_the_matching_rule_and_its_children():
+    assert _extracted_values("path=/api/*") == ["0s", "5s"]
+
+
+def test_filter_on_an_explicit_option():
+    assert _extracted_values("path.values=/api/*") == ["0s", "5s"]
+    assert _extracted_values("path.match_operator=IS_*") == []
+
+
+def test_negative_operator_does_not_match_its_own_values():
+    assert _extracted_values("file_extension=css") == []
+    assert _extracted_values("file_extension=js") == ["7d"]
+
+
+def test_filters_are_combined_with_or():
+    assert _extracted_values("path=/api/*", "file_extension=js") == ["0s", "5s", "7d"]
+
+
+@pytest.mark.parametrize("value", ["hostname", "=*.example.com", "hostname="])
+def test_invalid_filters_are_rejected(value):
+    with pytest.raises(ValueError):
+        parse_criteria_filter(value)
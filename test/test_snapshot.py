@@ -0,0 +1,44 @@
+import os
+
+from conftest import EXPORT_DIR, different_files
+
+
+def test_snapshot_is_reused_with_the_same_result(tmp_path, run_main, export_copy):
+    first = run_main("optimize", "-i", export_copy, "-o", str(tmp_path / "first"), "--snapshot")
+    assert "Saved the parsed export" in first.stdout
+    assert os.path.isfile(os.path.join(export_copy, ".optimizer-snapshot"))
+
+    second = run_main("optimize", "-i", export_copy, "-o", str(tmp_path / "second"), "--snapshot")
+    assert "Loaded the parsed export" in second.stdout
+    assert "Reused" in second.stdout
+    assert different_files(str(tmp_path / "first"), str(tmp_path / "second")) == []
+
+
+def test_snapshot_of_a_changed_export_is_ignored(tmp_path, run_main, export_copy):
+    run_main("optimize", "-i", export_copy, "-o", str(tmp_path / "before"), "--snapshot")
+    rules_path = os.path.join(export_copy, "rules.tf")
+    with open(rules_path, encoding="utf-8") as f:
+        content = f.read()
+    with open(rules_path, "w", encoding="utf-8") as f:
+        f.write(content.replace("origin.tf-demo.com", "origin.changed.example.com"))
+
+    result = run_main("optimize", "-i", export_copy, "-o", str(tmp_path / "after"), "--snapshot")
+    assert "parsing again" in result.stdout
+    with open(tmp_path / "after" / "environments" / "prod" / "terraform.tfvars", encoding="utf-8") as f:
+        assert "origin.changed.example.com" in f.read()
+
+
+def test_snapshot_follows_the_sharding_of_the_run(tmp_path, run_main, export_copy):
+    run_main("optimize", "-i", export_copy, "-o", str(tmp_path / "unsharded"), "--snapshot")
+
+    result = run_main("optimize", "-i", export_copy, "-o", str(tmp_path / "sharded"), "--snapshot", "--shard-pmuser")
+    assert "Loaded the parsed export" in result.stdout
+    run_main("optimize", "-i", EXPORT_DIR, "-o", str(tmp_path / "fresh"), "--shard-pmuser")
+
+    assert different_files(str(tmp_path / "sharded"), str(tmp_path / "fresh")) == []
+    assert os.path.isfile(tmp_path / "sharded" / "environments" / "prod" / "pmuser_variables_a.auto.tfvars")
+
+
+def test_dry_run_does_not_save_the_snapshot(tmp_path, run_main, export_copy):
+    run_main("optimize", "-i", export_copy, "-o", str(tmp_path / "output"), "--snapshot", "--dry-run")
+    assert not os.path.exists(os.path.join(export_copy, ".optimizer-snapshot"))
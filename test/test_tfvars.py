@@ -0,0 +1,78 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from modules.hcl_parser import evaluate, parse_hcl
+from modules.tfvars import HclExpression, TerraformTfvars, TfvarsJsonError, hash_buckets, parse_literal, render_value
+
+# Backslash, quote, interpolation and directive sequences that must survive a round trip
+TRICKY_VALUE = 'C:\\dir "quoted" ${x} %{ if y }'
+
+
+def _tfvars():
+    tfvars = TerraformTfvars()
+    tfvars.set("path", TRICKY_VALUE)
+    tfvars.set("pmuser_variables", {"A_TEST": {"description": TRICKY_VALUE, "value": TRICKY_VALUE}})
+    return tfvars
+
+
+def test_hcl_round_trip():
+    root = parse_hcl(_tfvars().render())
+    assert evaluate(root.attributes["path"]) == TRICKY_VALUE
+    assert evaluate(root.attributes["pmuser_variables"])["A_TEST"]["value"] == TRICKY_VALUE
+
+
+def test_json_round_trip():
+    values = json.loads(_tfvars().render_json())
+    assert values["path"] == TRICKY_VALUE
+    assert values["pmuser_variables"]["A_TEST"]["description"] == TRICKY_VALUE
+
+
+def test_parse_literal_decodes_what_render_value_encodes():
+    assert parse_literal(render_value(TRICKY_VALUE)) == TRICKY_VALUE
+    assert parse_literal(r'"C:\\dir $${x}"') == "C:\\dir ${x}"
+    assert render_value(parse_literal(r'"C:\\dir $${x}"')) == r'"C:\\dir $${x}"'
+
+
+def test_parse_literal_keeps_templates_as_expressions():
+    value = parse_literal('"${var.origin}"')
+    assert render_value(value) == '"${var.origin}"'
+
+
+def test_json_names_the_variable_without_a_literal_value():
+    tfvars = TerraformTfvars()
+    tfvars.set("origin", HclExpression('"${var.origin}"'))
+    with pytest.raises(TfvarsJsonError, match="Variable origin"):
+        tfvars.render_json()
+
+
+def _hostnames(count):
+    return {f"www{index}.example.com": {"cname_from": f"www{index}.example.com"} for index in range(count)}
+
+
+def test_hash_buckets_count_is_a_power_of_two_with_fixed_width_keys():
+    buckets = hash_buckets(_hostnames(1000), 10, "bucket")
+    assert sum(len(bucket) for bucket in buckets.values()) == 1000
+    assert max(int(key[len("bucket_"):]) for key in buckets) <= 128
+    assert all(len(key) == len("bucket_001") for key in buckets)
+    assert len(hash_buckets(_hostnames(10), 10, "bucket")) == 1
+
+
+def test_hash_buckets_keep_keys_past_999_buckets():
+    buckets = hash_buckets(_hostnames(2000), 1, "bucket")
+    # 2048 buckets: the keys below 1000 look the same as with fewer buckets
+    assert any(int(key[len("bucket_"):]) > 999 for key in buckets)
+    assert all(key == f"bucket_{int(key[len('bucket_'):]):03d}" for key in buckets)
+
+
+def test_adding_a_hostname_only_changes_its_own_bucket():
+    hostnames = _hostnames(100)
+    before = hash_buckets(hostnames, 10, "bucket")
+    after = hash_buckets({**hostnames, "new.example.com": {"cname_from": "new.example.com"}}, 10, "bucket")
+    changed = [key for key in after if after[key] != before.get(key)]
+    assert len(changed) == 1
+    assert "new.example.com" in after[changed[0]]